@@ -4,6 +4,7 @@ Django settings for core project.
 import dj_database_url
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'store.instrumentation.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -76,6 +78,55 @@ DATABASES = {
         conn_max_age=600
     )
 }
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # SQLite (dev, test): BEGIN IMMEDIATE cho mỗi transaction -> các request ghi đồng thời xếp
+    # hàng chờ (timeout giây) thay vì lỗi "database is locked" khi nâng khóa đọc lên khóa ghi.
+    # DB test là file (không phải :memory:) để test nhiều luồng dùng chung được.
+    DATABASES['default'].setdefault('OPTIONS', {}).update({'transaction_mode': 'IMMEDIATE', 'timeout': 20})
+    DATABASES['default']['TEST'] = {'NAME': os.path.join(tempfile.gettempdir(), 'bodah_shop_test.sqlite3')}
+
+# --- CẤU HÌNH CACHE ---
+# Mặc định dùng bộ nhớ của tiến trình. Khi chạy nhiều worker nên đổi sang Redis/Memcached
+# để việc xóa cache (thông báo, giỏ hàng...) có hiệu lực trên mọi worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bodah-shop',
+    }
+}
+
+# --- THÔNG BÁO THỜI GIAN THỰC (SSE, chỉ hoạt động khi chạy qua ASGI: core/asgi.py) ---
+# Worker run_jobs chạy ở tiến trình riêng nên cần broker liên tiến trình: PostgreSQL dùng
+# LISTEN/NOTIFY; SQLite (dev, test) chỉ chuyển tin trong 1 tiến trình (xem store/realtime.py).
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    REALTIME_BROKER = 'store.realtime.PostgresBroker'
+else:
+    REALTIME_BROKER = 'store.realtime.InProcessBroker'
+# Alias DB cho thread LISTEN; cần kết nối trực tiếp, không qua PgBouncer chế độ transaction
+REALTIME_LISTEN_DATABASE = 'default'
+# Gửi dòng "ping" khi kết nối không có tin mới (giữ kết nối qua proxy / load balancer)
+REALTIME_HEARTBEAT_SECONDS = 25
+
+# --- ĐO SQL THEO REQUEST ---
+# Ngân sách @query_budget tính cho trường hợp cache còn lạnh (request đầu tiên sau khi khởi động).
+# Vượt ngân sách: chỉ log warning; "manage.py test" luôn ném QueryBudgetExceeded (core/test_runner.py),
+# nơi khác bật bằng QUERY_BUDGET_STRICT=1.
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT') == '1'
+TEST_RUNNER = 'core.test_runner.QueryBudgetTestRunner'
+# WARNING: chỉ ghi khi vượt ngân sách; QUERY_LOG_LEVEL=INFO: thêm 1 dòng JSON mỗi request
+QUERY_LOG_LEVEL = os.environ.get('QUERY_LOG_LEVEL', 'WARNING')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # INFO: 1 dòng JSON mỗi request (số query, thời gian SQL, query lặp, câu chậm nhất)
+        'store.queries': {'handlers': ['console'], 'level': QUERY_LOG_LEVEL, 'propagate': False},
+    },
+}
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -104,6 +155,8 @@ SITE_ID = 1
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
 
+# Email của allauth được gửi qua hàng đợi job nền (users/adapter.py)
+ACCOUNT_ADAPTER = 'users.adapter.AccountAdapter'
 ACCOUNT_LOGIN_METHODS = {'email'}
 ACCOUNT_EMAIL_VERIFICATION = 'none'
 
@@ -137,11 +190,25 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
+
+# --- ẢNH TẢI LÊN (xem store/uploads.py) ---
+# File lớn hơn ngưỡng này được Django ghi theo chunk vào file tạm thay vì giữ trong RAM
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+# Kích thước tối đa của 1 ảnh minh chứng / avatar
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+
+# Kiểu phân trang danh mục sản phẩm: 'offset' (số trang) hoặc 'cursor' (keyset, nhanh với trang sâu)
+CATALOG_PAGINATION = 'offset'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # --- CẤU HÌNH EMAIL (SMTP) ---
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Email được gửi bởi worker "manage.py run_jobs" (store/jobs.py), không gửi trong request.
+# Chạy local không cần SMTP: EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend
+# (ghi file vào EMAIL_FILE_PATH) hoặc ...console.EmailBackend. Khi chạy test Django dùng locmem.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
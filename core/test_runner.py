@@ -0,0 +1,16 @@
+# core/test_runner.py
+# Test runner của project: "manage.py test" luôn chạy với QUERY_BUDGET_STRICT = True, nên một
+# view vượt ngân sách @query_budget làm test thất bại (ngoài test chỉ ghi log warning).
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._strict_budgets = override_settings(QUERY_BUDGET_STRICT=True)
+        self._strict_budgets.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._strict_budgets.disable()
+        super().teardown_test_environment(**kwargs)
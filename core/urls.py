@@ -16,7 +16,7 @@ from users.views import (
     register_view, login_view, logout_view, 
     order_history_view,
     order_detail_view, profile_view, verify_email_confirm,
-    get_notification_detail,
+    get_notification_detail, notification_stream,
     send_verification_email
 )
 from store.admin import my_admin_site
@@ -40,6 +40,7 @@ urlpatterns = [
     path('profile/', profile_view, name='profile'),
     path('verify-email/<uidb64>/<token>/', verify_email_confirm, name='verify_email_confirm'),
     path('notifications/<int:notification_id>/', get_notification_detail, name='notification_detail'),
+    path('notifications/stream/', notification_stream, name='notification_stream'),
     path('accounts/', include('allauth.urls')),
     path('send-verification/', send_verification_email, name='send_verification_email'),
 ]
@@ -25,7 +25,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // 2. Handle Notification Click (Open Modal)
     const notifItems = document.querySelectorAll('.notification-item');
-    notifItems.forEach(item => {
+    notifItems.forEach(bindNotificationItem);
+
+    function bindNotificationItem(item) {
         item.addEventListener('click', function() {
             const apiUrl = this.dataset.url; // Lấy URL chính xác từ data attribute
             
@@ -52,7 +54,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 })
                 .catch(err => console.error('Lỗi tải thông báo:', err));
         });
-    });
+    }
 
     // 3. Close Modal
     if (modalClose) {
@@ -69,6 +71,55 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // 4. Nhận thông báo mới theo thời gian thực (Server-Sent Events), không cần tải lại trang
+    const streamUrl = notifBtn ? notifBtn.dataset.streamUrl : null;
+    if (streamUrl && window.EventSource) {
+        const source = new EventSource(streamUrl);
+
+        source.addEventListener('unread', function(e) {
+            setBadgeCount(JSON.parse(e.data).count);
+        });
+
+        source.addEventListener('notification', function(e) {
+            const data = JSON.parse(e.data);
+            const list = document.querySelector('.notification-list');
+            if (!list) return;
+
+            const empty = list.querySelector('.empty-notif');
+            if (empty) empty.remove();
+
+            const item = document.createElement('div');
+            item.className = 'notification-item unread';
+            item.dataset.id = data.id;
+            item.dataset.url = data.url;
+            [['notif-title', data.title], ['notif-preview', data.message], ['notif-time', data.created_at]].forEach(([cls, text]) => {
+                const div = document.createElement('div');
+                div.className = cls;
+                div.textContent = text;
+                item.appendChild(div);
+            });
+            if (data.url) bindNotificationItem(item);
+            list.prepend(item);
+
+            const badge = document.querySelector('.notif-badge');
+            setBadgeCount((badge ? parseInt(badge.textContent) : 0) + 1);
+        });
+    }
+
+    function setBadgeCount(count) {
+        let badge = document.querySelector('.notif-badge');
+        if (count <= 0) {
+            if (badge) badge.remove();
+            return;
+        }
+        if (!badge && notifBtn) {
+            badge = document.createElement('span');
+            badge.className = 'cart-badge notif-badge';
+            notifBtn.after(badge);
+        }
+        if (badge) badge.textContent = count;
+    }
+
     function updateBadgeCount() {
         const badge = document.querySelector('.notif-badge');
         if (badge) {
@@ -1,12 +1,16 @@
 # store/admin.py
 
 from django.contrib import admin
-from django.db.models import Sum, Count, F
+from django.db.models import Sum
 from django.utils import timezone
 from datetime import timedelta
 from django.urls import path
 from django.shortcuts import render
-from .models import Category, Product, Order, OrderItem, Voucher, Review
+from django.core.cache import cache
+from .models import Category, Product, Order, OrderItem, Voucher, Review, DailySales, DailyProductSales, StockReservation, Job
+from .featured import FEATURED_CACHE_KEY
+from .orders import transition_orders
+from .page_cache import bump_catalog_version
 from django.contrib.admin import AdminSite # Import AdminSite
 from django.contrib.auth.models import User, Group # Import User, Group
 from django.contrib.auth.admin import UserAdmin, GroupAdmin # Import UserAdmin, GroupAdmin
@@ -14,6 +18,9 @@ from django.contrib.sites.models import Site
 from allauth.socialaccount.models import SocialApp, SocialAccount, SocialToken
 from allauth.account.models import EmailAddress
 
+# Các khoảng thời gian (ngày) có thể chọn trên Dashboard
+DASHBOARD_WINDOWS = ['7', '30', '90']
+
 # --- TẠO ADMIN SITE TÙY CHỈNH ---
 class MyAdminSite(AdminSite):
     # Thiết lập tiêu đề cho trang admin
@@ -25,23 +32,25 @@ class MyAdminSite(AdminSite):
     def index(self, request, extra_context=None):
         """Hiển thị trang dashboard thay vì trang index mặc định."""
 
-        # 1. Tính Doanh thu 7 ngày qua (đơn hoàn thành)
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        # Dùng F expressions để tính (total_price - discount_amount) ở mức database
-        revenue_data = Order.objects.filter(
-            status='Hoàn thành',
-            created_at__gte=seven_days_ago
+        # Khoảng thời gian thống kê (?days=7|30|90), mặc định 7 ngày
+        window_days = request.GET.get('days', '7')
+        window_days = int(window_days) if window_days in DASHBOARD_WINDOWS else 7
+        window_start = timezone.localdate() - timedelta(days=window_days)
+
+        # 1. Doanh thu trong khoảng (đơn hoàn thành) - đọc từ bảng tổng hợp theo ngày
+        revenue_data = DailySales.objects.filter(
+            date__gt=window_start
         ).aggregate(
-            total_revenue=Sum(F('total_price') - F('discount_amount')) # <-- SỬA LẠI THÀNH DÒNG NÀY
+            total_revenue=Sum('revenue')
         )
-        revenue_last_7_days = revenue_data['total_revenue'] or 0 # Lấy kết quả
+        revenue = revenue_data['total_revenue'] or 0 # Lấy kết quả
 
         # 2. Đếm số Đơn hàng mới
         new_orders_count = Order.objects.filter(status='Mới').count()
 
-        # 3. Tìm Top 5 Sản phẩm Bán chạy nhất (tính trên đơn hoàn thành)
-        top_products = OrderItem.objects.filter(
-            order__status='Hoàn thành' # Chỉ tính các item thuộc đơn hoàn thành
+        # 3. Top 5 Sản phẩm Bán chạy nhất trong khoảng - đọc từ bảng tổng hợp ngày/sản phẩm
+        top_products = DailyProductSales.objects.filter(
+            date__gt=window_start
         ).values(
             'product__id', 'product__name' # Nhóm theo ID và Tên SP
         ).annotate(
@@ -54,7 +63,9 @@ class MyAdminSite(AdminSite):
         context = {
             **super().each_context(request), # Lấy context mặc định của admin (ví dụ: user)
             'title': self.index_title, # Gửi tiêu đề trang
-            'revenue_last_7_days': revenue_last_7_days,
+            'revenue': revenue,
+            'window_days': window_days,
+            'window_choices': DASHBOARD_WINDOWS,
             'new_orders_count': new_orders_count,
             'top_products': top_products,
             **(extra_context or {}),
@@ -69,34 +80,92 @@ my_admin_site = MyAdminSite(name='myadmin')
 # --- CÁC CLASS MODELADMIN (Giữ nguyên như cũ) ---
 # (Định nghĩa cách hiển thị cho từng model trong admin)
 class VoucherAdmin(admin.ModelAdmin):
-    list_display = ('code', 'discount_amount', 'min_purchase_amount', 'valid_from', 'valid_to', 'is_active')
+    list_display = ('code', 'discount_amount', 'min_purchase_amount', 'valid_from', 'valid_to', 'is_active', 'used_count', 'usage_limit', 'usage_limit_per_user')
+    readonly_fields = ('used_count',)
     list_filter = ('is_active', 'valid_from', 'valid_to')
     search_fields = ('code',)
 
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('name', 'category', 'price', 'stock', 'is_featured')
+    list_editable = ('is_featured',) # Bật/tắt ghim lên trang giới thiệu ngay trên danh sách
+    list_filter = ('is_featured', 'category')
+    search_fields = ('name',)
+    actions = ['pin_featured', 'unpin_featured']
+
+    @admin.action(description="Ghim lên trang giới thiệu")
+    def pin_featured(self, request, queryset):
+        queryset.update(is_featured=True)
+        cache.delete(FEATURED_CACHE_KEY) # update() không phát signal nên xóa cache thủ công
+        bump_catalog_version()
+
+    @admin.action(description="Bỏ ghim khỏi trang giới thiệu")
+    def unpin_featured(self, request, queryset):
+        queryset.update(is_featured=False)
+        cache.delete(FEATURED_CACHE_KEY)
+        bump_catalog_version()
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ('product', 'quantity', 'price_at_purchase')
 
+def make_status_action(name, status):
+    """Admin action chuyển trạng thái hàng loạt (1 UPDATE + 1 job nền tạo thông báo)."""
+    def action(modeladmin, request, queryset):
+        changed = transition_orders(queryset, status)
+        modeladmin.message_user(request, f"Đã chuyển {changed} đơn hàng sang '{status}'.")
+    action.__name__ = name
+    action.short_description = f"Chuyển sang '{status}'"
+    return action
+
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'full_name', 'status', 'total_price', 'discount_amount', 'final_price', 'created_at')
     list_display_links = ('id', 'full_name', 'status')
     list_filter = ('created_at', 'status', 'voucher')
     inlines = [OrderItemInline]
     readonly_fields = ('user', 'full_name', 'email', 'phone', 'address', 'total_price', 'discount_amount', 'voucher', 'created_at')
+    actions = [
+        make_status_action('mark_processing', 'Đang xử lý'),
+        make_status_action('mark_shipping', 'Đang giao'),
+        make_status_action('mark_completed', 'Hoàn thành'),
+        make_status_action('mark_cancelled', 'Đã hủy'),
+    ]
 
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('product', 'user', 'rating', 'created_at')
     list_filter = ('rating', 'created_at')
     search_fields = ('user__username', 'product__name', 'comment')
 
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('reservation_key', 'product', 'quantity', 'expires_at', 'created_at')
+    list_select_related = ('product',)
+    list_filter = ('expires_at',)
+    search_fields = ('reservation_key',)
+    raw_id_fields = ('product',)
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('idempotency_key',)
+    readonly_fields = ('attempts', 'locked_at', 'last_error', 'created_at', 'finished_at')
+    actions = ['retry_jobs']
+
+    @admin.action(description="Chạy lại ngay")
+    def retry_jobs(self, request, queryset):
+        retried = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), finished_at=None
+        )
+        self.message_user(request, f"Đã xếp hàng lại {retried} job.")
+
 # --- ĐĂNG KÝ CÁC MODEL VỚI ADMIN SITE MỚI ---
 # Thay vì dùng admin.site.register, dùng my_admin_site.register
 my_admin_site.register(Category)
-my_admin_site.register(Product)
+my_admin_site.register(Product, ProductAdmin)
 my_admin_site.register(Order, OrderAdmin)
 my_admin_site.register(Voucher, VoucherAdmin)
 my_admin_site.register(Review, ReviewAdmin)
+my_admin_site.register(StockReservation, StockReservationAdmin)
+my_admin_site.register(Job, JobAdmin)
 
 # Đăng ký cả User và Group mặc định của Django
 my_admin_site.register(User, UserAdmin)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        # Đăng ký các signal làm mới cache, đồng bộ index tìm kiếm và các job nền
+        from . import catalog_cache, eligibility, featured, notifications, page_cache, ratings, rollups, search, uploads, vouchers  # noqa: F401
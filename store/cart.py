@@ -0,0 +1,204 @@
+# store/cart.py
+# Dịch vụ giỏ hàng dùng chung cho views, context processor và luồng đăng nhập.
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .catalog_cache import get_many
+from .models import Cart, CartItem, Product
+
+# Thời gian sống của cache tóm tắt giỏ hàng (giây)
+CART_SUMMARY_CACHE_TIMEOUT = 60 * 30
+
+EMPTY_CART_SUMMARY = {'item_count': 0, 'total_quantity': 0}
+
+
+def _summary_key(user_id):
+    return f'cart:summary:{user_id}'
+
+
+def refresh_cart_summary(user_id):
+    """Tính lại số dòng và tổng số lượng trong giỏ DB (1 query) rồi ghi vào cache."""
+    data = CartItem.objects.filter(cart__user_id=user_id).aggregate(
+        item_count=Count('id'),
+        total_quantity=Sum('quantity'),
+    )
+    summary = {
+        'item_count': data['item_count'] or 0,
+        'total_quantity': data['total_quantity'] or 0,
+    }
+    cache.set(_summary_key(user_id), summary, CART_SUMMARY_CACHE_TIMEOUT)
+    return summary
+
+
+def clear_cart_summary(user_id):
+    """Đặt giỏ hàng về rỗng trong cache (sau khi đặt hàng xong)."""
+    cache.set(_summary_key(user_id), EMPTY_CART_SUMMARY, CART_SUMMARY_CACHE_TIMEOUT)
+
+
+def invalidate_cart_summary(user_id):
+    """Xóa tóm tắt giỏ hàng khỏi cache (lần đọc sau sẽ query lại)."""
+    cache.delete(_summary_key(user_id))
+
+
+def get_cart_summary(user_id):
+    """Tóm tắt giỏ hàng cho badge header: đọc từ cache, chỉ query khi cache trống."""
+    summary = cache.get(_summary_key(user_id))
+    if summary is None:
+        summary = refresh_cart_summary(user_id)
+    return summary
+
+
+# --- GỘP GIỎ SESSION VÀO DB KHI ĐĂNG NHẬP ---
+def merge_session_cart(user, session_cart):
+    """
+    Gộp giỏ hàng Session ({'<product_id>': quantity}) vào giỏ DB của user với số query cố định,
+    bất kể giỏ có bao nhiêu dòng:
+    1 query lấy/tạo Cart, 1 in_bulk lấy tồn kho, 1 query các dòng đã có,
+    1 bulk_create dòng mới, 1 bulk_update dòng cũ - tất cả trong 1 transaction.
+
+    Số lượng được cộng dồn với dòng đã có và giới hạn theo tồn kho (đọc từ DB);
+    sản phẩm không còn tồn tại hoặc hết hàng bị bỏ qua.
+    """
+    quantities = {}
+    for product_id, quantity in session_cart.items():
+        try:
+            product_id, quantity = int(product_id), int(quantity)
+        except (TypeError, ValueError):
+            continue
+        if quantity > 0:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        return
+
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        stocks = Product.objects.only('id', 'stock').in_bulk(quantities)
+        existing = {
+            item.product_id: item
+            for item in CartItem.objects.filter(cart=cart, product_id__in=stocks)
+        }
+
+        to_create = []
+        to_update = []
+        for product_id, quantity in quantities.items():
+            product = stocks.get(product_id)
+            if product is None:
+                continue
+            item = existing.get(product_id)
+            if item is None:
+                quantity = min(quantity, product.stock)
+                if quantity > 0:
+                    to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+            else:
+                item.quantity = min(item.quantity + quantity, product.stock)
+                to_update.append(item)
+
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+
+    refresh_cart_summary(user.id)
+
+
+# --- NẠP GIỎ HÀNG (DB hoặc Session) VỚI SỐ QUERY CỐ ĐỊNH ---
+def load_cart_lines(request, clamp_to_stock=True):
+    """
+    Đọc toàn bộ dòng giỏ hàng của request. Tên/ảnh sản phẩm lấy từ snapshot trong cache
+    (catalog_cache.get_many), nên thường chỉ tốn 1 query cho các dòng giỏ hàng.
+
+    Trả về (lines, total_price, adjusted_names):
+    - lines: list dict {'product', 'quantity', 'subtotal'} dùng trực tiếp cho template
+    - total_price: tổng tiền, tính trong cùng 1 vòng lặp
+    - adjusted_names: tên các sản phẩm bị giảm số lượng do vượt tồn kho
+
+    Nếu clamp_to_stock=True (giỏ hàng, checkout), tồn kho và giá được đọc mới từ DB trong cùng
+    query đó; số lượng vượt tồn kho được giảm xuống và ghi lại bằng 1 bulk_update (dòng về 0 bị
+    xóa bằng 1 câu DELETE). Nếu False (chỉ hiển thị), dùng hoàn toàn dữ liệu trong snapshot.
+    """
+    if request.user.is_authenticated:
+        return _load_db_cart_lines(request.user, clamp_to_stock)
+    return _load_session_cart_lines(request, clamp_to_stock)
+
+
+def _load_db_cart_lines(user, clamp_to_stock):
+    lines = []
+    total_price = 0
+    adjusted_names = []
+    to_update = []
+    to_delete = []
+
+    fields = ['id', 'product_id', 'quantity']
+    if clamp_to_stock:
+        fields += ['product__stock', 'product__price']
+    rows = list(CartItem.objects.filter(cart__user=user).order_by('id').values_list(*fields))
+    products = get_many(row[1] for row in rows)
+
+    for row in rows:
+        item_id, product_id, quantity = row[:3]
+        product = products.get(product_id)
+        if product is None:
+            continue
+        if clamp_to_stock:
+            # Không dùng tồn kho/giá trong cache cho quyết định ghi
+            product.stock, product.price = row[3], row[4]
+            if quantity > product.stock:
+                quantity = max(product.stock, 0)
+                adjusted_names.append(product.name)
+                if quantity > 0:
+                    to_update.append(CartItem(id=item_id, quantity=quantity))
+        if quantity <= 0:
+            to_delete.append(item_id)
+            continue
+
+        subtotal = product.price * quantity
+        lines.append({'product': product, 'quantity': quantity, 'subtotal': subtotal})
+        total_price += subtotal
+
+    if to_update:
+        CartItem.objects.bulk_update(to_update, ['quantity'])
+    if to_delete:
+        CartItem.objects.filter(pk__in=to_delete).delete()
+    if to_update or to_delete:
+        refresh_cart_summary(user.id)
+
+    return lines, total_price, adjusted_names
+
+
+def _load_session_cart_lines(request, clamp_to_stock):
+    lines = []
+    total_price = 0
+    adjusted_names = []
+
+    session_cart = request.session.get('cart', {})
+    product_ids = [int(product_id) for product_id in session_cart]
+    products = get_many(product_ids)
+    fresh = {}
+    if clamp_to_stock and product_ids:
+        fresh = {
+            product_id: (stock, price)
+            for product_id, stock, price in Product.objects.filter(pk__in=product_ids).values_list('id', 'stock', 'price')
+        }
+
+    for product_id, quantity in list(session_cart.items()):
+        product = products.get(int(product_id))
+        if product is None or (clamp_to_stock and int(product_id) not in fresh):
+            del session_cart[product_id]
+            continue
+        if clamp_to_stock:
+            product.stock, product.price = fresh[int(product_id)]
+            if quantity > product.stock:
+                quantity = max(product.stock, 0)
+                session_cart[product_id] = quantity
+                adjusted_names.append(product.name)
+        if quantity <= 0:
+            del session_cart[product_id]
+            continue
+
+        subtotal = product.price * quantity
+        lines.append({'product': product, 'quantity': quantity, 'subtotal': subtotal})
+        total_price += subtotal
+
+    request.session['cart'] = session_cart # Lưu lại session cart nếu có thay đổi
+    return lines, total_price, adjusted_names
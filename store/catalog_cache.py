@@ -0,0 +1,88 @@
+# store/catalog_cache.py
+# Cache đọc-xuyên (read-through) cho danh mục và "ảnh chụp" sản phẩm (tên, giá, ảnh, tồn kho)
+# dùng để HIỂN THỊ ở giỏ hàng, checkout, trang thanh toán...
+#
+# Quy tắc: giá trị tồn kho trong snapshot chỉ để hiển thị. Mọi quyết định ghi (thêm vào giỏ,
+# giảm số lượng theo tồn kho, đặt hàng) phải đọc stock/price mới nhất từ DB
+# (xem load_cart_lines(clamp_to_stock=True) và orders.place_order).
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Category, Product
+
+CATEGORY_CACHE_KEY = 'catalog:categories'
+CATEGORY_CACHE_TIMEOUT = 60 * 60
+# Snapshot sản phẩm: TTL ngắn làm lưới an toàn khi signal không chạy (update(), bulk...)
+PRODUCT_SNAPSHOT_TIMEOUT = 60 * 10
+PRODUCT_SNAPSHOT_FIELDS = ('id', 'name', 'price', 'image', 'stock', 'category_id')
+
+
+def _snapshot_key(product_id):
+    return f'catalog:product:{product_id}'
+
+
+# --- DANH MỤC ---
+def get_categories():
+    """Danh sách danh mục (đã sắp xếp theo id), đọc từ cache."""
+    categories = cache.get(CATEGORY_CACHE_KEY)
+    if categories is None:
+        categories = list(Category.objects.order_by('id'))
+        cache.set(CATEGORY_CACHE_KEY, categories, CATEGORY_CACHE_TIMEOUT)
+    return categories
+
+
+# --- SNAPSHOT SẢN PHẨM ---
+def get_many(product_ids):
+    """
+    Trả về dict {id: Product} (chỉ nạp PRODUCT_SNAPSHOT_FIELDS) cho các id cần tìm:
+    1 lần cache.get_many, sản phẩm còn thiếu được nạp bằng 1 query rồi ghi lại cache.
+    Id không tồn tại bị bỏ qua.
+    """
+    product_ids = {int(product_id) for product_id in product_ids}
+    if not product_ids:
+        return {}
+
+    keys = {_snapshot_key(product_id): product_id for product_id in product_ids}
+    snapshots = {keys[key]: product for key, product in cache.get_many(keys).items()}
+
+    missing = product_ids - snapshots.keys()
+    if missing:
+        loaded = Product.objects.only(*PRODUCT_SNAPSHOT_FIELDS).in_bulk(missing)
+        cache.set_many(
+            {_snapshot_key(product_id): product for product_id, product in loaded.items()},
+            PRODUCT_SNAPSHOT_TIMEOUT,
+        )
+        snapshots.update(loaded)
+    return snapshots
+
+
+def get_product(product_id):
+    """Snapshot của 1 sản phẩm, hoặc None nếu không tồn tại."""
+    return get_many([product_id]).get(int(product_id))
+
+
+def invalidate_products(product_ids):
+    cache.delete_many([_snapshot_key(product_id) for product_id in product_ids])
+
+
+def invalidate_products_on_commit(product_ids):
+    """Xóa snapshot sau khi transaction hiện tại commit (vd. sau khi trừ kho)."""
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: invalidate_products(product_ids))
+
+
+# --- VÔ HIỆU HÓA ---
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories(sender, raw=False, **kwargs):
+    if not raw:
+        cache.delete(CATEGORY_CACHE_KEY)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_snapshot(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_products([instance.pk])
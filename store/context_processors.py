@@ -1,29 +1,25 @@
-from .models import Cart, Notification
+from .cart import get_cart_summary
+from .notifications import get_header_feed, get_unread_count
 
 def cart_count(request):
     """
     Context processor to add cart item count to every template context
+    (read from the per-user cart summary cache, no DB round-trip when warm)
     """
     cart_items_count = 0
     
     if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            cart_items_count = cart.cart_items.count()
-        except Cart.DoesNotExist:
-            cart_items_count = 0
+        cart_items_count = get_cart_summary(request.user.id)['item_count']
     
     return {'cart_count': cart_items_count}
 
 def notifications(request):
     if request.user.is_authenticated:
-        # Lấy tất cả thông báo, sắp xếp mới nhất
-        user_notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-        # Đếm số lượng chưa đọc
-        unread_count = user_notifications.filter(is_read=False).count()
+        # Chỉ lấy các thông báo mới nhất cho header (đã cache theo user)
+        # Số lượng chưa đọc lấy từ bộ đếm cache, không query mỗi lần render
         return {
-            'notifications': user_notifications,
-            'notification_unread_count': unread_count
+            'notifications': get_header_feed(request.user.id),
+            'notification_unread_count': get_unread_count(request.user.id)
         }
     return {
         'notifications': [],
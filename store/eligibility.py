@@ -0,0 +1,53 @@
+# store/eligibility.py
+# Điều kiện đánh giá của từng user: tập sản phẩm đã mua (đơn 'Hoàn thành') và tập sản phẩm
+# đã đánh giá. Nạp 1 lần rồi cache, các view chỉ cần tra cứu trong set.
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import COMPLETED_STATUS, Order, OrderItem, Review
+
+ELIGIBILITY_CACHE_TIMEOUT = 60 * 30
+
+
+def _eligibility_key(user_id):
+    return f'review_eligibility:{user_id}'
+
+
+def get_review_eligibility(user_id):
+    """
+    Trả về dict {'purchased': frozenset(product_id), 'reviewed': frozenset(product_id)}.
+    - purchased: sản phẩm nằm trong ít nhất một đơn 'Hoàn thành' của user
+    - reviewed: sản phẩm user đã đánh giá
+    """
+    key = _eligibility_key(user_id)
+    eligibility = cache.get(key)
+    if eligibility is None:
+        purchased = OrderItem.objects.filter(
+            order__user_id=user_id, order__status=COMPLETED_STATUS
+        ).values_list('product_id', flat=True).distinct()
+        reviewed = Review.objects.filter(user_id=user_id).values_list('product_id', flat=True)
+        eligibility = {
+            'purchased': frozenset(purchased),
+            'reviewed': frozenset(reviewed),
+        }
+        cache.set(key, eligibility, ELIGIBILITY_CACHE_TIMEOUT)
+    return eligibility
+
+
+def invalidate_review_eligibility(*user_ids):
+    cache.delete_many([_eligibility_key(user_id) for user_id in user_ids if user_id])
+
+
+# --- SIGNALS ---
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    # Trạng thái đơn thay đổi (vd. sang 'Hoàn thành') -> tập đã mua thay đổi
+    invalidate_review_eligibility(instance.user_id)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    invalidate_review_eligibility(instance.user_id)
@@ -0,0 +1,55 @@
+# store/featured.py
+# Kho sản phẩm nổi bật cho trang giới thiệu: dựng sẵn và lưu cache, mỗi request chỉ
+# lấy mẫu ngẫu nhiên trong bộ nhớ (không ORDER BY RANDOM() trên cả bảng Product).
+import random
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product
+
+FEATURED_CACHE_KEY = 'featured_products:pool'
+# Kho được dựng lại ít nhất mỗi giờ (hoặc ngay khi sản phẩm thay đổi)
+FEATURED_CACHE_TIMEOUT = 60 * 60
+# Số sản phẩm mới nhất (còn hàng) đưa vào kho để lấy mẫu
+FEATURED_POOL_SIZE = 60
+# Số sản phẩm hiển thị trên trang giới thiệu
+FEATURED_DISPLAY_COUNT = 5
+
+_FEATURED_FIELDS = ('id', 'name', 'price', 'image')
+
+
+def build_featured_pool():
+    """Dựng kho: sản phẩm được ghim (luôn hiển thị) + các sản phẩm mới còn hàng."""
+    pinned = list(
+        Product.objects.filter(is_featured=True).only(*_FEATURED_FIELDS).order_by('-id')
+    )
+    pool = list(
+        Product.objects.filter(is_featured=False, stock__gt=0)
+        .only(*_FEATURED_FIELDS).order_by('-id')[:FEATURED_POOL_SIZE]
+    )
+    data = {'pinned': pinned, 'pool': pool}
+    cache.set(FEATURED_CACHE_KEY, data, FEATURED_CACHE_TIMEOUT)
+    return data
+
+
+def get_featured_products(count=FEATURED_DISPLAY_COUNT):
+    """Lấy `count` sản phẩm nổi bật: ưu tiên sản phẩm ghim, phần còn lại chọn ngẫu nhiên."""
+    data = cache.get(FEATURED_CACHE_KEY)
+    if data is None:
+        data = build_featured_pool()
+
+    featured = data['pinned'][:count]
+    remaining = count - len(featured)
+    if remaining > 0:
+        featured += random.sample(data['pool'], min(remaining, len(data['pool'])))
+    return featured
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_featured_pool(sender, raw=False, **kwargs):
+    # Sản phẩm thay đổi -> kho sẽ được dựng lại ở request kế tiếp
+    if not raw:
+        cache.delete(FEATURED_CACHE_KEY)
@@ -0,0 +1,137 @@
+# store/instrumentation.py
+# Đo SQL theo từng request: số query, tổng thời gian SQL, các query lặp lại (dấu hiệu N+1)
+# và câu chậm nhất. Kết quả được:
+# - ghi log có cấu trúc (JSON) vào logger "store.queries",
+# - gửi về trình duyệt qua header Server-Timing (xem trong tab Network của DevTools),
+# - so với ngân sách khai báo bằng @query_budget(n) trên view: vượt ngân sách thì log
+#   warning, hoặc ném QueryBudgetExceeded khi settings.QUERY_BUDGET_STRICT = True
+#   (luôn bật khi chạy "manage.py test", xem core/test_runner.py).
+import json
+import logging
+import re
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('store.queries')
+
+# Số fingerprint lặp lại nhiều nhất được ghi vào log
+TOP_DUPLICATES = 5
+# Độ dài tối đa của câu SQL khi ghi log
+MAX_SQL_LENGTH = 500
+
+_IN_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    """View chạy nhiều query hơn ngân sách đã khai báo bằng @query_budget."""
+
+
+def query_budget(max_queries):
+    """
+    Khai báo số query tối đa của một view (tính cả context processor và template):
+
+        @query_budget(8)
+        def cart_view(request): ...
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            return view_func(*args, **kwargs)
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+def fingerprint(sql):
+    """Chuẩn hóa câu SQL để gom các query cùng dạng: IN (%s, %s, ...) -> IN (...), bỏ hằng số."""
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    sql = _LITERAL_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """Execute wrapper (connection.execute_wrapper) ghi lại mọi câu SQL của một request."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_sql = None
+        self.fingerprints = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.total_ms += elapsed_ms
+            if elapsed_ms > self.slowest_ms:
+                self.slowest_ms = elapsed_ms
+                self.slowest_sql = sql
+            key = fingerprint(sql)
+            self.fingerprints[key] = self.fingerprints.get(key, 0) + 1
+
+    def duplicates(self):
+        """Các dạng query chạy nhiều hơn 1 lần, nhiều nhất trước."""
+        repeated = [(sql, count) for sql, count in self.fingerprints.items() if count > 1]
+        return sorted(repeated, key=lambda item: item[1], reverse=True)
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request._query_budget = None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        response['Server-Timing'] = (
+            f'db;dur={recorder.total_ms:.2f};desc="{recorder.count} queries", '
+            f'app;dur={total_ms - recorder.total_ms:.2f}'
+        )
+        self.report(request, response, recorder, total_ms)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = getattr(view_func, 'query_budget', None)
+
+    def report(self, request, response, recorder, total_ms):
+        budget = request._query_budget
+        duplicates = recorder.duplicates()
+        payload = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'budget': budget,
+            'db_ms': round(recorder.total_ms, 2),
+            'total_ms': round(total_ms, 2),
+            'duplicates': [
+                {'sql': sql[:MAX_SQL_LENGTH], 'count': count} for sql, count in duplicates[:TOP_DUPLICATES]
+            ],
+            'slowest': {
+                'sql': (recorder.slowest_sql or '')[:MAX_SQL_LENGTH],
+                'ms': round(recorder.slowest_ms, 2),
+            },
+        }
+        logger.info(json.dumps(payload, ensure_ascii=False))
+
+        if budget is not None and recorder.count > budget:
+            message = f'{request.method} {request.path}: {recorder.count} queries > ngân sách {budget}'
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -0,0 +1,146 @@
+# store/jobs.py
+# Hàng đợi job nền lưu trong DB (bảng Job), chạy bằng "manage.py run_jobs".
+#
+# - enqueue() chỉ ghi 1 dòng Job, trong cùng transaction với request: đơn hàng bị rollback
+#   thì job gửi thông báo của đơn đó cũng biến mất, không cần on_commit.
+# - idempotency_key là UNIQUE: xếp hàng lại cùng một khóa không tạo job mới.
+# - Job lỗi được thử lại với thời gian chờ tăng dần (backoff lũy thừa), quá max_attempts thì
+#   chuyển 'failed' và giữ last_error để xem trong admin.
+# - Worker nhận job bằng UPDATE có điều kiện, nên 2 worker không nhận cùng một job cùng lúc.
+#   Nhưng job 'running' quá JOB_LOCK_TIMEOUT (worker chết, hoặc chỉ chạy chậm) được nhận lại,
+#   và job lỗi sau khi đã gửi email/ghi dữ liệu sẽ được thử lại: job chạy ÍT NHẤT 1 lần, có thể
+#   nhiều hơn. Hàm xử lý phải idempotent (vd. Notification.idempotency_key).
+import logging
+import traceback
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Chờ trước lần thử lại thứ n: JOB_BACKOFF_BASE * 2^(n-1), tối đa JOB_BACKOFF_MAX
+JOB_BACKOFF_BASE = timedelta(seconds=30)
+JOB_BACKOFF_MAX = timedelta(hours=1)
+# Job đang chạy lâu hơn mức này coi như worker đã chết
+JOB_LOCK_TIMEOUT = timedelta(minutes=10)
+
+_registry = {}
+
+
+class UnknownJobError(Exception):
+    """Tên job chưa được đăng ký bằng @job(...)."""
+
+
+def job(name):
+    """
+    Đăng ký hàm xử lý cho job tên name. Hàm nhận payload dưới dạng keyword arguments:
+
+        @job('send_email')
+        def send_email(subject, body, to): ...
+    """
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, idempotency_key=None, delay=None, max_attempts=5):
+    """
+    Xếp hàng job (payload phải tuần tự hóa được sang JSON). Nếu đã có job cùng
+    idempotency_key (kể cả đã chạy xong) thì không làm gì.
+    """
+    if name not in _registry:
+        raise UnknownJobError(name)
+    job_row = Job(
+        name=name,
+        payload=payload or {},
+        idempotency_key=idempotency_key,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + (delay or timedelta(0)),
+    )
+    # ignore_conflicts: trùng khóa không ném IntegrityError (và không làm hỏng transaction đang mở)
+    Job.objects.bulk_create([job_row], ignore_conflicts=idempotency_key is not None)
+
+
+def backoff(attempts):
+    return min(JOB_BACKOFF_BASE * (2 ** (attempts - 1)), JOB_BACKOFF_MAX)
+
+
+def _claimable(now):
+    # Job đến hạn, hoặc job 'running' của worker đã chết (quá hạn khóa)
+    return Q(status='queued', run_at__lte=now) | Q(status='running', locked_at__lt=now - JOB_LOCK_TIMEOUT)
+
+
+def claim_next_job():
+    """Nhận 1 job (đánh dấu 'running'); None nếu không còn job nào đến hạn."""
+    while True:
+        now = timezone.now()
+        candidate = (
+            Job.objects.filter(_claimable(now))
+            .order_by('run_at', 'pk')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if candidate is None:
+            return None
+        # Chỉ 1 worker cập nhật được dòng này; worker khác nhận 0 dòng và thử job kế tiếp
+        if Job.objects.filter(_claimable(now), pk=candidate).update(status='running', locked_at=now):
+            return Job.objects.get(pk=candidate)
+
+
+def run_job(job_row):
+    """Chạy 1 job đã nhận; ghi kết quả / lịch thử lại. Trả về True nếu thành công."""
+    handler = _registry.get(job_row.name)
+    job_row.attempts += 1
+    try:
+        if handler is None:
+            raise UnknownJobError(job_row.name)
+        with transaction.atomic():
+            handler(**job_row.payload)
+    except Exception:
+        job_row.last_error = traceback.format_exc()
+        if job_row.attempts >= job_row.max_attempts:
+            job_row.status = 'failed'
+            job_row.finished_at = timezone.now()
+            logger.error('Job %s thất bại sau %s lần: %s', job_row, job_row.attempts, job_row.last_error)
+        else:
+            job_row.status = 'queued'
+            job_row.run_at = timezone.now() + backoff(job_row.attempts)
+            logger.warning('Job %s lỗi, thử lại lúc %s', job_row, job_row.run_at)
+        job_row.locked_at = None
+        job_row.save(update_fields=['status', 'attempts', 'run_at', 'locked_at', 'last_error', 'finished_at'])
+        return False
+
+    job_row.status = 'done'
+    job_row.locked_at = None
+    job_row.finished_at = timezone.now()
+    job_row.save(update_fields=['status', 'attempts', 'locked_at', 'finished_at'])
+    return True
+
+
+def run_pending_jobs(limit=None):
+    """Chạy các job đến hạn cho tới khi hàng đợi trống (hoặc đủ limit job). Trả về (thành công, lỗi)."""
+    succeeded = failed = 0
+    while limit is None or succeeded + failed < limit:
+        job_row = claim_next_job()
+        if job_row is None:
+            break
+        if run_job(job_row):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
+
+
+# --- CÁC JOB DÙNG CHUNG ---
+@job('send_email')
+def send_email(subject, body, to, from_email=None, html=None):
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html:
+        message.attach_alternative(html, 'text/html')
+    message.send()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from store.models import DailySales, DailyProductSales
+from store.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại bảng tổng hợp doanh thu theo ngày/sản phẩm từ các đơn hoàn thành'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Đang dựng lại bảng tổng hợp doanh thu...')
+        rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f'Xong: {DailySales.objects.count()} ngày, {DailyProductSales.objects.count()} dòng ngày/sản phẩm.'
+        ))
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+# Benchmark theo request cho các trang của shop (Django test client, chạy trên dữ liệu mẫu):
+#   python manage.py seed_data --products 200000 --users 50000 --orders 1000000 ... --seed 42
+#   python manage.py benchmark_requests --output before.json
+#   ... sửa code ...
+#   python manage.py benchmark_requests --baseline before.json --output after.json
+# Mỗi route ghi lại p50/p95 (ms), số query SQL và bộ nhớ cấp phát đỉnh (KB). Số query là mức
+# cao nhất giữa lượt đo cache lạnh (reset_read_caches() trước đó) và các lượt đo cache nóng. Lệnh thất
+# bại (exit code 1) khi một route vượt ngân sách query hoặc chậm/nhiều query hơn baseline.
+#
+# Mọi request được chạy trong 1 savepoint và rollback ngay sau đó, nên checkout POST... không
+# làm thay đổi dữ liệu và các lần đo đều trên cùng một trạng thái.
+#
+# --concurrent-buyers N: thêm kịch bản N khách vãng lai cùng checkout COD 1 sản phẩm "hot"
+# (mỗi khách 1 luồng, 1 kết nối DB), ghi lại số đơn/giây và kiểm tra không bán vượt tồn kho.
+# Kịch bản này phải commit thật (các luồng không thấy dữ liệu chưa commit của nhau); sản phẩm,
+# đơn hàng và session tạo ra được xóa khi đo xong. Chỉ chạy trên DB thử.
+import json
+import math
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import resolve, reverse
+from django.utils import timezone
+from store.cart import invalidate_cart_summary
+from store.catalog_cache import CATEGORY_CACHE_KEY, invalidate_products
+from store.eligibility import invalidate_review_eligibility
+from store.featured import FEATURED_CACHE_KEY
+from store.management.commands.seed_data import SEED_PASSWORD
+from store.models import Cart, Category, Order, Product
+from store.notifications import invalidate_notification_cache
+from store.page_cache import bump_catalog_version
+
+# Ngân sách query lấy từ @query_budget của view (một nguồn duy nhất, xem store/instrumentation.py).
+# Chỉ route có view không khai báo ngân sách (trang admin của Django) mới cần giá trị ở đây.
+FALLBACK_QUERY_BUDGETS = {
+    'admin_dashboard': 11,
+}
+# Mức chậm hơn baseline (%) được chấp nhận cho p95
+DEFAULT_MAX_REGRESSION = 25.0
+# Bỏ qua sai lệch tuyệt đối nhỏ hơn mức này (ms) khi so baseline, tránh báo động giả ở route rất nhanh
+NOISE_FLOOR_MS = 2.0
+BENCHMARK_ADMIN_USERNAME = 'benchmark_admin'
+# Số dòng giỏ hàng khách vãng lai khi đo gộp giỏ lúc đăng nhập
+MERGE_CART_LINES = 50
+HOT_SKU_NAME = 'Benchmark hot SKU'
+
+
+def _percentile(values, percent):
+    """Percentile theo nearest-rank (đủ chính xác cho vài chục mẫu)."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = 'Đo p50/p95, số query và bộ nhớ của các trang chính trên dữ liệu mẫu; báo lỗi khi bị chậm đi'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Số lần đo mỗi route')
+        parser.add_argument('--warmup', type=int, default=2, help='Số lần chạy làm nóng (không tính)')
+        parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+        parser.add_argument('--baseline', help='File JSON của lần chạy trước để so sánh')
+        parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION,
+                            help='Phần trăm p95 được phép chậm hơn baseline')
+        parser.add_argument('--route', action='append', dest='routes',
+                            help='Chỉ chạy route này (có thể lặp lại)')
+        parser.add_argument('--concurrent-buyers', type=int, default=0,
+                            help='Số khách cùng checkout 1 sản phẩm hot (0 = không chạy kịch bản này)')
+        parser.add_argument('--hot-stock', type=int,
+                            help='Tồn kho ban đầu của sản phẩm hot (mặc định: một nửa số khách)')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations phải lớn hơn hoặc bằng 1.')
+        setup_test_environment() # ALLOWED_HOSTS cho test client, email gửi vào bộ nhớ
+        try:
+            with transaction.atomic():
+                results = self.run_benchmarks(options)
+                # Không giữ lại bất kỳ thay đổi nào (user admin tạm, đơn hàng...)
+                transaction.set_rollback(True)
+            concurrent = None
+            if options['concurrent_buyers'] > 0:
+                buyers = options['concurrent_buyers']
+                concurrent = self.run_concurrent_checkout(buyers, options['hot_stock'] or max(1, buyers // 2))
+        finally:
+            teardown_test_environment()
+
+        failures = self.check_thresholds(results, options)
+        if concurrent is not None:
+            failures += self.check_concurrent_checkout(concurrent)
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'vendor': connection.vendor,
+            'iterations': options['iterations'],
+            'routes': results,
+            'concurrent_checkout': concurrent,
+            'failures': failures,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Đã ghi kết quả vào {options['output']}"))
+
+        if failures:
+            for failure in failures:
+                self.stderr.write(self.style.ERROR(failure))
+            raise CommandError(f'{len(failures)} route vượt ngưỡng.')
+        self.stdout.write(self.style.SUCCESS('Tất cả route đều trong ngưỡng.'))
+
+    # --- Chuẩn bị dữ liệu ---
+    def pick_fixtures(self):
+        """Chọn user có giỏ hàng và đơn hàng từ dữ liệu seed_data."""
+        cart = (
+            Cart.objects.filter(cart_items__isnull=False, user__order__isnull=False)
+            .select_related('user').order_by('id').first()
+        )
+        if cart is None:
+            raise CommandError('Không có dữ liệu mẫu. Chạy "python manage.py seed_data --users ... --orders ... --carts ..." trước.')
+        customer = cart.user
+        order = Order.objects.filter(user=customer).order_by('-created_at').first()
+        product = cart.cart_items.order_by('id').first().product
+        category = Category.objects.order_by('id').first()
+
+        admin, _ = User.objects.get_or_create(
+            username=BENCHMARK_ADMIN_USERNAME, defaults={'is_staff': True, 'is_superuser': True},
+        )
+        return customer, admin, order, product, category
+
+    def build_routes(self):
+        customer, admin, order, product, category = self.pick_fixtures()
+        checkout_form = {
+            'action': 'place_order', 'full_name': 'Benchmark', 'email': 'benchmark@example.com',
+            'phone': '0900000000', 'address': '1 Benchmark',
+        }
+        cursor_page = f'/home/?pagination=cursor&category={category.id}'
+        # Giỏ khách vãng lai: các sản phẩm đã có trong giỏ DB (cộng dồn) + sản phẩm mới
+        cart_product_ids = list(customer.cart.cart_items.values_list('product_id', flat=True))
+        new_product_ids = Product.objects.exclude(pk__in=cart_product_ids).order_by('id').values_list('id', flat=True)
+        merge_cart = {
+            str(product_id): 1
+            for product_id in (cart_product_ids + list(new_product_ids[:MERGE_CART_LINES]))[:MERGE_CART_LINES]
+        }
+        login_form = {'username': customer.username, 'password': SEED_PASSWORD}
+        # Sản phẩm có snapshot cache được đọc trong các route (giỏ hàng, gộp giỏ, chi tiết)
+        self.cached_product_ids = {product.id, *(int(product_id) for product_id in merge_cart)}
+
+        # (tên, user đăng nhập, method, url, dữ liệu POST)
+        return [
+            # Khách vãng lai được phục vụ từ cache trang (0 query): đo các biến thể trang chủ
+            # bằng user đăng nhập để đo đường đi thật tới DB, và giữ 1 route đo lượt trúng cache
+            ('home', customer, 'get', '/home/', None),
+            ('home_search', customer, 'get', '/home/?q=giay', None),
+            ('home_category', customer, 'get', f'/home/?category={category.id}', None),
+            ('home_price_asc', customer, 'get', '/home/?sort=price_asc', None),
+            ('home_price_desc', customer, 'get', '/home/?sort=price_desc', None),
+            ('home_rating', customer, 'get', '/home/?sort=rating', None),
+            ('home_search_category_sort', customer, 'get', f'/home/?q=mau&category={category.id}&sort=price_asc', None),
+            ('home_deep_page', customer, 'get', '/home/?page=500', None),
+            ('home_cursor', customer, 'get', cursor_page, None),
+            ('home_anonymous_cached', None, 'get', f'/home/?category={category.id}&sort=price_desc', None),
+            ('product_detail', customer, 'get', f'/product/{product.id}/', None),
+            ('cart_view', customer, 'get', '/cart/', None),
+            ('checkout_get', customer, 'get', '/checkout/', None),
+            ('checkout_post', customer, 'post', '/checkout/', {**checkout_form, 'payment_method': 'cod'}),
+            ('payment_info', customer, 'payment_info', None, {**checkout_form, 'payment_method': 'qr'}),
+            ('order_history', customer, 'get', '/order-history/', None),
+            ('order_detail', customer, 'get', f'/order-detail/{order.id}/', None),
+            ('admin_dashboard', admin, 'get', '/admin/?days=30', None),
+            ('login_merge_cart_50', None, 'login_merge', '/login/', {'cart': merge_cart, 'form': login_form}),
+        ]
+
+    # --- Đo ---
+    def measure_once(self, client, method, url, data, track_memory=False):
+        """Chạy 1 request trong savepoint (rollback sau đó). Trả về (ms, số query, KB, status)."""
+        with transaction.atomic():
+            if method == 'payment_info':
+                # Bước QR của checkout tạo pending_order trong session (không tính vào số đo)
+                response = client.post('/checkout/', data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                method, url, data = 'get', response.json()['redirect_url'], None
+            elif method == 'login_merge':
+                # Phiên khách mới với giỏ hàng session, sau đó đăng nhập (gộp giỏ vào DB)
+                client.cookies.clear()
+                session = client.session
+                session['cart'] = data['cart']
+                session.save()
+                method, data = 'post', data['form']
+            if track_memory:
+                tracemalloc.reset_peak()
+                baseline_memory = tracemalloc.get_traced_memory()[0]
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.post(url, data) if method == 'post' else client.get(url)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+            peak_kb = (tracemalloc.get_traced_memory()[1] - baseline_memory) / 1024 if track_memory else None
+            transaction.set_rollback(True)
+        return elapsed_ms, len(queries), peak_kb, response.status_code
+
+    def run_benchmarks(self, options):
+        results = {}
+        for name, user, method, url, data in self.build_routes():
+            if options['routes'] and name not in options['routes']:
+                continue
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+
+            # Lượt cache lạnh (như request đầu tiên sau khi khởi động): không tính vào thời gian
+            self.reset_read_caches(user)
+            _, cold_queries, _, _ = self.measure_once(client, method, url, data)
+            for _ in range(options['warmup']):
+                self.measure_once(client, method, url, data)
+            timings, query_counts = [], []
+            for _ in range(options['iterations']):
+                elapsed_ms, query_count, _, status = self.measure_once(client, method, url, data)
+                timings.append(elapsed_ms)
+                query_counts.append(query_count)
+
+            # Đo bộ nhớ ở 1 lượt riêng: tracemalloc làm chậm đáng kể, không trộn vào số đo thời gian
+            tracemalloc.start()
+            try:
+                _, _, peak_kb, _ = self.measure_once(client, method, url, data, track_memory=True)
+            finally:
+                tracemalloc.stop()
+
+            results[name] = {
+                'url': url or '/payment-info/<order_code>/',
+                'method': {'payment_info': 'get', 'login_merge': 'post'}.get(method, method),
+                'status': status,
+                'p50_ms': round(_percentile(timings, 50), 3),
+                'p95_ms': round(_percentile(timings, 95), 3),
+                'queries': max(cold_queries, *query_counts),
+                'cold_queries': cold_queries,
+                'query_budget': self.query_budget(name, url),
+                'peak_memory_kb': round(peak_kb, 1),
+            }
+            row = results[name]
+            self.stdout.write(
+                f"{name:<28} {row['status']}  p50 {row['p50_ms']:>8.2f} ms  p95 {row['p95_ms']:>8.2f} ms  "
+                f"{row['queries']:>3} queries (lạnh {row['cold_queries']:>3})  {row['peak_memory_kb']:>9.1f} KB"
+            )
+        return results
+
+    def reset_read_caches(self, user):
+        """
+        Làm lạnh các cache mà route đọc. Không dùng cache.clear(): cache mặc định còn giữ dữ liệu
+        khác (phiên bản voucher, ...) của site đang chạy trên cùng DB. Trang và fragment đã cache
+        hết hiệu lực nhờ đổi catalog version; bộ đếm gần đúng (approx_count) tự hết hạn.
+        """
+        bump_catalog_version()
+        cache.delete_many([CATEGORY_CACHE_KEY, FEATURED_CACHE_KEY])
+        invalidate_products(self.cached_product_ids)
+        if user is not None:
+            invalidate_cart_summary(user.pk)
+            invalidate_notification_cache(user.pk)
+            invalidate_review_eligibility(user.pk)
+
+    def run_concurrent_checkout(self, buyers, stock):
+        """buyers khách vãng lai cùng lúc checkout COD 1 đơn vị của 1 sản phẩm có stock đơn vị."""
+        category = Category.objects.order_by('id').first()
+        if category is None:
+            raise CommandError('Không có dữ liệu mẫu. Chạy "python manage.py seed_data" trước.')
+        product = Product.objects.create(name=HOT_SKU_NAME, price=100000, stock=stock, category=category)
+        form = {
+            'action': 'place_order', 'full_name': 'Benchmark', 'email': 'benchmark@example.com',
+            'phone': '0900000000', 'address': '1 Benchmark', 'payment_method': 'cod',
+        }
+        started = []
+        barrier = threading.Barrier(buyers, action=lambda: started.append(time.perf_counter()))
+        lock = threading.Lock()
+        outcome = {'success': 0, 'rejected': 0, 'errors': []}
+        session_keys = []
+
+        def buyer():
+            try:
+                client = Client()
+                session = client.session
+                session['cart'] = {str(product.pk): 1}
+                session.save()
+                with lock:
+                    session_keys.append(session.session_key)
+                barrier.wait()
+                response = client.post('/checkout/', form, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                # 302: giỏ đã trống khi đọc (tồn kho về 0 nên dòng giỏ bị bỏ) - cũng là hết hàng
+                status = response.json()['status'] if response.status_code == 200 else 'rejected'
+                message = response.json().get('message', '') if response.status_code == 200 else ''
+                with lock:
+                    if status == 'success':
+                        outcome['success'] += 1
+                    elif response.status_code != 200 or 'hết hàng' in message:
+                        outcome['rejected'] += 1
+                    else:
+                        outcome['errors'].append(message)
+            except Exception as exc:
+                with lock:
+                    outcome['errors'].append(repr(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(buyers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started[0] if started else 0
+
+        try:
+            product.refresh_from_db()
+            orders = Order.objects.filter(items__product=product).distinct().count()
+            row = {
+                'buyers': buyers,
+                'initial_stock': stock,
+                'orders': orders,
+                'rejected': outcome['rejected'],
+                'final_stock': product.stock,
+                'orders_per_sec': round(orders / elapsed, 1) if elapsed else None,
+                'elapsed_ms': round(elapsed * 1000, 1),
+                'errors': outcome['errors'],
+            }
+        finally:
+            Order.objects.filter(items__product=product).delete()
+            product.delete()
+            Session.objects.filter(session_key__in=session_keys).delete()
+
+        self.stdout.write(
+            f"{'checkout_hot_sku':<28} {buyers} khách / {stock} sp  {row['orders']} đơn  "
+            f"{row['orders_per_sec']} đơn/s  tồn kho cuối {row['final_stock']}  {len(row['errors'])} lỗi"
+        )
+        return row
+
+    # --- Ngưỡng ---
+    def check_concurrent_checkout(self, row):
+        failures = []
+        if row['final_stock'] < 0 or row['orders'] > row['initial_stock']:
+            failures.append(
+                f"checkout_hot_sku: bán vượt tồn kho ({row['orders']} đơn, tồn kho ban đầu "
+                f"{row['initial_stock']}, còn {row['final_stock']})"
+            )
+        if row['orders'] + row['final_stock'] != row['initial_stock']:
+            failures.append(f"checkout_hot_sku: số đơn và tồn kho không khớp ({row['orders']} + {row['final_stock']})")
+        if row['errors']:
+            failures.append(f"checkout_hot_sku: {len(row['errors'])} request lỗi, vd. {row['errors'][0]}")
+        return failures
+
+    def query_budget(self, name, url):
+        """Ngân sách @query_budget của view phục vụ url; None nếu view không khai báo."""
+        path = urlsplit(url).path if url else reverse('payment_info', kwargs={'order_code': 'DH000000'})
+        budget = getattr(resolve(path).func, 'query_budget', None)
+        return budget if budget is not None else FALLBACK_QUERY_BUDGETS.get(name)
+
+    def check_thresholds(self, results, options):
+        failures = []
+        for name, row in results.items():
+            if row['status'] >= 400:
+                failures.append(f"{name}: HTTP {row['status']}")
+            budget = row['query_budget']
+            if budget is not None and row['queries'] > budget:
+                failures.append(f"{name}: {row['queries']} queries > ngân sách {budget}")
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)['routes']
+            allowed = 1 + options['max_regression'] / 100
+            for name, row in results.items():
+                before = baseline.get(name)
+                if before is None:
+                    continue
+                if row['queries'] > before['queries']:
+                    failures.append(f"{name}: {row['queries']} queries (baseline {before['queries']})")
+                if row['p95_ms'] > before['p95_ms'] * allowed and row['p95_ms'] - before['p95_ms'] > NOISE_FLOOR_MS:
+                    failures.append(f"{name}: p95 {row['p95_ms']} ms (baseline {before['p95_ms']} ms)")
+        return failures
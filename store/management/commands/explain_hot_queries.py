@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# So sánh query plan của các truy vấn nóng trước/sau khi thêm index (migration 0017):
+#   python manage.py seed_data ...          (dữ liệu mẫu)
+#   python manage.py explain_hot_queries --without-indexes --output before.json
+#   python manage.py explain_hot_queries --output after.json
+# --without-indexes xóa các index của 0017 trong 1 transaction và rollback khi đo xong: schema
+# và dữ liệu không đổi. Trên PostgreSQL, DROP INDEX khóa cả bảng tới khi rollback, nên chỉ
+# dùng tùy chọn này trên DB thử, không chạy trên DB đang phục vụ khách.
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from store.models import COMPLETED_STATUS, Product, Order, OrderItem, Voucher, Notification, CartItem
+
+# Các index được thêm bởi migration 0017_hot_path_indexes
+HOT_PATH_INDEXES = [
+    'cartitem_cart_product_idx',
+    'notif_user_created_idx',
+    'notif_user_unread_idx',
+    'order_user_created_idx',
+    'order_user_status_idx',
+    'order_status_created_idx',
+    'product_category_price_idx',
+    'product_price_id_idx',
+    'voucher_code_upper_idx',
+]
+
+
+def _uses_index(plan, limited):
+    plan = plan.lower()
+    if connection.vendor == 'postgresql':
+        return 'index' in plan and 'seq scan' not in plan
+    # SQLite: "SEARCH ... USING INDEX" thay vì "SCAN <bảng>". "SCAN ... USING INDEX" đọc cả index,
+    # chỉ chấp nhận được khi có LIMIT (duyệt index theo thứ tự và dừng sớm)
+    uses_index = 'using index' in plan or 'using covering index' in plan or 'using integer primary key' in plan
+    return uses_index and (limited or 'scan ' not in plan)
+
+
+def _needs_sort(plan):
+    # Plan có bước sắp xếp riêng (không tận dụng được thứ tự của index)
+    plan = plan.lower()
+    return 'temp b-tree' in plan or 'sort key' in plan
+
+
+class Command(BaseCommand):
+    help = 'In query plan (EXPLAIN) và thời gian chạy của các truy vấn nóng để kiểm chứng index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+        parser.add_argument('--repeat', type=int, default=20, help='Số lần chạy để đo thời gian')
+        parser.add_argument('--without-indexes', action='store_true',
+                            help='Đo khi chưa có các index của migration 0017 (xóa tạm, rollback sau khi đo)')
+
+    def hot_queries(self):
+        # Chỉ đọc các cột cần (kể cả khi lấy dữ liệu mẫu), để lệnh chạy được trên DB chưa
+        # migrate các cột thêm về sau
+        order = Order.objects.exclude(user=None).order_by('-id').values('user_id').first()
+        product = Product.objects.order_by('-id').values('category_id', 'price').first()
+        notification = Notification.objects.order_by('-id').values('user_id').first()
+        cart_item = CartItem.objects.order_by('-id').values('cart_id', 'product_id').first()
+        user_id = order['user_id'] if order else 0
+        category_id = product['category_id'] if product else 0
+        price = product['price'] if product else 0
+
+        return {
+            'order_history': Order.objects.filter(user_id=user_id).order_by('-created_at').values('id')[:20],
+            'review_eligibility': OrderItem.objects.filter(
+                order__user_id=user_id, order__status=COMPLETED_STATUS
+            ).values_list('product_id', flat=True).distinct(),
+            'dashboard_new_orders': Order.objects.filter(status='Mới').order_by('-created_at').values('id')[:20],
+            'notification_feed': Notification.objects.filter(
+                user_id=notification['user_id'] if notification else 0
+            ).order_by('-created_at').values('id')[:10],
+            # Như get_unread_count(): COUNT không sắp xếp, nên dùng được partial index (is_read=False)
+            'notification_unread': Notification.objects.filter(
+                user_id=notification['user_id'] if notification else 0, is_read=False
+            ).order_by().values('id'),
+            'home_category_price': Product.objects.filter(category_id=category_id).order_by('price', 'id').values('id')[:12],
+            'home_price_desc': Product.objects.order_by('-price', '-id').values('id')[:12],
+            'home_price_keyset': Product.objects.filter(price__gt=price).order_by('price', 'id').values('id')[:12],
+            # PostgreSQL: UPPER(code) = UPPER(%s) dùng voucher_code_upper_idx; SQLite dịch iexact
+            # thành LIKE nên luôn là SCAN
+            'voucher_iexact': Voucher.objects.filter(code__iexact='GIAM10').values('id'),
+            'cart_item_lookup': CartItem.objects.filter(
+                cart_id=cart_item['cart_id'] if cart_item else 0,
+                product_id=cart_item['product_id'] if cart_item else 0,
+            ).values('id'),
+        }
+
+    def drop_hot_path_indexes(self):
+        with connection.cursor() as cursor:
+            for name in HOT_PATH_INDEXES:
+                cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(name)}')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['without_indexes']:
+                self.drop_hot_path_indexes()
+            results = self.explain_all(options)
+            # Không bao giờ giữ lại thay đổi schema (index bị xóa tạm)
+            transaction.set_rollback(True)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'vendor': connection.vendor,
+                    'without_indexes': options['without_indexes'],
+                    'queries': results,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Đã ghi kết quả vào {options['output']}"))
+
+    def explain_all(self, options):
+        results = {}
+        for name, queryset in self.hot_queries().items():
+            plan = queryset.explain()
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.all())
+            elapsed_ms = (time.perf_counter() - started) * 1000 / options['repeat']
+
+            results[name] = {
+                'uses_index': _uses_index(plan, queryset.query.high_mark is not None),
+                'needs_sort': _needs_sort(plan),
+                'avg_ms': round(elapsed_ms, 3),
+                'plan': plan,
+            }
+            good = results[name]['uses_index'] and not results[name]['needs_sort']
+            style = self.style.SUCCESS if good else self.style.WARNING
+            self.stdout.write(style(
+                f"{name}: {'INDEX' if results[name]['uses_index'] else 'SCAN'}"
+                f"{' + SORT' if results[name]['needs_sort'] else ''} - {elapsed_ms:.3f} ms"
+            ))
+            self.stdout.write(f'    {plan.replace(chr(10), chr(10) + "    ")}')
+        return results
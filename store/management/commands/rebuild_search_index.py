@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from store.search import rebuild_search_index, get_search_backend, REBUILD_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại index tìm kiếm toàn văn cho toàn bộ sản phẩm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE,
+                            help='Số sản phẩm ghi vào index mỗi lô')
+
+    def handle(self, *args, **options):
+        if get_search_backend() is None:
+            self.stdout.write(self.style.WARNING('CSDL hiện tại không hỗ trợ index toàn văn, bỏ qua.'))
+            return
+
+        self.stdout.write('Đang dựng lại index tìm kiếm...')
+        total = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Đã index {total} sản phẩm!'))
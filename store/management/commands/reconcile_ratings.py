@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from store.ratings import recalculate_product_ratings
+
+
+class Command(BaseCommand):
+    help = 'Đối soát thống kê đánh giá trên Product với bảng Review và sửa các sản phẩm bị lệch'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Đang đối soát thống kê đánh giá...')
+        fixed = recalculate_product_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Đã cập nhật {fixed} sản phẩm bị lệch.'))
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from store.featured import build_featured_pool
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại kho sản phẩm nổi bật cho trang giới thiệu (chạy định kỳ bằng cron)'
+
+    def handle(self, *args, **options):
+        data = build_featured_pool()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã dựng kho nổi bật: {len(data['pinned'])} sản phẩm ghim, {len(data['pool'])} sản phẩm lấy mẫu."
+        ))
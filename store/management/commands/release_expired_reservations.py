@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from store.reservations import RELEASE_BATCH_SIZE, release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Xóa các giữ hàng tạm (đơn chờ chuyển khoản) đã hết hạn (chạy định kỳ bằng cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RELEASE_BATCH_SIZE, help='Số dòng xóa mỗi lần')
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Đã giải phóng {released} giữ hàng hết hạn.'))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+from store.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Worker chạy các job nền trong hàng đợi (gửi email, tạo thông báo, xử lý ảnh)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Chạy hết các job đến hạn rồi thoát (dùng cho cron/test)')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Số giây chờ khi hàng đợi trống')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            succeeded, failed = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f'Đã chạy {succeeded} job thành công, {failed} job lỗi.'))
+            return
+
+        self.stdout.write('Worker đang chạy (Ctrl+C để dừng)...')
+        try:
+            while True:
+                succeeded, failed = run_pending_jobs(limit=100)
+                if succeeded or failed:
+                    self.stdout.write(f'{succeeded} job thành công, {failed} job lỗi.')
+                else:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Đã dừng worker.'))
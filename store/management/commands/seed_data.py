@@ -1,7 +1,29 @@
 # -*- coding: utf-8 -*-
+# Sinh dữ liệu mẫu. Mặc định: 5 danh mục, 30 sản phẩm (như trước).
+# Quy mô lớn cho benchmark, ví dụ:
+#   python manage.py seed_data --products 200000 --users 50000 --orders 1000000 \
+#       --reviews 300000 --notifications 500000 --carts 20000 --seed 42
+# Dữ liệu sinh ra là tất định theo --seed; độ phổ biến sản phẩm theo phân phối Zipf.
 import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
-from store.models import Category, Product
+from django.db import connection, transaction
+from django.utils import timezone
+from store.featured import build_featured_pool
+from store.models import (
+    Category, Product, Order, OrderItem, Review, Cart, CartItem, UserProfile, Notification,
+    DailyProductSales, StockReservation, VoucherUsage, COMPLETED_STATUS,
+)
+from store.ratings import recalculate_product_ratings
+from store.rollups import rebuild_rollups
+from store.search import rebuild_search_index
 
 # Danh sách link ảnh mẫu (Đã dùng link Adidas để không bị lỗi hiển thị)
 IMAGE_LINKS = {
@@ -28,77 +50,258 @@ IMAGE_LINKS = {
 }
 
 
+# Danh mục mẫu: (tên, tiền tố tên SP, mô tả, khoảng giá (nghìn VNĐ), khoảng tồn kho, nhóm ảnh)
+CATEGORY_SPECS = [
+    ("Áo đấu", "Áo đấu mẫu", "Đây là mô tả cho mẫu áo đấu #{i}. Chất liệu cao cấp, thoáng khí.", (500, 1000), (20, 100), 'ao'),
+    ("Giày", "Giày đá bóng mẫu", "Mô tả cho giày mẫu #{i}. Đế FG/AG bám sân tốt.", (1500, 3000), (10, 50), 'giay'),
+    ("Bóng", "Bóng đá mẫu", "Mô tả cho bóng mẫu #{i}. Chuẩn thi đấu.", (300, 1500), (30, 80), 'bong'),
+    ("Găng tay thủ môn", "Găng tay thủ môn mẫu", "Mô tả găng tay #{i}. Mút dày, bám dính tốt.", (700, 2000), (15, 40), 'gang_tay'),
+    ("Phụ kiện", "Phụ kiện mẫu", "Mô tả phụ kiện #{i}. (Tất, bọc ống đồng...)", (100, 400), (50, 200), 'phu_kien'),
+]
+
+# Phân bố trạng thái đơn hàng sinh ra (trọng số)
+ORDER_STATUS_WEIGHTS = [
+    (COMPLETED_STATUS, 70), ('Đang giao', 8), ('Đang xử lý', 7), ('Mới', 10), ('Đã hủy', 5),
+]
+SEED_USERNAME_PREFIX = 'seed_user_'
+SEED_ORDER_CODE_PREFIX = 'SD'
+# Mật khẩu chung của mọi user mẫu (benchmark_requests dùng để đăng nhập)
+SEED_PASSWORD = 'seedpassword123'
+# Đơn hàng sinh ra trải đều trong khoảng này (ngày)
+ORDER_HISTORY_DAYS = 365
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Tạm tắt auto_now_add để bulk_create giữ nguyên created_at đã gán."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
 class Command(BaseCommand):
-    help = 'Bơm (seed) dữ liệu mẫu vào database'
+    help = 'Bơm (seed) dữ liệu mẫu vào database (hỗ trợ quy mô lớn cho benchmark)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=30, help='Số sản phẩm (mặc định 30)')
+        parser.add_argument('--users', type=int, default=0, help='Số user mẫu')
+        parser.add_argument('--orders', type=int, default=0, help='Số đơn hàng (cần --users)')
+        parser.add_argument('--reviews', type=int, default=0, help='Số đánh giá (từ các đơn hoàn thành)')
+        parser.add_argument('--notifications', type=int, default=0, help='Số thông báo thêm (ngoài thông báo đặt hàng)')
+        parser.add_argument('--carts', type=int, default=0, help='Số user có giỏ hàng')
+        parser.add_argument('--seed', type=int, default=42, help='Seed cho bộ sinh ngẫu nhiên (dữ liệu tất định)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Số bản ghi mỗi lô bulk_create')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Số mũ Zipf cho độ phổ biến sản phẩm')
 
     def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        self.clear_old_data()
+        products = self.create_products(options['products'])
+        user_ids = self.create_users(options['users'])
+
+        if user_ids and products:
+            self.popularity = self.zipf_weights(products, options['zipf'])
+            completed_pairs = self.create_orders(options['orders'], user_ids, products, options['reviews'])
+            self.create_reviews(options['reviews'], completed_pairs)
+            self.create_notifications(options['notifications'], user_ids)
+            self.create_carts(options['carts'], user_ids, products)
+
+        self.stdout.write('Đang cập nhật index tìm kiếm, thống kê đánh giá, bảng tổng hợp...')
+        rebuild_search_index()
+        recalculate_product_ratings()
+        rebuild_rollups()
+        # Toàn bộ catalog đã thay đổi (id có thể bị dùng lại) -> bỏ mọi snapshot/trang đã cache
+        cache.clear()
+        build_featured_pool()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Tạo thành công {len(CATEGORY_SPECS)} danh mục và {len(products)} sản phẩm mẫu! '
+            f'({time.perf_counter() - started:.1f}s)'
+        ))
+
+    # --- Các bước sinh dữ liệu ---
+    def clear_old_data(self):
         self.stdout.write('Đang xóa dữ liệu cũ...')
-        # Xóa sạch trước khi tạo
-        Product.objects.all().delete()
-        Category.objects.all().delete()
-
-        self.stdout.write('Đang tạo dữ liệu mới (30 sản phẩm)...')
-
-        # --- Tạo Danh mục ---
-        cat_ao = Category.objects.create(name="Áo đấu")
-        cat_giay = Category.objects.create(name="Giày")
-        cat_bong = Category.objects.create(name="Bóng")
-        cat_gang = Category.objects.create(name="Găng tay thủ môn")
-        cat_pk = Category.objects.create(name="Phụ kiện")
-
-        # --- Tạo 6 Áo đấu ---
-        for i in range(1, 7):
-            Product.objects.create(
-                name=f"Áo đấu mẫu #{i}",
-                description=f"Đây là mô tả cho mẫu áo đấu #{i}. Chất liệu cao cấp, thoáng khí.",
-                price=random.randint(500, 1000) * 1000, # Giá ngẫu nhiên từ 500k-1tr
-                image=random.choice(IMAGE_LINKS['ao']),
-                stock=random.randint(20, 100),
-                category=cat_ao
-            )
+        # Xóa sạch trước khi tạo. Dùng DELETE theo tập thay vì Model.delete(): cascade của Django
+        # nạp từng bản ghi vào bộ nhớ để phát signal, quá chậm với hàng triệu dòng. Các bảng
+        # phụ thuộc (index tìm kiếm, thống kê, cache nổi bật) được dựng lại ở cuối handle().
+        seed_users, user_params = User.objects.filter(
+            username__startswith=SEED_USERNAME_PREFIX).values('id').query.sql_with_params()
+        seed_orders, order_params = Order.objects.filter(
+            order_code__startswith=SEED_ORDER_CODE_PREFIX).values('id').query.sql_with_params()
+        statements = [
+            # Dữ liệu gắn với sản phẩm (sản phẩm bị xóa toàn bộ)
+            (OrderItem, '', []),
+            (Review, '', []),
+            (CartItem, '', []),
+            (DailyProductSales, '', []),
+            (StockReservation, '', []),
+            # Dữ liệu của user / đơn hàng mẫu
+            (Order, f'WHERE id IN ({seed_orders})', order_params),
+            (Notification, f'WHERE user_id IN ({seed_users})', user_params),
+            (Cart, f'WHERE user_id IN ({seed_users})', user_params),
+            (VoucherUsage, f'WHERE user_id IN ({seed_users})', user_params),
+            (UserProfile, f'WHERE user_id IN ({seed_users})', user_params),
+            (User, f'WHERE id IN ({seed_users})', user_params),
+            (Product, '', []),
+            (Category, '', []),
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Đơn hàng thật của user mẫu (nếu có) được giữ lại, như on_delete=SET_NULL
+            cursor.execute(f"UPDATE {Order._meta.db_table} SET user_id = NULL WHERE user_id IN ({seed_users})", user_params)
+            for model, where, params in statements:
+                cursor.execute(f"DELETE FROM {model._meta.db_table} {where}", params)
 
-        # --- Tạo 6 Giày ---
-        for i in range(1, 7):
-            Product.objects.create(
-                name=f"Giày đá bóng mẫu #{i}",
-                description=f"Mô tả cho giày mẫu #{i}. Đế FG/AG bám sân tốt.",
-                price=random.randint(1500, 3000) * 1000, # Giá ngẫu nhiên từ 1tr5-3tr
-                image=random.choice(IMAGE_LINKS['giay']),
-                stock=random.randint(10, 50),
-                category=cat_giay
-            )
+    def bulk_insert(self, model, objs):
+        """bulk_create theo lô, mỗi lô 1 transaction. Trả về các object (đã có pk)."""
+        created = []
+        for start in range(0, len(objs), self.batch_size):
+            with transaction.atomic():
+                created += model.objects.bulk_create(objs[start:start + self.batch_size])
+        return created
 
-        # --- Tạo 6 Quả bóng ---
-        for i in range(1, 7):
-            Product.objects.create(
-                name=f"Bóng đá mẫu #{i}",
-                description=f"Mô tả cho bóng mẫu #{i}. Chuẩn thi đấu.",
-                price=random.randint(300, 1500) * 1000, # Giá ngẫu nhiên
-                image=random.choice(IMAGE_LINKS['bong']),
-                stock=random.randint(30, 80),
-                category=cat_bong
-            )
+    def create_products(self, count):
+        self.stdout.write(f'Đang tạo dữ liệu mới ({count} sản phẩm)...')
+        categories = self.bulk_insert(Category, [Category(name=spec[0]) for spec in CATEGORY_SPECS])
 
-        # --- Tạo 6 Găng tay ---
-        for i in range(1, 7):
-            Product.objects.create(
-                name=f"Găng tay thủ môn mẫu #{i}",
-                description=f"Mô tả găng tay #{i}. Mút dày, bám dính tốt.",
-                price=random.randint(700, 2000) * 1000, # Giá ngẫu nhiên
-                image=random.choice(IMAGE_LINKS['gang_tay']),
-                stock=random.randint(15, 40),
-                category=cat_gang
-            )
+        objs = []
+        for n in range(count):
+            category = categories[n % len(categories)]
+            _, prefix, description, (price_min, price_max), (stock_min, stock_max), image_key = CATEGORY_SPECS[n % len(categories)]
+            i = n // len(categories) + 1
+            objs.append(Product(
+                name=f"{prefix} #{i}",
+                description=description.format(i=i),
+                price=self.rng.randint(price_min, price_max) * 1000,
+                image=self.rng.choice(IMAGE_LINKS[image_key]),
+                stock=self.rng.randint(stock_min, stock_max),
+                category=category,
+            ))
+        return self.bulk_insert(Product, objs)
+
+    def create_users(self, count):
+        if not count:
+            return []
+        self.stdout.write(f'Đang tạo {count} user...')
+        password = make_password(SEED_PASSWORD) # Băm 1 lần, dùng chung cho mọi user mẫu
+        users = self.bulk_insert(User, [
+            User(username=f'{SEED_USERNAME_PREFIX}{n}', email=f'{SEED_USERNAME_PREFIX}{n}@example.com', password=password)
+            for n in range(count)
+        ])
+        # bulk_create không phát signal -> tự tạo UserProfile
+        self.bulk_insert(UserProfile, [UserProfile(user_id=user.pk) for user in users])
+        return [user.pk for user in users]
+
+    def zipf_weights(self, products, exponent):
+        # Thứ hạng phổ biến ngẫu nhiên (tất định) -> trọng số 1/rank^s
+        ranked = [product.pk for product in products]
+        self.rng.shuffle(ranked)
+        self.product_prices = {product.pk: product.price for product in products}
+        return ranked, list(accumulate(1 / (rank ** exponent) for rank in range(1, len(ranked) + 1)))
 
-        # --- Tạo 6 Phụ kiện ---
-        for i in range(1, 7):
-            Product.objects.create(
-                name=f"Phụ kiện mẫu #{i}",
-                description=f"Mô tả phụ kiện #{i}. (Tất, bọc ống đồng...)",
-                price=random.randint(100, 400) * 1000, # Giá ngẫu nhiên
-                image=random.choice(IMAGE_LINKS['phu_kien']),
-                stock=random.randint(50, 200),
-                category=cat_pk
+    def pick_products(self, k):
+        ranked, cum_weights = self.popularity
+        return self.rng.choices(ranked, cum_weights=cum_weights, k=k)
+
+    def create_orders(self, count, user_ids, products, review_target):
+        """Sinh đơn hàng theo lô; trả về các cặp (user, product) của đơn hoàn thành để sinh review."""
+        if not count:
+            return []
+        self.stdout.write(f'Đang tạo {count} đơn hàng...')
+        statuses, status_weights = zip(*ORDER_STATUS_WEIGHTS)
+        now = timezone.now()
+        completed_pairs = set()
+        pair_limit = review_target * 3
+
+        with explicit_timestamps(Order._meta.get_field('created_at')):
+            for start in range(0, count, self.batch_size):
+                batch_size = min(self.batch_size, count - start)
+                orders, lines_per_order = [], []
+                for n in range(start, start + batch_size):
+                    lines = {}
+                    for product_id in self.pick_products(self.rng.randint(1, 4)):
+                        lines[product_id] = lines.get(product_id, 0) + self.rng.randint(1, 3)
+                    total = sum(self.product_prices[pid] * qty for pid, qty in lines.items())
+                    user_id = self.rng.choice(user_ids)
+                    orders.append(Order(
+                        order_code=f'{SEED_ORDER_CODE_PREFIX}{n:08d}',
+                        user_id=user_id,
+                        full_name=f'Khách hàng {user_id}',
+                        email=f'{SEED_USERNAME_PREFIX}{user_id}@example.com',
+                        phone='0900000000',
+                        address='123 Đường Mẫu, TP. Hồ Chí Minh',
+                        total_price=total,
+                        status=self.rng.choices(statuses, weights=status_weights)[0],
+                        payment_method=self.rng.choice(['cod', 'qr']),
+                        created_at=now - timedelta(seconds=self.rng.randint(0, ORDER_HISTORY_DAYS * 86400)),
+                    ))
+                    lines_per_order.append(lines)
+
+                with transaction.atomic():
+                    orders = Order.objects.bulk_create(orders)
+                    items = []
+                    for order, lines in zip(orders, lines_per_order):
+                        for product_id, quantity in lines.items():
+                            items.append(OrderItem(
+                                order_id=order.pk, product_id=product_id, quantity=quantity,
+                                price_at_purchase=self.product_prices[product_id],
+                            ))
+                            if order.status == COMPLETED_STATUS and len(completed_pairs) < pair_limit:
+                                completed_pairs.add((order.user_id, product_id))
+                    OrderItem.objects.bulk_create(items)
+                    Notification.objects.bulk_create([
+                        Notification(
+                            user_id=order.user_id,
+                            title="Đặt hàng thành công",
+                            message=f"Đơn hàng #{order.order_code} đã được tiếp nhận. Chúng tôi sẽ sớm xử lý.",
+                        )
+                        for order in orders
+                    ])
+                self.stdout.write(f'  ... {start + batch_size}/{count}')
+        return sorted(completed_pairs)
+
+    def create_reviews(self, count, completed_pairs):
+        if not count or not completed_pairs:
+            return
+        pairs = self.rng.sample(completed_pairs, min(count, len(completed_pairs)))
+        self.stdout.write(f'Đang tạo {len(pairs)} đánh giá...')
+        comments = ['Sản phẩm tốt!', 'Giao hàng nhanh.', 'Đúng mô tả.', 'Tạm ổn.', None]
+        self.bulk_insert(Review, [
+            Review(user_id=user_id, product_id=product_id,
+                   rating=self.rng.choices([1, 2, 3, 4, 5], weights=[3, 5, 12, 35, 45])[0],
+                   comment=self.rng.choice(comments))
+            for user_id, product_id in pairs
+        ])
+
+    def create_notifications(self, count, user_ids):
+        if not count:
+            return
+        self.stdout.write(f'Đang tạo {count} thông báo...')
+        self.bulk_insert(Notification, [
+            Notification(
+                user_id=self.rng.choice(user_ids),
+                title="Khuyến mãi",
+                message=f"Ưu đãi mẫu #{n} dành cho bạn.",
+                is_read=self.rng.random() < 0.6,
             )
-            
-        self.stdout.write(self.style.SUCCESS(f'Tạo thành công 5 danh mục và 30 sản phẩm mẫu!'))
\ No newline at end of file
+            for n in range(count)
+        ])
+
+    def create_carts(self, count, user_ids, products):
+        if not count:
+            return
+        cart_user_ids = self.rng.sample(user_ids, min(count, len(user_ids)))
+        self.stdout.write(f'Đang tạo {len(cart_user_ids)} giỏ hàng...')
+        carts = self.bulk_insert(Cart, [Cart(user_id=user_id) for user_id in cart_user_ids])
+        items = []
+        for cart in carts:
+            for product_id in set(self.pick_products(self.rng.randint(1, 5))):
+                items.append(CartItem(cart_id=cart.pk, product_id=product_id, quantity=self.rng.randint(1, 2)))
+        self.bulk_insert(CartItem, items)
@@ -0,0 +1,110 @@
+# Index tìm kiếm toàn văn cho Product (PostgreSQL: tsvector + GIN, SQLite: FTS5)
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+# Bản sao của store.search.normalize_text tại thời điểm tạo migration: migration không import
+# code đang chạy (có thể đã đổi hoặc dùng model hiện tại thay vì model lịch sử)
+def _normalize_text(text):
+    if not text:
+        return ''
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+def _backfill(apps, schema_editor, insert_sql, to_params):
+    Product = apps.get_model('store', 'Product')
+    rows = (
+        Product.objects.using(schema_editor.connection.alias).order_by('id')
+        .values_list('id', 'category_id', 'name', 'description', 'category__name')
+    )
+    with schema_editor.connection.cursor() as cursor:
+        batch = []
+        for row in rows.iterator(chunk_size=BACKFILL_BATCH_SIZE):
+            batch.append(to_params(*row))
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                cursor.executemany(insert_sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert_sql, batch)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS store_product_search ("
+            "product_id bigint PRIMARY KEY REFERENCES store_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "category_id bigint, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS store_product_search_document_gin "
+            "ON store_product_search USING gin (document)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS store_product_search_category_id "
+            "ON store_product_search (category_id)"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts USING fts5("
+            "name, category, description, category_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+    else:
+        return
+
+    # Đổ dữ liệu ban đầu cho các sản phẩm đã có
+    if vendor == 'postgresql':
+        _backfill(
+            apps, schema_editor,
+            "INSERT INTO store_product_search (product_id, category_id, document) VALUES ("
+            "%s, %s, "
+            "setweight(to_tsvector('simple', %s), 'A') || "
+            "setweight(to_tsvector('simple', %s), 'B') || "
+            "setweight(to_tsvector('simple', %s), 'C')) "
+            "ON CONFLICT (product_id) DO NOTHING",
+            lambda product_id, category_id, name, description, category_name: (
+                product_id, category_id,
+                _normalize_text(name), _normalize_text(category_name), _normalize_text(description),
+            ),
+        )
+    else:
+        schema_editor.execute("DELETE FROM store_product_fts")
+        _backfill(
+            apps, schema_editor,
+            "INSERT INTO store_product_fts (rowid, name, category, description, category_id) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            lambda product_id, category_id, name, description, category_name: (
+                product_id,
+                _normalize_text(name), _normalize_text(category_name), _normalize_text(description),
+                category_id,
+            ),
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS store_product_search")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS store_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_order_order_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='is_featured',
+            field=models.BooleanField(default=False, help_text='Ghim sản phẩm lên trang giới thiệu'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:39
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    # Tính thống kê đánh giá cho các sản phẩm đã có review
+    Product = apps.get_model('store', 'Product')
+    Review = apps.get_model('store', 'Review')
+    rows = Review.objects.order_by().values('product_id').annotate(
+        review_count=Count('id'),
+        rating_sum=Sum('rating'),
+        **{f'rating_{star}_count': Count('id', filter=Q(rating=star)) for star in range(1, 6)},
+    )
+    for row in rows:
+        product_id = row.pop('product_id')
+        Product.objects.filter(pk=product_id).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_product_is_featured'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    # Tổng hợp các đơn đã hoàn thành trước khi có bảng tổng hợp
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    DailySales = apps.get_model('store', 'DailySales')
+    DailyProductSales = apps.get_model('store', 'DailyProductSales')
+    tz = timezone.get_current_timezone()
+    completed = Order.objects.filter(status='Hoàn thành')
+
+    DailySales.objects.bulk_create([
+        DailySales(date=row['day'], order_count=row['order_count'], revenue=row['revenue'] or 0)
+        for row in completed.annotate(day=TruncDate('created_at', tzinfo=tz)).values('day').annotate(
+            order_count=Count('id'), revenue=Sum(F('total_price') - F('discount_amount'))
+        ).order_by()
+    ], batch_size=1000)
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(date=row['day'], product_id=row['product_id'], quantity=row['quantity_total'], revenue=row['revenue_total'] or 0)
+        for row in OrderItem.objects.filter(order__in=completed).annotate(
+            day=TruncDate('order__created_at', tzinfo=tz)
+        ).values('day', 'product_id').annotate(
+            quantity_total=Sum('quantity'), revenue_total=Sum(F('quantity') * F('price_at_purchase'))
+        ).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=0, default=0, help_text='Doanh thu sau giảm giá của đơn hoàn thành', max_digits=14)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=0, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='store.product')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('date', 'product')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
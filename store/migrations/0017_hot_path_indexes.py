@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:41
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_sales_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['cart', 'product'], name='cartitem_cart_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at'], name='notif_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user'], name='notif_user_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(django.db.models.functions.text.Upper('code'), name='voucher_code_upper_idx'),
+        ),
+    ]
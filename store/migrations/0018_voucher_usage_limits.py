@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_usage(apps, schema_editor):
+    # Đếm các đơn đã dùng voucher trước khi có bộ đếm
+    Voucher = apps.get_model('store', 'Voucher')
+    Order = apps.get_model('store', 'Order')
+    VoucherUsage = apps.get_model('store', 'VoucherUsage')
+
+    totals = Order.objects.exclude(voucher=None).values('voucher_id').annotate(total=models.Count('id')).order_by()
+    for row in totals:
+        Voucher.objects.filter(pk=row['voucher_id']).update(used_count=row['total'])
+
+    per_user = (
+        Order.objects.exclude(voucher=None).exclude(user=None)
+        .values('voucher_id', 'user_id').annotate(total=models.Count('id')).order_by()
+    )
+    VoucherUsage.objects.bulk_create([
+        VoucherUsage(voucher_id=row['voucher_id'], user_id=row['user_id'], used_count=row['total'])
+        for row in per_user
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voucher',
+            name='usage_limit',
+            field=models.PositiveIntegerField(blank=True, help_text='Tổng số lượt dùng tối đa (để trống = không giới hạn)', null=True),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='usage_limit_per_user',
+            field=models.PositiveIntegerField(blank=True, help_text='Số lượt tối đa cho mỗi tài khoản (để trống = không giới hạn)', null=True),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='used_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='VoucherUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('used_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='voucher_usages', to=settings.AUTH_USER_MODEL)),
+                ('voucher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usages', to='store.voucher')),
+            ],
+            options={
+                'unique_together': {('voucher', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_voucher_usage_limits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('reservation_key', models.CharField(db_index=True, help_text='Mã đơn hàng chờ thanh toán (order_code trong session)', max_length=20)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='store.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='reservation_product_exp_idx'), models.Index(fields=['expires_at'], name='reservation_expires_idx')],
+            },
+        ),
+    ]
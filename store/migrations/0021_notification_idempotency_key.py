@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=200, null=True, unique=True),
+        ),
+    ]
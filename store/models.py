@@ -1,8 +1,9 @@
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 # --- CÁC LỰA CHỌN TRẠNG THÁI ---
@@ -13,12 +14,21 @@ ORDER_STATUS_CHOICES = [
     ('Hoàn thành', 'Hoàn thành'),
     ('Đã hủy', 'Đã hủy'),
 ]
+# Đơn đã giao xong: tính doanh thu (store/rollups.py) và cho phép đánh giá (store/eligibility.py)
+COMPLETED_STATUS = 'Hoàn thành'
 
 PAYMENT_METHOD_CHOICES = [
     ('cod', 'Thanh toán khi nhận hàng (COD)'),
     ('qr', 'Chuyển khoản ngân hàng (QR)'),
 ]
 
+JOB_STATUS_CHOICES = [
+    ('queued', 'Chờ chạy'),
+    ('running', 'Đang chạy'),
+    ('done', 'Hoàn thành'),
+    ('failed', 'Thất bại'),
+]
+
 # --- MODEL CATEGORY (Như cũ) ---
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -34,6 +44,35 @@ class Product(models.Model):
     image = models.URLField(max_length=1024, blank=True, null=True)
     stock = models.IntegerField(default=0)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
+    is_featured = models.BooleanField(default=False, help_text="Ghim sản phẩm lên trang giới thiệu")
+
+    # Thống kê đánh giá (phi chuẩn hóa, cập nhật theo signal của Review - xem store/ratings.py)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Lọc theo danh mục + sắp xếp theo giá (trang home)
+            models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+            # Sắp xếp theo giá + phân trang keyset (price, id)
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ]
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @property
+    def rating_histogram(self):
+        # [(5, số lượt 5 sao), (4, ...), ..., (1, ...)]
+        return [(star, getattr(self, f'rating_{star}_count')) for star in range(5, 0, -1)]
     
     def __str__(self):
         return self.name
@@ -46,8 +85,28 @@ class Voucher(models.Model):
     valid_from = models.DateTimeField()
     valid_to = models.DateTimeField()
     is_active = models.BooleanField(default=True)
+    # Giới hạn lượt dùng (để trống = không giới hạn). Được trừ nguyên tử khi đặt hàng (store/vouchers.py)
+    usage_limit = models.PositiveIntegerField(null=True, blank=True, help_text="Tổng số lượt dùng tối đa (để trống = không giới hạn)")
+    usage_limit_per_user = models.PositiveIntegerField(null=True, blank=True, help_text="Số lượt tối đa cho mỗi tài khoản (để trống = không giới hạn)")
+    used_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Checkout tra mã bằng code__iexact -> UPPER("code") = UPPER(%s)
+            models.Index(Upper('code'), name='voucher_code_upper_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # used_count chỉ được đổi bằng UPDATE nguyên tử (vouchers.redeem_voucher). Lưu lại giá trị
+        # đã nạp từ trước (vd. sửa voucher trong admin) sẽ xóa mất các lượt dùng đồng thời.
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs['update_fields'] = [name for name in update_fields if name != 'used_count']
+        super().save(*args, **kwargs)
 
-    def is_valid(self, total_price):
+    def is_valid(self, total_price, user=None):
         now = timezone.now()
         if not self.is_active:
             return False, "Mã giảm giá này đã bị vô hiệu hóa."
@@ -55,6 +114,11 @@ class Voucher(models.Model):
             return False, "Mã giảm giá này chưa đến ngày sử dụng."
         if now > self.valid_to:
             return False, "Mã giảm giá này đã hết hạn."
+        if self.usage_limit is not None and self.used_count >= self.usage_limit:
+            return False, "Mã giảm giá này đã hết lượt sử dụng."
+        if self.usage_limit_per_user is not None and not (user and user.is_authenticated):
+            # Giới hạn theo tài khoản không kiểm tra được với khách vãng lai
+            return False, "Vui lòng đăng nhập để dùng mã giảm giá này."
         if total_price < self.min_purchase_amount:
             return False, f"Đơn hàng phải đạt tối thiểu {self.min_purchase_amount} VNĐ để dùng mã này."
         return True, "Hợp lệ"
@@ -62,6 +126,18 @@ class Voucher(models.Model):
     def __str__(self):
         return f"{self.code} (Giảm {self.discount_amount} VNĐ)"
 
+# --- SỐ LƯỢT DÙNG VOUCHER THEO USER ---
+class VoucherUsage(models.Model):
+    voucher = models.ForeignKey(Voucher, on_delete=models.CASCADE, related_name='usages')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='voucher_usages')
+    used_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('voucher', 'user')
+
+    def __str__(self):
+        return f"{self.user_id} - {self.voucher_id}: {self.used_count}"
+
 # --- MODEL ORDER (Như cũ) ---
 class Order(models.Model):
     order_code = models.CharField(max_length=20, unique=True, editable=False, null=True, help_text="Mã đơn hàng hiển thị cho khách (VD: DH123456)")
@@ -82,6 +158,31 @@ class Order(models.Model):
     payment_proof = models.ImageField(upload_to='payment_proofs/', null=True, blank=True)
     note = models.TextField(blank=True, null=True, help_text="Ghi chú đơn hàng hoặc mã giao dịch")
     
+    class Meta:
+        indexes = [
+            # Lịch sử đơn hàng của user, mới nhất trước
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+            # Điều kiện đánh giá: đơn 'Hoàn thành' của user
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            # Dashboard / admin lọc theo trạng thái
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+        ]
+
+    # Trạng thái lúc nạp từ DB (None với đơn mới tạo), dùng để phát hiện đổi trạng thái
+    _old_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ghi nhớ trạng thái đã nạp -> signal so sánh được mà không cần query lại
+        instance._old_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Các signal post_save đã chạy xong với trạng thái cũ, giờ mới cập nhật mốc so sánh
+        self._old_status = self.status
+
     @property
     def final_price(self):
         return self.total_price - self.discount_amount
@@ -99,6 +200,25 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name} (Đơn hàng #{self.order.order_code})"
 
+# --- GIỮ HÀNG TẠM CHO ĐƠN CHỜ CHUYỂN KHOẢN (xem store/reservations.py) ---
+class StockReservation(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    reservation_key = models.CharField(max_length=20, db_index=True, help_text="Mã đơn hàng chờ thanh toán (order_code trong session)")
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Tổng số lượng đang giữ của các sản phẩm (chỉ tính giữ chỗ còn hạn)
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_exp_idx'),
+            # Lệnh dọn giữ chỗ hết hạn
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.reservation_key}: {self.quantity} x {self.product_id} (đến {self.expires_at:%H:%M})"
+
 # --- MODEL REVIEW (MỚI) ---
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
@@ -124,7 +244,11 @@ class Cart(models.Model):
 
     @property
     def total_price(self):
-        return sum(item.subtotal for item in self.cart_items.all())
+        # Tính tổng ngay trong SQL thay vì lấy product của từng dòng
+        total = self.cart_items.aggregate(
+            total=models.Sum(models.F('quantity') * models.F('product__price'))
+        )['total']
+        return total or 0
 
 # --- MODEL CARTITEM (GIỎ HÀNG DATABASE) ---
 class CartItem(models.Model):
@@ -132,6 +256,11 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cart', 'product'], name='cartitem_cart_product_idx'),
+        ]
+
     @property
     def subtotal(self):
         return self.product.price * self.quantity
@@ -157,49 +286,92 @@ class Notification(models.Model):
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Thông báo do job tạo có khóa riêng (vd. 'order-status:<id>:<trạng thái>'): job chạy lại
+    # (thử lại, hoặc bị nhận lại khi quá hạn khóa) không tạo thông báo trùng
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Danh sách thông báo mới nhất của user (header)
+            models.Index(fields=['user', '-created_at'], name='notif_user_created_idx'),
+            # Index một phần: chỉ các thông báo chưa đọc (đếm badge)
+            models.Index(fields=['user'], condition=models.Q(is_read=False), name='notif_user_unread_idx'),
+        ]
+
+# --- BẢNG TỔNG HỢP DOANH THU (cho Dashboard, cập nhật trong store/rollups.py) ---
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=0, default=0, help_text="Doanh thu sau giảm giá của đơn hoàn thành")
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: {self.order_count} đơn - {self.revenue} VNĐ"
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=0, default=0)
+
+    class Meta:
+        unique_together = ('date', 'product')
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: {self.quantity} x {self.product_id}"
+
+# --- HÀNG ĐỢI JOB NỀN (gửi email, thông báo, xử lý ảnh - xem store/jobs.py) ---
+class Job(models.Model):
+    name = models.CharField(max_length=100, help_text="Tên job đã đăng ký bằng @jobs.job(...)")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=JOB_STATUS_CHOICES, default='queued')
+    # Cùng một khóa chỉ được xếp hàng 1 lần (vd. xử lý cùng một ảnh, bấm gửi email 2 lần)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now, help_text="Chưa chạy trước thời điểm này (lùi lại khi thử lại)")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Worker lấy job đến hạn theo thứ tự run_at
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
 
+# Profile được tạo đúng 1 lần khi tạo User. Các lần User.save() sau (vd. cập nhật last_login
+# khi đăng nhập) không chạm tới UserProfile; profile chỉ được lưu khi chính nó thay đổi.
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
         UserProfile.objects.create(user=instance)
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    # Sử dụng get_or_create để đảm bảo profile luôn tồn tại
-    UserProfile.objects.get_or_create(user=instance)
-    if hasattr(instance, 'userprofile'):
-        instance.userprofile.save()
-
-# --- SIGNALS CHO THÔNG BÁO ĐƠN HÀNG ---
-
-# 1. Bắt trạng thái cũ trước khi lưu để so sánh
-@receiver(pre_save, sender=Order)
-def track_order_status(sender, instance, **kwargs):
-    try:
-        old_instance = Order.objects.get(pk=instance.pk)
-        instance._old_status = old_instance.status
-    except Order.DoesNotExist:
-        instance._old_status = None
-
-# 2. Tạo thông báo sau khi lưu
-@receiver(post_save, sender=Order)
-def create_order_notification(sender, instance, created, **kwargs):
-    if created:
-        # Với luồng mới: Cả COD và QR khi được tạo (created=True) đều là đã xác nhận đặt hàng
-        if instance.user:
-            Notification.objects.create(
-                user=instance.user,
-                title="Đặt hàng thành công",
-                message=f"Đơn hàng #{instance.order_code} đã được tiếp nhận. Chúng tôi sẽ sớm xử lý."
-            )
-    elif instance._old_status is not None and instance._old_status != instance.status:
-        if instance.user:
-            # Thông báo khi trạng thái thay đổi thông thường
-            Notification.objects.create(
-                user=instance.user,
-                title="Cập nhật đơn hàng",
-                message=f"Đơn hàng #{instance.order_code} của bạn đã chuyển sang trạng thái: {instance.status}."
-            )
\ No newline at end of file
+# --- THÔNG BÁO ĐƠN HÀNG ---
+# Được tạo bởi job nền; signal post_save của Order nằm trong store/notifications.py
+
+def build_status_notification(order):
+    """Thông báo (chưa lưu) gửi cho khách khi đơn chuyển trạng thái."""
+    return Notification(
+        user_id=order.user_id,
+        idempotency_key=f'order-status:{order.pk}:{order.status}',
+        title="Cập nhật đơn hàng",
+        message=f"Đơn hàng #{order.order_code} của bạn đã chuyển sang trạng thái: {order.status}."
+    )
+
+def build_created_notification(order):
+    """Thông báo (chưa lưu) khi đơn vừa được tạo (COD và QR đều là đã xác nhận đặt hàng)."""
+    return Notification(
+        user_id=order.user_id,
+        idempotency_key=f'order-created:{order.pk}',
+        title="Đặt hàng thành công",
+        message=f"Đơn hàng #{order.order_code} đã được tiếp nhận. Chúng tôi sẽ sớm xử lý."
+    )
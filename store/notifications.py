@@ -0,0 +1,130 @@
+# store/notifications.py
+# Cache thông báo cho header: danh sách rút gọn + bộ đếm chưa đọc theo từng user,
+# các job nền tạo thông báo đơn hàng (không ghi Notification trong request đặt hàng)
+# và đẩy thông báo mới tới trình duyệt đang mở qua pub/sub (store/realtime.py).
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateformat import format as format_date
+
+from .jobs import enqueue, job
+from .models import Notification, Order, build_created_notification, build_status_notification
+from .realtime import get_broker, user_channel
+
+# Số thông báo tối đa hiển thị trong dropdown ở header
+HEADER_FEED_LIMIT = 10
+# Thời gian sống của cache (giây) - chỉ là lưới an toàn, cache được xóa chủ động khi có thay đổi
+NOTIFICATION_CACHE_TIMEOUT = 60 * 15
+
+
+def _feed_key(user_id):
+    return f'notifications:feed:{user_id}'
+
+
+def _unread_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def get_header_feed(user_id):
+    """Trả về tối đa HEADER_FEED_LIMIT thông báo mới nhất (chỉ các cột header cần)."""
+    feed = cache.get(_feed_key(user_id))
+    if feed is None:
+        feed = list(
+            Notification.objects.filter(user_id=user_id)
+            .only('id', 'title', 'message', 'is_read', 'created_at')
+            .order_by('-created_at')[:HEADER_FEED_LIMIT]
+        )
+        cache.set(_feed_key(user_id), feed, NOTIFICATION_CACHE_TIMEOUT)
+    return feed
+
+
+def get_unread_count(user_id):
+    """Số thông báo chưa đọc, lấy từ bộ đếm cache của user."""
+    unread_count = cache.get(_unread_key(user_id))
+    if unread_count is None:
+        unread_count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        cache.set(_unread_key(user_id), unread_count, NOTIFICATION_CACHE_TIMEOUT)
+    return unread_count
+
+
+def invalidate_notification_cache(user_id):
+    """Xóa cache thông báo của user (gọi khi thêm/sửa/xóa thông báo)."""
+    cache.delete_many([_feed_key(user_id), _unread_key(user_id)])
+
+
+def notification_event(notification):
+    """Dữ liệu gửi cho trình duyệt (cùng định dạng với dropdown trong header)."""
+    return {
+        'id': notification.pk,
+        'title': notification.title,
+        'message': notification.message,
+        'created_at': format_date(timezone.localtime(notification.created_at), 'H:i d/m'),
+        'url': reverse('notification_detail', args=[notification.pk]) if notification.pk else None,
+    }
+
+
+def publish_notifications(notifications):
+    """Đẩy các thông báo mới tới user đang kết nối, sau khi transaction hiện tại commit."""
+    events = [(user_channel(n.user_id), notification_event(n)) for n in notifications]
+
+    def publish():
+        broker = get_broker()
+        for channel, event in events:
+            broker.publish(channel, event)
+    # robust: broker lỗi chỉ ghi log, không làm job (đã commit thông báo) bị đánh dấu lỗi và chạy lại
+    transaction.on_commit(publish, robust=True)
+
+
+# --- SIGNALS: Mọi thay đổi trên Notification đều làm mới cache ---
+# (Bao gồm thông báo sinh ra từ signal post_save của Order)
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def notification_changed(sender, instance, created=False, **kwargs):
+    invalidate_notification_cache(instance.user_id)
+    if created:
+        publish_notifications([instance])
+
+
+# --- THÔNG BÁO ĐƠN HÀNG (chạy nền) ---
+# Job có thể chạy hơn 1 lần (xem store/jobs.py), nên mỗi thông báo có idempotency_key UNIQUE
+# và các khóa đã có được bỏ qua.
+@job('notify_order_created')
+def notify_order_created(order_id):
+    order = Order.objects.filter(pk=order_id, user__isnull=False).only('id', 'user_id', 'order_code').first()
+    if order is None:
+        return
+    notification = build_created_notification(order)
+    if not Notification.objects.filter(idempotency_key=notification.idempotency_key).exists():
+        notification.save()
+
+
+@job('notify_order_status')
+def notify_order_status(order_ids, status):
+    """Thông báo đổi trạng thái cho nhiều đơn: 2 SELECT + 1 bulk_create."""
+    orders = list(Order.objects.filter(pk__in=order_ids, user__isnull=False).only('id', 'user_id', 'order_code'))
+    for order in orders:
+        order.status = status # Trạng thái lúc đổi, không phải trạng thái hiện tại khi job chạy
+    notifications = [build_status_notification(order) for order in orders]
+    sent = set(
+        Notification.objects.filter(idempotency_key__in=[n.idempotency_key for n in notifications])
+        .values_list('idempotency_key', flat=True)
+    )
+    notifications = Notification.objects.bulk_create([n for n in notifications if n.idempotency_key not in sent])
+    # bulk_create không phát signal
+    for user_id in {n.user_id for n in notifications}:
+        invalidate_notification_cache(user_id)
+    publish_notifications(notifications)
+
+
+# Trạng thái cũ được ghi nhớ trong Order.from_db (không query lại trước khi lưu)
+@receiver(post_save, sender=Order)
+def enqueue_order_notification(sender, instance, created, raw=False, **kwargs):
+    if raw or not instance.user_id:
+        return
+    if created:
+        enqueue('notify_order_created', {'order_id': instance.pk}, idempotency_key=f'order-created:{instance.pk}')
+    elif instance._old_status is not None and instance._old_status != instance.status:
+        enqueue('notify_order_status', {'order_ids': [instance.pk], 'status': instance.status})
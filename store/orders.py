@@ -0,0 +1,186 @@
+# store/orders.py
+# Dịch vụ đặt hàng: tạo Order + OrderItem và trừ tồn kho trong 1 transaction duy nhất,
+# giữ hàng tạm cho đơn chờ chuyển khoản QR.
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .catalog_cache import invalidate_products_on_commit
+from .eligibility import invalidate_review_eligibility
+from .jobs import enqueue
+from .models import COMPLETED_STATUS, Product, Order, OrderItem, StockReservation
+from .page_cache import bump_catalog_version, invalidate_product_pages
+from .reservations import RESERVATION_TTL, held_quantities, release_reservation
+from .rollups import apply_orders_to_rollups
+from .vouchers import redeem_voucher
+
+
+class OutOfStockError(Exception):
+    """Sản phẩm không còn đủ tồn kho tại thời điểm đặt hàng."""
+
+    def __init__(self, product_name):
+        self.product_name = product_name
+        super().__init__(f"Sản phẩm '{product_name}' vừa hết hàng.")
+
+
+class ReservationKeyInUseError(Exception):
+    """Mã đơn dùng làm reservation_key đang được một giữ chỗ còn hạn khác sử dụng."""
+
+
+def _cart_quantities(cart_lines):
+    quantities = {}
+    for line in cart_lines:
+        product_id = line['product'].pk
+        quantities[product_id] = quantities.get(product_id, 0) + line['quantity']
+    return quantities
+
+
+def _lock_products(product_ids):
+    # Khóa theo thứ tự ổn định (tránh deadlock) và lấy giá/tồn kho mới nhất
+    return {
+        product.pk: product
+        for product in Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk')
+    }
+
+
+def reserve_stock(reservation_key, cart_lines, replaces=None):
+    """
+    Giữ hàng cho đơn chờ chuyển khoản (reservation_key = order_code) trong RESERVATION_TTL.
+
+    Các dòng Product được khóa như khi đặt hàng, nên hai khách không thể cùng giữ phần hàng
+    cuối cùng: người đến sau nhận OutOfStockError ngay ở checkout thay vì sau khi đã chuyển khoản.
+    replaces: mã đơn chờ cũ của cùng khách (checkout lại) - giữ chỗ cũ được bỏ trước khi tính.
+    Trả về thời điểm hết hạn giữ hàng. Ném ReservationKeyInUseError nếu mã đơn trùng với giữ chỗ
+    còn hạn của đơn khác (mã đơn chỉ có 6 chữ số ngẫu nhiên): người gọi sinh mã mới và thử lại.
+    """
+    quantities = _cart_quantities(cart_lines)
+    product_ids = sorted(quantities)
+    expires_at = timezone.now() + RESERVATION_TTL
+
+    with transaction.atomic():
+        locked_products = _lock_products(product_ids)
+        release_reservation(replaces)
+        if StockReservation.objects.filter(reservation_key=reservation_key, expires_at__gt=timezone.now()).exists():
+            raise ReservationKeyInUseError(reservation_key)
+        held = held_quantities(product_ids)
+
+        for product_id in product_ids:
+            product = locked_products.get(product_id)
+            if product is None:
+                raise OutOfStockError(_line_product_name(cart_lines, product_id))
+            if product.stock - held.get(product_id, 0) < quantities[product_id]:
+                raise OutOfStockError(product.name)
+
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                product_id=product_id,
+                quantity=quantities[product_id],
+                reservation_key=reservation_key,
+                expires_at=expires_at,
+            )
+            for product_id in product_ids
+        ])
+
+    return expires_at
+
+
+def place_order(order_data, cart_lines, reservation_key=None):
+    """
+    Tạo đơn hàng từ các dòng giỏ hàng ({'product', 'quantity'}).
+
+    - Khóa các dòng Product liên quan theo thứ tự id tăng dần (tránh deadlock
+      khi nhiều người cùng mua các sản phẩm giống nhau).
+    - Trừ kho bằng UPDATE có điều kiện stock >= quantity + số lượng người khác đang giữ
+      (F-expression), nên không bao giờ bán vượt tồn kho hay lấn phần hàng đang được giữ
+      cho đơn chuyển khoản, kể cả khi có nhiều checkout đồng thời.
+    - reservation_key: mã đơn chờ thanh toán; giữ chỗ của chính đơn này không bị tính
+      và được bỏ sau khi trừ kho.
+    - Trừ 1 lượt dùng voucher (nếu có) bằng UPDATE có điều kiện (xem vouchers.redeem_voucher).
+    - Tạo toàn bộ OrderItem bằng 1 bulk_create.
+
+    Nếu một sản phẩm không đủ hàng thì ném OutOfStockError, voucher hết lượt thì ném
+    VoucherUnavailableError; toàn bộ transaction được rollback (không còn đơn hàng "mồ côi").
+    """
+    quantities = _cart_quantities(cart_lines)
+    product_ids = sorted(quantities)
+
+    with transaction.atomic():
+        locked_products = _lock_products(product_ids)
+        held = held_quantities(product_ids, exclude_key=reservation_key)
+
+        for product_id in product_ids:
+            product = locked_products.get(product_id)
+            if product is None:
+                raise OutOfStockError(_line_product_name(cart_lines, product_id))
+            updated = Product.objects.filter(
+                pk=product_id, stock__gte=quantities[product_id] + held.get(product_id, 0)
+            ).update(stock=F('stock') - quantities[product_id])
+            if not updated:
+                raise OutOfStockError(product.name)
+        release_reservation(reservation_key)
+
+        if order_data.get('voucher'):
+            user = order_data.get('user')
+            redeem_voucher(order_data['voucher'], user.pk if user else None)
+
+        order = Order.objects.create(**order_data)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=product_id,
+                quantity=quantities[product_id],
+                price_at_purchase=locked_products[product_id].price,
+            )
+            for product_id in product_ids
+        ])
+        # update() không phát signal: xóa cache của đúng các sản phẩm đã mua. Chỉ khi có sản phẩm
+        # hết hàng (nút mua / lưới sản phẩm đổi) mới đổi catalog version cho mọi trang.
+        invalidate_products_on_commit(product_ids)
+        transaction.on_commit(lambda: invalidate_product_pages(product_ids))
+        if any(locked_products[pk].stock <= quantities[pk] for pk in product_ids):
+            transaction.on_commit(bump_catalog_version)
+
+    return order
+
+
+def transition_orders(orders, new_status):
+    """
+    Chuyển hàng loạt đơn hàng (queryset) sang new_status với số query cố định:
+    1 SELECT các đơn cần đổi, 1 UPDATE, 1 job nền tạo thông báo - trong 1 transaction.
+    Bảng tổng hợp doanh thu được cập nhật khi đơn vào / rời trạng thái 'Hoàn thành'.
+    Trả về số đơn đã đổi trạng thái.
+
+    update() không phát signal, nên cache quyền đánh giá được xóa trực tiếp ở đây.
+    """
+    with transaction.atomic():
+        changed = list(
+            orders.exclude(status=new_status).select_for_update()
+            .only('id', 'user_id', 'order_code', 'status', 'created_at', 'total_price', 'discount_amount')
+            .order_by('pk')
+        )
+        if not changed:
+            return 0
+
+        Order.objects.filter(pk__in=[order.pk for order in changed]).update(status=new_status)
+
+        leaving_completed = [order for order in changed if order.status == COMPLETED_STATUS]
+        for order in changed:
+            order.status = new_status
+        if new_status == COMPLETED_STATUS:
+            apply_orders_to_rollups(changed, sign=1)
+        else:
+            apply_orders_to_rollups(leaving_completed, sign=-1)
+
+        notify_ids = [order.pk for order in changed if order.user_id]
+        if notify_ids:
+            enqueue('notify_order_status', {'order_ids': notify_ids, 'status': new_status})
+
+    invalidate_review_eligibility(*{order.user_id for order in changed if order.user_id})
+    return len(changed)
+
+
+def _line_product_name(cart_lines, product_id):
+    for line in cart_lines:
+        if line['product'].pk == product_id:
+            return line['product'].name
+    return str(product_id)
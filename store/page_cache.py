@@ -0,0 +1,120 @@
+# store/page_cache.py
+# Cache toàn trang cho khách chưa đăng nhập (home, chi tiết sản phẩm, trang giới thiệu) và
+# "phiên bản danh mục" dùng chung cho cache fragment lưới sản phẩm.
+#
+# Mọi key đều chứa catalog version; khi Product / Category / Review thay đổi (hoặc sản phẩm hết hàng
+# khi đặt hàng) chỉ cần đổi version là toàn bộ trang cũ hết hiệu lực, không phải xóa từng key.
+# Đơn hàng thường chỉ xóa trang chi tiết của sản phẩm đã mua (invalidate_product_pages); số tồn kho
+# trên trang danh sách có thể cũ tối đa PAGE_CACHE_TIMEOUT, giỏ hàng / đặt hàng luôn kiểm tra lại.
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.urls import reverse
+
+from .models import Category, Product, Review
+
+CATALOG_VERSION_KEY = 'catalog:version'
+# Thời gian sống của một trang đã cache (giây)
+PAGE_CACHE_TIMEOUT = 60 * 5
+# Các tham số GET làm thay đổi nội dung trang; tham số khác (utm_...) bị bỏ qua khi tạo key
+PAGE_CACHE_PARAMS = ('q', 'category', 'sort', 'page', 'pagination', 'cursor')
+
+
+def get_catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns, None)
+
+
+def bump_catalog_version():
+    # Dùng mốc thời gian thay vì incr(): không bị trùng version cũ nếu key từng bị cache đẩy ra
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def normalized_params(request):
+    """Chuỗi tham số đã chuẩn hóa: chỉ giữ PAGE_CACHE_PARAMS, bỏ giá trị rỗng, sắp xếp cố định."""
+    params = []
+    for name in PAGE_CACHE_PARAMS:
+        value = ' '.join(request.GET.get(name, '').split())
+        if not value or (name == 'page' and value == '1'):
+            continue
+        params.append((name, value))
+    return urlencode(params)
+
+
+def _page_key(path, params=''):
+    raw = f'{path}?{params}'
+    return f'page:{get_catalog_version()}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def page_cache_key(request):
+    return _page_key(request.path, normalized_params(request))
+
+
+def invalidate_product_pages(product_ids):
+    """Xóa trang chi tiết đã cache của các sản phẩm (không đổi catalog version)."""
+    cache.delete_many([_page_key(reverse('product_detail', args=[pk])) for pk in product_ids])
+
+
+def _is_anonymous_request(request):
+    # Không có cookie session -> chắc chắn chưa đăng nhập, không có giỏ hàng session hay
+    # thông báo flash, nên trang giống hệt nhau với mọi khách. Kiểm tra cookie (không chạm DB).
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and 'messages' not in request.COOKIES
+    )
+
+
+def _is_cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE') # trang có {% csrf_token %}
+        and not request.session.modified # view vừa ghi session (giỏ hàng, thông báo...)
+    )
+
+
+def cache_anonymous_page(view_func):
+    """Phục vụ trang từ cache cho khách chưa đăng nhập; người dùng đã đăng nhập luôn được render mới."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not _is_anonymous_request(request):
+            return view_func(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Page-Cache'] = 'HIT'
+            return response
+
+        response = view_func(request, *args, **kwargs)
+        if _is_cacheable_response(request, response):
+            cache.set(key, (response.content, response['Content-Type']), PAGE_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'MISS'
+        return response
+    return wrapper
+
+
+def grid_cache_key(request):
+    """Khóa cho fragment lưới sản phẩm ({% cache %} trong home.html) của trang đăng nhập."""
+    return hashlib.md5(normalized_params(request).encode()).hexdigest()
+
+
+# --- VÔ HIỆU HÓA ---
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog_pages(sender, raw=False, **kwargs):
+    if not raw:
+        bump_catalog_version()
@@ -0,0 +1,131 @@
+# store/pagination.py
+# Phân trang theo con trỏ (keyset) cho danh mục sản phẩm: mỗi trang chỉ là 1 query
+# "WHERE (price, id) > (...) ORDER BY price, id LIMIT n", không COUNT(*) và không OFFSET,
+# nên trang sâu vẫn nhanh như trang đầu.
+import base64
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+
+# Thứ tự sắp xếp hỗ trợ keyset (luôn có id để thứ tự ổn định)
+KEYSET_ORDERINGS = {
+    '-id': ('-id',),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+}
+
+# Giới hạn của cột id (bigint) và price (max_digits=10); con trỏ vượt mức này là con trỏ bị sửa
+MAX_CURSOR_ID = 2 ** 63 - 1
+MAX_CURSOR_PRICE = Decimal(10) ** 10
+
+# Thời gian cache số lượng ước tính (giây)
+APPROXIMATE_COUNT_TIMEOUT = 60 * 5
+
+
+def encode_cursor(sort_by, product):
+    """Mã hóa vị trí (sort, price, id) thành chuỗi mờ, an toàn cho URL."""
+    raw = json.dumps([sort_by, str(product.price), product.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(sort_by, token):
+    """Giải mã con trỏ; trả về (price, id) hoặc None nếu không hợp lệ / khác kiểu sắp xếp."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_sort, price, product_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if cursor_sort != sort_by:
+            return None
+        price, product_id = Decimal(price), int(product_id)
+    except (ValueError, TypeError, InvalidOperation):
+        return None
+    # Con trỏ do client gửi lên: NaN/Infinity hay số ngoài phạm vi của cột làm query lỗi
+    if not price.is_finite() or abs(price) >= MAX_CURSOR_PRICE or not 0 < product_id <= MAX_CURSOR_ID:
+        return None
+    return price, product_id
+
+
+def _after(sort_by, price, product_id):
+    if sort_by == 'price_asc':
+        return Q(price__gt=price) | Q(price=price, id__gt=product_id)
+    if sort_by == 'price_desc':
+        return Q(price__lt=price) | Q(price=price, id__lt=product_id)
+    return Q(id__lt=product_id)
+
+
+def approximate_count(queryset):
+    """
+    Tổng số bản ghi ước tính, không chạy COUNT(*) ở mỗi request:
+    - PostgreSQL, không có bộ lọc: đọc pg_class.reltuples (thống kê của planner).
+    - Trường hợp khác: COUNT(*) thật nhưng được cache vài phút theo câu truy vấn.
+    """
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = 'approx_count:' + hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, APPROXIMATE_COUNT_TIMEOUT)
+    return count
+
+
+class KeysetPage:
+    """Một trang kết quả keyset; duyệt được trong template giống Page của Paginator."""
+
+    def __init__(self, object_list, has_next, next_cursor, is_first, approximate_count):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.is_first = is_first
+        self.approximate_count = approximate_count
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return not self.is_first
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def keyset_paginate(queryset, sort_by, cursor, per_page):
+    """Lấy 1 trang sau con trỏ `cursor` (None = trang đầu) theo kiểu sắp xếp sort_by."""
+    position = decode_cursor(sort_by, cursor)
+    page_queryset = queryset.order_by(*KEYSET_ORDERINGS[sort_by])
+    if position is not None:
+        page_queryset = page_queryset.filter(_after(sort_by, *position))
+
+    # Lấy dư 1 bản ghi để biết còn trang sau hay không
+    rows = list(page_queryset[:per_page + 1])
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(sort_by, rows[-1]) if has_next else None
+
+    return KeysetPage(
+        rows,
+        has_next=has_next,
+        next_cursor=next_cursor,
+        is_first=position is None,
+        approximate_count=approximate_count(queryset),
+    )
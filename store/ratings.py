@@ -0,0 +1,69 @@
+# store/ratings.py
+# Duy trì thống kê đánh giá trên Product (review_count, rating_sum, histogram 1-5 sao)
+# bằng các UPDATE nguyên tử với F(), để trang chi tiết và danh sách không cần aggregate.
+from django.db.models import Count, F, Q, Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product, Review
+
+RATING_FIELDS = ['review_count', 'rating_sum'] + [f'rating_{star}_count' for star in range(1, 6)]
+
+
+def _apply_rating_delta(product_id, rating, sign):
+    """Cộng (sign=1) hoặc trừ (sign=-1) một lượt đánh giá `rating` sao vào sản phẩm."""
+    Product.objects.filter(pk=product_id).update(**{
+        'review_count': F('review_count') + sign,
+        'rating_sum': F('rating_sum') + sign * rating,
+        f'rating_{rating}_count': F(f'rating_{rating}_count') + sign,
+    })
+
+
+def recalculate_product_ratings(product_ids=None):
+    """
+    Tính lại thống kê từ bảng Review (1 query GROUP BY) và ghi các sản phẩm bị lệch
+    bằng bulk_update. product_ids=None nghĩa là toàn bộ sản phẩm. Trả về số sản phẩm đã sửa.
+    """
+    reviews = Review.objects.order_by()
+    products = Product.objects.only('id', *RATING_FIELDS)
+    if product_ids is not None:
+        reviews = reviews.filter(product_id__in=product_ids)
+        products = products.filter(pk__in=product_ids)
+
+    stats = {
+        row['product_id']: row
+        for row in reviews.values('product_id').annotate(
+            review_count=Count('id'),
+            rating_sum=Sum('rating'),
+            **{f'rating_{star}_count': Count('id', filter=Q(rating=star)) for star in range(1, 6)},
+        )
+    }
+
+    drifted = []
+    for product in products.iterator(chunk_size=2000):
+        row = stats.get(product.pk, {})
+        expected = {field: row.get(field) or 0 for field in RATING_FIELDS}
+        if any(getattr(product, field) != value for field, value in expected.items()):
+            for field, value in expected.items():
+                setattr(product, field, value)
+            drifted.append(product)
+
+    Product.objects.bulk_update(drifted, RATING_FIELDS, batch_size=1000)
+    return len(drifted)
+
+
+# --- SIGNALS ---
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _apply_rating_delta(instance.product_id, instance.rating, 1)
+    else:
+        # Sửa đánh giá (admin) hiếm gặp: tính lại chính xác cho sản phẩm này
+        recalculate_product_ratings([instance.product_id])
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    _apply_rating_delta(instance.product_id, instance.rating, -1)
@@ -0,0 +1,184 @@
+# store/realtime.py
+# Pub/sub cho thông báo thời gian thực (Server-Sent Events, xem users.views.notification_stream).
+#
+# Backend được chọn bằng settings.REALTIME_BROKER (đường dẫn class). Mỗi backend có:
+# - publish(channel, message): gọi được từ code đồng bộ ở bất kỳ luồng nào,
+# - subscribe(channel): trả về Subscription dùng trong "async with", có "await sub.get()".
+#
+# Trong mỗi tiến trình web, mỗi kết nối SSE là 1 asyncio.Queue nhỏ: không có thread hay query
+# nào cho từng kết nối đang chờ.
+# - InProcessBroker chỉ chuyển tin trong cùng tiến trình (dev với SQLite, test).
+# - PostgresBroker (mặc định khi DB là PostgreSQL) chuyển tin giữa các tiến trình bằng
+#   LISTEN/NOTIFY: worker run_jobs hay tiến trình web khác publish bằng NOTIFY, mỗi tiến trình
+#   web có 1 thread LISTEN (1 kết nối DB riêng) phát tin tới các kết nối SSE của nó.
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Số tin tối đa chờ trong hàng đợi của 1 kết nối; kết nối quá chậm bị bỏ tin cũ nhất
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+# Kênh NOTIFY chung; channel của ứng dụng nằm trong payload (payload tối đa 8000 byte)
+PG_NOTIFY_CHANNEL = 'store_realtime'
+# Thread LISTEN thức dậy định kỳ để phát hiện kết nối hỏng; chờ trước khi kết nối lại
+PG_LISTEN_POLL_SECONDS = 30
+PG_RECONNECT_SECONDS = 5
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def user_channel(user_id):
+    return f'notifications:{user_id}'
+
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    async def __aenter__(self):
+        self.broker._add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.broker._remove(self)
+
+    def deliver(self, message):
+        # Chạy trên event loop của kết nối (được gọi qua call_soon_threadsafe)
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        return Subscription(self, channel)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                self._remove(subscription) # Event loop đã đóng
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.channel].add(subscription)
+
+    def _remove(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Pub/sub liên tiến trình qua PostgreSQL LISTEN/NOTIFY (psycopg2). NOTIFY trong transaction
+    chỉ được gửi khi commit, nên tin của transaction bị rollback không bao giờ tới client.
+    Thread LISTEN cần kết nối phiên trực tiếp tới PostgreSQL (PgBouncer ở chế độ transaction
+    không hỗ trợ LISTEN): đặt settings.REALTIME_LISTEN_DATABASE là alias của kết nối đó.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, channel, message):
+        payload = json.dumps({'channel': channel, 'message': message}, ensure_ascii=False)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [PG_NOTIFY_CHANNEL, payload])
+
+    def _add(self, subscription):
+        super()._add(subscription)
+        # Chỉ tiến trình có kết nối SSE mới cần LISTEN (worker run_jobs chỉ publish)
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='realtime-listen', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            db = connections.create_connection(settings.REALTIME_LISTEN_DATABASE)
+            try:
+                db.ensure_connection() # autocommit: LISTEN có hiệu lực ngay
+                raw = db.connection
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN {PG_NOTIFY_CHANNEL}')
+                while True:
+                    if not select.select([raw], [], [], PG_LISTEN_POLL_SECONDS)[0]:
+                        with raw.cursor() as cursor:
+                            cursor.execute('SELECT 1') # Kết nối hỏng -> ném lỗi, kết nối lại
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self._dispatch(raw.notifies.pop(0).payload)
+            except Exception:
+                logger.exception('Mất kết nối LISTEN, thử lại sau %s giây', PG_RECONNECT_SECONDS)
+                time.sleep(PG_RECONNECT_SECONDS)
+            finally:
+                db.close()
+
+    def _dispatch(self, payload):
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            logger.warning('Bỏ qua NOTIFY không hợp lệ: %s', payload)
+            return
+        super().publish(data['channel'], data['message'])
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+async def event_stream(channel, initial_events=()):
+    """
+    Luồng Server-Sent Events cho 1 kết nối: gửi initial_events [(event, data)], sau đó mọi tin
+    publish vào channel (event 'notification'). Khi không có tin, gửi dòng chú thích ": ping"
+    mỗi REALTIME_HEARTBEAT_SECONDS giây. Client ngắt kết nối -> ASGI hủy generator và
+    subscription được gỡ trong __aexit__.
+    """
+    async with get_broker().subscribe(channel) as subscription:
+        for event, data in initial_events:
+            yield format_event(event, data)
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), settings.REALTIME_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield format_event('notification', message)
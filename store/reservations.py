@@ -0,0 +1,59 @@
+# store/reservations.py
+# Giữ hàng tạm (StockReservation) cho đơn chờ chuyển khoản QR.
+#
+# Khi khách chọn QR ở checkout, orders.reserve_stock() giữ số lượng trong RESERVATION_TTL;
+# trong thời gian đó người khác chỉ mua được phần "có thể bán" = stock - tổng giữ chỗ còn hạn.
+# Giữ chỗ hết hạn không được tính nữa (lọc theo expires_at), nên lệnh dọn
+# release_expired_reservations chỉ để bảng không phình ra, không ảnh hưởng tính đúng đắn.
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import StockReservation
+
+# Thời gian giữ hàng cho khách chuyển khoản và tải ảnh minh chứng
+RESERVATION_TTL = timedelta(minutes=15)
+# Số dòng xóa mỗi lần khi dọn giữ chỗ hết hạn (tránh khóa bảng lâu)
+RELEASE_BATCH_SIZE = 5000
+
+
+def active_reservations(product_ids, exclude_key=None):
+    """Giữ chỗ còn hạn của các sản phẩm, bỏ qua giữ chỗ của chính đơn exclude_key."""
+    reservations = StockReservation.objects.filter(product_id__in=product_ids, expires_at__gt=timezone.now())
+    if exclude_key:
+        reservations = reservations.exclude(reservation_key=exclude_key)
+    return reservations
+
+
+def held_quantities(product_ids, exclude_key=None):
+    """Dict {product_id: tổng số lượng đang giữ} (1 query); sản phẩm không có giữ chỗ không có trong dict."""
+    rows = (
+        active_reservations(product_ids, exclude_key)
+        .values('product_id')
+        .annotate(held=Sum('quantity'))
+        .values_list('product_id', 'held')
+    )
+    return dict(rows)
+
+
+def release_reservation(reservation_key):
+    """Bỏ giữ chỗ của một đơn (đã đặt hàng xong, hoặc khách checkout lại)."""
+    if not reservation_key:
+        return 0
+    deleted, _ = StockReservation.objects.filter(reservation_key=reservation_key).delete()
+    return deleted
+
+
+def release_expired_reservations(batch_size=RELEASE_BATCH_SIZE):
+    """Xóa các giữ chỗ đã hết hạn theo từng lô; trả về tổng số dòng đã xóa."""
+    now = timezone.now()
+    total = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        deleted, _ = StockReservation.objects.filter(pk__in=ids).delete()
+        total += deleted
@@ -0,0 +1,109 @@
+# store/rollups.py
+# Bảng tổng hợp doanh thu theo ngày (DailySales) và theo ngày + sản phẩm (DailyProductSales).
+# Cập nhật dần khi đơn chuyển sang / rời trạng thái 'Hoàn thành', nên Dashboard chỉ đọc
+# vài dòng tổng hợp thay vì quét toàn bộ Order/OrderItem.
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import COMPLETED_STATUS, Order, OrderItem, DailySales, DailyProductSales
+
+
+def _order_date(order):
+    # Gom theo ngày đặt hàng (giờ địa phương), giống bộ lọc created_at của Dashboard cũ
+    return timezone.localdate(order.created_at)
+
+
+def apply_orders_to_rollups(orders, sign=1):
+    """Cộng (sign=1) hoặc trừ (sign=-1) các đơn hoàn thành vào bảng tổng hợp."""
+    orders = list(orders)
+    if not orders:
+        return
+    order_dates = {order.pk: _order_date(order) for order in orders}
+
+    daily = {}
+    for order in orders:
+        row = daily.setdefault(order_dates[order.pk], {'order_count': 0, 'revenue': 0})
+        row['order_count'] += 1
+        row['revenue'] += order.total_price - order.discount_amount
+
+    per_product = {}
+    item_rows = OrderItem.objects.filter(order_id__in=order_dates).values('order_id', 'product_id', 'quantity', 'price_at_purchase')
+    for item in item_rows:
+        row = per_product.setdefault((order_dates[item['order_id']], item['product_id']), {'quantity': 0, 'revenue': 0})
+        row['quantity'] += item['quantity']
+        row['revenue'] += item['quantity'] * item['price_at_purchase']
+
+    with transaction.atomic():
+        # Đảm bảo các dòng tổng hợp tồn tại, rồi cộng dồn bằng F() (an toàn khi chạy đồng thời)
+        DailySales.objects.bulk_create([DailySales(date=date) for date in daily], ignore_conflicts=True)
+        for date, row in daily.items():
+            DailySales.objects.filter(date=date).update(
+                order_count=F('order_count') + sign * row['order_count'],
+                revenue=F('revenue') + sign * row['revenue'],
+            )
+
+        DailyProductSales.objects.bulk_create(
+            [DailyProductSales(date=date, product_id=product_id) for date, product_id in per_product],
+            ignore_conflicts=True,
+        )
+        for (date, product_id), row in per_product.items():
+            DailyProductSales.objects.filter(date=date, product_id=product_id).update(
+                quantity=F('quantity') + sign * row['quantity'],
+                revenue=F('revenue') + sign * row['revenue'],
+            )
+
+
+def rebuild_rollups():
+    """Xóa và dựng lại toàn bộ bảng tổng hợp từ các đơn hoàn thành (dùng cho backfill)."""
+    tz = timezone.get_current_timezone()
+    completed = Order.objects.filter(status=COMPLETED_STATUS)
+
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+
+        daily_rows = completed.annotate(day=TruncDate('created_at', tzinfo=tz)).values('day').annotate(
+            order_count_total=Count('id'), revenue_total=Sum(F('total_price') - F('discount_amount'))
+        ).order_by()
+        DailySales.objects.bulk_create([
+            DailySales(date=row['day'], order_count=row['order_count_total'], revenue=row['revenue_total'] or 0)
+            for row in daily_rows
+        ], batch_size=1000)
+
+        product_rows = OrderItem.objects.filter(order__in=completed).annotate(
+            day=TruncDate('order__created_at', tzinfo=tz)
+        ).values('day', 'product_id').annotate(
+            quantity_total=Sum('quantity'), revenue_total=Sum(F('quantity') * F('price_at_purchase'))
+        ).order_by()
+        DailyProductSales.objects.bulk_create([
+            DailyProductSales(
+                date=row['day'], product_id=row['product_id'],
+                quantity=row['quantity_total'], revenue=row['revenue_total'] or 0,
+            )
+            for row in product_rows
+        ], batch_size=1000)
+
+
+# --- SIGNAL: Đơn chuyển sang / rời trạng thái 'Hoàn thành' ---
+@receiver(post_save, sender=Order)
+def update_rollups_on_status_change(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_status = None if created else getattr(instance, '_old_status', None)
+    if old_status == instance.status:
+        return
+    if instance.status == COMPLETED_STATUS:
+        apply_orders_to_rollups([instance], sign=1)
+    elif old_status == COMPLETED_STATUS:
+        apply_orders_to_rollups([instance], sign=-1)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_deleted_order_from_rollups(sender, instance, **kwargs):
+    # pre_delete: OrderItem vẫn còn trong DB để trừ theo từng sản phẩm
+    if instance.status == COMPLETED_STATUS:
+        apply_orders_to_rollups([instance], sign=-1)
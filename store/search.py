@@ -0,0 +1,265 @@
+# store/search.py
+# Tìm kiếm toàn văn cho sản phẩm (tên, mô tả, danh mục), có xếp hạng và bỏ dấu tiếng Việt.
+#
+# - PostgreSQL: bảng store_product_search chứa cột tsvector (trọng số A/B/C) + GIN index.
+# - SQLite: bảng ảo FTS5 store_product_fts, xếp hạng bằng bm25().
+# - CSDL khác: quay về icontains (không xếp hạng).
+#
+# Văn bản được chuẩn hóa (bỏ dấu, chữ thường) bằng normalize_text() cả khi ghi index lẫn khi
+# tìm, nên "giay" khớp "Giày" trên mọi backend. Index được đồng bộ qua signal của Product và
+# Category; sau các thao tác bulk (seed_data...) chạy: python manage.py rebuild_search_index
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Category, Product
+
+# Số kết quả tối đa (đã xếp hạng) trả về cho một truy vấn sắp theo mức độ liên quan.
+# Các kiểu sắp xếp khác lọc bằng search_filter() (subquery), không bị giới hạn này.
+SEARCH_RESULT_LIMIT = 1000
+# Kích thước lô khi dựng lại index
+REBUILD_BATCH_SIZE = 2000
+
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_text(text):
+    """Bỏ dấu tiếng Việt, chuyển chữ thường, chỉ giữ chữ/số: 'Giày Đá' -> 'giay da'."""
+    if not text:
+        return ''
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    return _NON_WORD_RE.sub(' ', text.lower()).strip()
+
+
+def _query_terms(query):
+    return normalize_text(query).split()
+
+
+# --- CÁC BACKEND ---
+class PostgresSearchBackend:
+    table = 'store_product_search'
+
+    def index_rows(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {self.table} (product_id, category_id, document) VALUES ("
+            "%s, %s, "
+            "setweight(to_tsvector('simple', %s), 'A') || "
+            "setweight(to_tsvector('simple', %s), 'B') || "
+            "setweight(to_tsvector('simple', %s), 'C')) "
+            "ON CONFLICT (product_id) DO UPDATE "
+            "SET category_id = EXCLUDED.category_id, document = EXCLUDED.document",
+            [
+                (product_id, category_id, normalize_text(name), normalize_text(category_name), normalize_text(description))
+                for product_id, category_id, name, description, category_name in rows
+            ],
+        )
+
+    def remove(self, cursor, product_id):
+        cursor.execute(f"DELETE FROM {self.table} WHERE product_id = %s", [product_id])
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {self.table}")
+
+    def _ts_query(self, terms):
+        # Mỗi từ khóa tìm theo tiền tố: "gia" khớp "giay"
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def match_sql(self, terms, category_id):
+        """(sql, params) của câu SELECT product_id khớp truy vấn, chưa sắp xếp."""
+        sql = (
+            f"SELECT product_id FROM {self.table} "
+            "WHERE document @@ to_tsquery('simple', %s)"
+        )
+        params = [self._ts_query(terms)]
+        if category_id:
+            sql += " AND category_id = %s"
+            params.append(category_id)
+        return sql, params
+
+    def search(self, cursor, terms, category_id, limit):
+        sql, params = self.match_sql(terms, category_id)
+        sql += " ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC, product_id DESC LIMIT %s"
+        params += [self._ts_query(terms), limit]
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteFTSBackend:
+    table = 'store_product_fts'
+
+    def index_rows(self, cursor, rows):
+        rows = list(rows)
+        cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {self.table} (rowid, name, category, description, category_id) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [
+                (product_id, normalize_text(name), normalize_text(category_name), normalize_text(description), category_id)
+                for product_id, category_id, name, description, category_name in rows
+            ],
+        )
+
+    def remove(self, cursor, product_id):
+        cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [product_id])
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {self.table}")
+
+    def match_sql(self, terms, category_id):
+        """(sql, params) của câu SELECT rowid (= product id) khớp truy vấn, chưa sắp xếp."""
+        match = ' '.join(f'"{term}"*' for term in terms)
+        sql = f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s"
+        params = [match]
+        if category_id:
+            sql += " AND category_id = %s"
+            params.append(category_id)
+        return sql, params
+
+    def search(self, cursor, terms, category_id, limit):
+        sql, params = self.match_sql(terms, category_id)
+        # bm25 càng nhỏ càng liên quan; trọng số cột: name > category > description
+        sql += f" ORDER BY bm25({self.table}, 10.0, 5.0, 1.0), rowid DESC LIMIT %s"
+        params.append(limit)
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_search_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return None
+
+
+# --- API DÙNG TRONG VIEWS ---
+def search_product_ids(query, category_id=None, limit=SEARCH_RESULT_LIMIT):
+    """
+    Trả về danh sách id sản phẩm khớp với query, đã sắp xếp theo mức độ liên quan
+    (tối đa limit kết quả tốt nhất).
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return []
+    category_id = int(category_id) if category_id else None
+
+    backend = get_search_backend()
+    if backend is None:
+        products = Product.objects.filter(search_filter(query, category_id))
+        return list(products.order_by('-id').values_list('id', flat=True)[:limit])
+
+    with connection.cursor() as cursor:
+        return backend.search(cursor, terms, category_id, limit)
+
+
+def search_filter(query, category_id=None):
+    """
+    Điều kiện Q lọc Product theo query, không xếp hạng và không giới hạn số kết quả: dùng khi
+    sắp xếp theo giá / mới nhất / đánh giá. Index được dùng như subquery "id IN (...)" trong
+    cùng câu SQL phân trang, nên mọi sản phẩm khớp đều được sắp xếp chứ không chỉ
+    SEARCH_RESULT_LIMIT sản phẩm liên quan nhất.
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return Q(pk__in=[])
+    category_id = int(category_id) if category_id else None
+
+    backend = get_search_backend()
+    if backend is None:
+        # Fallback: không có index toàn văn
+        condition = Q()
+        for term in query.split():
+            condition &= Q(name__icontains=term) | Q(description__icontains=term) | Q(category__name__icontains=term)
+        if category_id:
+            condition &= Q(category_id=category_id)
+        return condition
+
+    sql, params = backend.match_sql(terms, category_id)
+    return Q(id__in=RawSQL(sql, params))
+
+
+class RankedProductList:
+    """
+    Danh sách sản phẩm theo thứ tự xếp hạng, dùng được với Paginator.
+    Chỉ truy vấn các sản phẩm của trang đang xem (1 query in_bulk mỗi trang).
+    """
+
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            page_ids = self.product_ids[index]
+            products = Product.objects.in_bulk(page_ids)
+            return [products[product_id] for product_id in page_ids if product_id in products]
+        return Product.objects.get(pk=self.product_ids[index])
+
+
+# --- ĐỒNG BỘ INDEX ---
+def _product_rows(products):
+    return products.values_list('id', 'category_id', 'name', 'description', 'category__name')
+
+
+def index_products(products):
+    """Ghi (hoặc ghi đè) các sản phẩm của queryset vào index tìm kiếm."""
+    backend = get_search_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.index_rows(cursor, _product_rows(products))
+
+
+def rebuild_search_index(batch_size=REBUILD_BATCH_SIZE):
+    """Xóa và dựng lại toàn bộ index theo từng lô. Trả về số sản phẩm đã index."""
+    backend = get_search_backend()
+    if backend is None:
+        return 0
+
+    total = 0
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+        batch = []
+        for row in _product_rows(Product.objects.order_by('id')).iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                backend.index_rows(cursor, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            backend.index_rows(cursor, batch)
+            total += len(batch)
+    return total
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_products(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    backend = get_search_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.remove(cursor, instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, raw=False, **kwargs):
+    # Đổi tên danh mục -> cập nhật lại index của các sản phẩm thuộc danh mục
+    if raw or created:
+        return
+    index_products(Product.objects.filter(category=instance))
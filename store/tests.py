@@ -1,3 +1,526 @@
-from django.test import TestCase
+import base64
+import itertools
+import json
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from store.cart import merge_session_cart
+from store.instrumentation import QueryBudgetExceeded, QueryInstrumentationMiddleware, query_budget
+from store.jobs import JOB_BACKOFF_BASE, JOB_LOCK_TIMEOUT, UnknownJobError, enqueue, job, run_pending_jobs
+from store.models import Cart, CartItem, Category, Job, Notification, Order, Product, StockReservation, Voucher
+from store.orders import OutOfStockError, ReservationKeyInUseError, place_order, reserve_stock
+from store.page_cache import get_catalog_version
+from store.pagination import decode_cursor, encode_cursor, keyset_paginate
+from store.reservations import held_quantities, release_expired_reservations
+from store.search import normalize_text, search_filter, search_product_ids
+from store.vouchers import VoucherUnavailableError, redeem_voucher
+
+CHECKOUT_FORM = {
+    'action': 'place_order', 'full_name': 'Khach Hang', 'email': 'khach@example.com',
+    'phone': '0900000000', 'address': '1 Le Loi',
+}
+# Thông tin giao hàng truyền thẳng vào place_order()
+ORDER_DATA = {key: value for key, value in CHECKOUT_FORM.items() if key != 'action'}
+
+
+def run_concurrently(func, count):
+    """Chạy func() trên count luồng cùng lúc; trả về list kết quả (hoặc exception) của từng luồng."""
+    barrier = threading.Barrier(count)
+    results = []
+
+    def worker():
+        try:
+            barrier.wait()
+            results.append(func())
+        except Exception as exc:
+            results.append(exc)
+        finally:
+            connection.close() # Mỗi luồng có kết nối DB riêng
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def make_voucher(**kwargs):
+    now = timezone.now()
+    return Voucher.objects.create(**{
+        'code': 'GIAM10', 'discount_amount': 10000,
+        'valid_from': now - timedelta(days=1), 'valid_to': now + timedelta(days=1),
+        **kwargs,
+    })
+
+
+class CheckoutReservationTests(TestCase):
+    """Giữ hàng của đơn chờ QR thuộc về chính khách đó khi khách đổi sang COD."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('khachhang', 'khach@example.com', 'Matkhau-an-toan-123')
+        category = Category.objects.create(name='Giày')
+        self.product = Product.objects.create(name='Giày chạy bộ', price=500000, stock=2, category=category)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client.force_login(self.user)
+
+    def test_switch_from_qr_to_cod_uses_own_hold(self):
+        self.client.post(reverse('checkout'), {**CHECKOUT_FORM, 'payment_method': 'qr'})
+        pending_code = self.client.session['pending_order']['order_code']
+        self.assertEqual(StockReservation.objects.filter(reservation_key=pending_code).count(), 1)
+
+        response = self.client.post(reverse('checkout'), {**CHECKOUT_FORM, 'payment_method': 'cod'})
+
+        self.assertRedirects(response, reverse('order_success'), fetch_redirect_response=False)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Order.objects.filter(user=self.user, payment_method='cod').count(), 1)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertNotIn('pending_order', self.client.session)
+
+
+def png_upload(name='proof.png'):
+    output = BytesIO()
+    Image.new('RGB', (4, 4), 'white').save(output, 'PNG')
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+
+
+class PaymentInfoVoucherTests(TestCase):
+    """Đơn QR được tạo sau khi khách tải ảnh; voucher có thể đã mất hiệu lực từ lúc checkout."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_user('khachhang', 'khach@example.com', 'Matkhau-an-toan-123')
+        category = Category.objects.create(name='Giày')
+        product = Product.objects.create(name='Giày chạy bộ', price=500000, stock=5, category=category)
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=product, quantity=1)
+        self.voucher = make_voucher()
+        self.client.force_login(self.user)
+
+    def test_deleted_voucher_sends_buyer_back_to_checkout(self):
+        self.client.post(reverse('checkout'), {'action': 'apply_voucher', 'voucher_code_input': 'giam10'})
+        self.client.post(reverse('checkout'), {**CHECKOUT_FORM, 'payment_method': 'qr'})
+        pending_order = self.client.session['pending_order']
+        self.assertEqual(pending_order['discount_amount'], 10000)
+
+        self.voucher.delete()
+        response = self.client.post(
+            reverse('payment_info', kwargs={'order_code': pending_order['order_code']}),
+            {'payment_proof': png_upload()},
+        )
+
+        self.assertRedirects(response, reverse('checkout'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertNotIn('voucher_code', self.client.session)
+
+
+class VoucherRedemptionTests(TestCase):
+    """Giới hạn lượt dùng được kiểm tra bằng UPDATE có điều kiện khi đặt hàng."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('khach1', 'khach1@example.com', 'Matkhau-an-toan-123')
+        self.other_user = User.objects.create_user('khach2', 'khach2@example.com', 'Matkhau-an-toan-123')
+
+    def test_global_limit(self):
+        voucher = make_voucher(usage_limit=2)
+        redeem_voucher(voucher)
+        redeem_voucher(voucher, self.user.pk)
+        with self.assertRaises(VoucherUnavailableError):
+            redeem_voucher(voucher, self.other_user.pk)
+        voucher.refresh_from_db()
+        self.assertEqual(voucher.used_count, 2)
+
+    def test_per_user_limit(self):
+        voucher = make_voucher(usage_limit_per_user=1)
+        redeem_voucher(voucher, self.user.pk)
+        with self.assertRaises(VoucherUnavailableError), transaction.atomic():
+            redeem_voucher(voucher, self.user.pk)
+        redeem_voucher(voucher, self.other_user.pk)
+        voucher.refresh_from_db()
+        self.assertEqual(voucher.used_count, 2)
+
+    def test_per_user_limit_rejects_guests(self):
+        voucher = make_voucher(usage_limit_per_user=1)
+        self.assertFalse(voucher.is_valid(1000000, AnonymousUser())[0])
+        with self.assertRaises(VoucherUnavailableError):
+            redeem_voucher(voucher)
+        voucher.refresh_from_db()
+        self.assertEqual(voucher.used_count, 0)
+
+    def test_stale_save_keeps_concurrent_redemptions(self):
+        # Admin nạp voucher, trong lúc đó có đơn hàng dùng mã, rồi admin lưu lại
+        voucher = make_voucher(usage_limit=5)
+        loaded_in_admin = Voucher.objects.get(pk=voucher.pk)
+        redeem_voucher(voucher)
+        loaded_in_admin.discount_amount = 20000
+        loaded_in_admin.save()
+        voucher.refresh_from_db()
+        self.assertEqual(voucher.used_count, 1)
+        self.assertEqual(voucher.discount_amount, 20000)
+
+
+class VoucherConcurrencyTests(TransactionTestCase):
+    def test_last_redemption_goes_to_one_buyer(self):
+        voucher = make_voucher(usage_limit=1)
+
+        def redeem():
+            with transaction.atomic():
+                redeem_voucher(Voucher.objects.get(pk=voucher.pk))
+            return True
+
+        results = run_concurrently(redeem, 8)
+        self.assertEqual(results.count(True), 1)
+        self.assertTrue(all(isinstance(r, VoucherUnavailableError) for r in results if r is not True))
+        voucher.refresh_from_db()
+        self.assertEqual(voucher.used_count, 1)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Nhiều khách cùng mua 1 sản phẩm sắp hết: không bao giờ bán vượt tồn kho."""
+
+    def test_hot_sku_is_never_oversold(self):
+        category = Category.objects.create(name='Giày')
+        product = Product.objects.create(name='Giày hot', price=500000, stock=5, category=category)
+        order_numbers = itertools.count(1)
+
+        def buy():
+            return place_order({
+                **ORDER_DATA,
+                'total_price': 500000, 'payment_method': 'cod',
+                'order_code': f'DH{next(order_numbers):06d}',
+            }, [{'product': product, 'quantity': 1}])
+
+        results = run_concurrently(buy, 20)
+
+        product.refresh_from_db()
+        orders = [r for r in results if isinstance(r, Order)]
+        self.assertGreaterEqual(product.stock, 0)
+        self.assertLessEqual(Order.objects.count(), 5)
+        self.assertEqual(len(orders), 5)
+        self.assertEqual(product.stock, 0)
+        self.assertTrue(all(isinstance(r, OutOfStockError) for r in results if not isinstance(r, Order)))
+
+
+class QueryInstrumentationTests(TestCase):
+    def run_view(self, view):
+        # Gọi middleware như Django: process_view trước, rồi tới view
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = QueryInstrumentationMiddleware(get_response)
+        return middleware(RequestFactory().get('/thu-ngan-sach/'))
+
+    def test_tests_run_in_strict_mode(self):
+        self.assertTrue(settings.QUERY_BUDGET_STRICT)
+
+    def test_budget_overrun_raises(self):
+        @query_budget(1)
+        def view(request):
+            User.objects.count()
+            User.objects.count()
+            return HttpResponse()
+
+        with self.assertRaises(QueryBudgetExceeded):
+            self.run_view(view)
+
+    def test_within_budget_sets_server_timing(self):
+        @query_budget(1)
+        def view(request):
+            User.objects.count()
+            return HttpResponse()
+
+        response = self.run_view(view)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries", app;dur=')
+
+
+class MergeSessionCartTests(TestCase):
+    """Gộp giỏ session khi đăng nhập tốn số query cố định, không phụ thuộc số dòng."""
+
+    def setUp(self):
+        category = Category.objects.create(name='Giày')
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Giày {i}', price=100000, stock=3, category=category) for i in range(40)
+        ])
+
+    def merge_queries(self, username, product_count):
+        user = User.objects.create_user(username)
+        cart = Cart.objects.create(user=user)
+        # Một nửa số sản phẩm đã có trong giỏ DB (cộng dồn), nửa còn lại là dòng mới
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=2) for product in self.products[:product_count // 2]
+        ])
+        session_cart = {str(product.pk): 2 for product in self.products[:product_count]}
+        with CaptureQueriesContext(connection) as queries:
+            merge_session_cart(user, session_cart)
+        return len(queries), cart
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        small, _ = self.merge_queries('khach_it', 4)
+        large, cart = self.merge_queries('khach_nhieu', 40)
+        self.assertEqual(small, large)
+        # SAVEPOINT, Cart, tồn kho, dòng đã có, bulk_create, bulk_update, RELEASE, tóm tắt giỏ
+        self.assertEqual(large, 8)
+        # Cộng dồn nhưng không vượt tồn kho (3)
+        quantities = set(cart.cart_items.values_list('quantity', flat=True))
+        self.assertEqual(quantities, {2, 3})
+        self.assertEqual(cart.cart_items.count(), 40)
+
+
+class ProductSearchTests(TestCase):
+    """Tìm kiếm không phân biệt dấu; index đi theo tên sản phẩm / danh mục."""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Giày Đá Bóng')
+        self.shoe = Product.objects.create(name='Giày Nike Đỏ', price=900000, category=self.category)
+        self.shirt = Product.objects.create(
+            name='Áo thun', description='Vải cotton', price=150000, category=Category.objects.create(name='Áo'),
+        )
+
+    def test_normalize_text_folds_vietnamese_accents(self):
+        self.assertEqual(normalize_text('Giày Đá Bóng!'), 'giay da bong')
+
+    def test_search_ignores_accents(self):
+        self.assertEqual(search_product_ids('giay do'), [self.shoe.pk])
+        self.assertEqual(search_product_ids('GIÀY'), [self.shoe.pk])
+        self.assertEqual(search_product_ids('ao'), [self.shirt.pk])
+
+    def test_search_matches_category_name(self):
+        self.assertEqual(list(Product.objects.filter(search_filter('bong')).values_list('pk', flat=True)), [self.shoe.pk])
+
+    def test_rename_reindexes(self):
+        self.shoe.name = 'Giày Adidas'
+        self.shoe.save()
+        self.assertEqual(search_product_ids('nike'), [])
+        self.assertEqual(search_product_ids('adidas'), [self.shoe.pk])
+
+        self.category.name = 'Dép'
+        self.category.save()
+        self.assertEqual(search_product_ids('bong'), [])
+        self.assertEqual(search_product_ids('dep'), [self.shoe.pk])
+
+    def test_delete_removes_from_index(self):
+        shoe_id = self.shoe.pk
+        self.shoe.delete()
+        self.assertNotIn(shoe_id, search_product_ids('giay'))
+
+
+class KeysetCursorTests(TestCase):
+    """Con trỏ phân trang do client gửi lên: con trỏ hỏng / bị sửa quay về trang đầu, không lỗi 500."""
+
+    def setUp(self):
+        category = Category.objects.create(name='Giày')
+        Product.objects.bulk_create([
+            Product(name=f'Giày {i}', price=100000 + i * 1000, stock=1, category=category) for i in range(30)
+        ])
+
+    def token(self, value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+    def test_cursor_round_trip(self):
+        first = keyset_paginate(Product.objects.all(), 'price_asc', None, per_page=12)
+        second = keyset_paginate(Product.objects.all(), 'price_asc', first.next_cursor, per_page=12)
+        self.assertTrue(second.has_previous())
+        self.assertGreater(second.object_list[0].price, first.object_list[-1].price)
+        self.assertEqual(decode_cursor('price_asc', encode_cursor('price_asc', first.object_list[-1])),
+                         (first.object_list[-1].price, first.object_list[-1].id))
+
+    def test_invalid_cursors_are_ignored(self):
+        product = Product.objects.first()
+        tampered = [
+            '!!!',                                                 # không phải base64
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),        # không phải UTF-8 / JSON
+            self.token({'sort': 'price_asc'}),                     # sai cấu trúc
+            encode_cursor('price_desc', product),                  # con trỏ của kiểu sắp xếp khác
+            self.token(['price_asc', 'NaN', 1]),
+            self.token(['price_asc', 'Infinity', 1]),
+            self.token(['price_asc', '1e999999', 1]),
+            self.token(['price_asc', '100000', 10 ** 30]),
+            self.token(['price_asc', '100000', -5]),
+            self.token(['price_asc', [1], 1]),
+        ]
+        for token in tampered:
+            with self.subTest(token=token):
+                self.assertIsNone(decode_cursor('price_asc', token))
+                page = keyset_paginate(Product.objects.all(), 'price_asc', token, per_page=12)
+                self.assertFalse(page.has_previous())
+                self.assertEqual(len(page), 12)
+
+    def test_home_with_tampered_cursor(self):
+        token = self.token(['price_asc', 'NaN', 1])
+        response = self.client.get(reverse('home'), {'pagination': 'cursor', 'sort': 'price_asc', 'cursor': token})
+        self.assertEqual(response.status_code, 200)
+
+
+class StockReservationTests(TestCase):
+    """Giữ hàng cho đơn chờ QR: giữ, thay bằng đơn mới, dọn giữ chỗ hết hạn."""
+
+    def setUp(self):
+        category = Category.objects.create(name='Giày')
+        self.product = Product.objects.create(name='Giày chạy bộ', price=500000, stock=3, category=category)
+
+    def lines(self, quantity):
+        return [{'product': self.product, 'quantity': quantity}]
+
+    def test_hold_blocks_other_buyers(self):
+        reserve_stock('DH000001', self.lines(2))
+        self.assertEqual(held_quantities([self.product.pk]), {self.product.pk: 2})
+        with self.assertRaises(OutOfStockError):
+            reserve_stock('DH000002', self.lines(2))
+        with self.assertRaises(OutOfStockError):
+            place_order({**ORDER_DATA, 'total_price': 1000000, 'order_code': 'DH000003'}, self.lines(2))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3) # Giữ chỗ không trừ kho
+
+    def test_order_consumes_its_own_hold(self):
+        reserve_stock('DH000001', self.lines(3))
+        place_order({**ORDER_DATA, 'total_price': 1500000, 'order_code': 'DH000001'},
+                    self.lines(3), reservation_key='DH000001')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_replace_previous_hold(self):
+        reserve_stock('DH000001', self.lines(3))
+        # Khách checkout lại: giữ chỗ cũ được bỏ trước khi tính, nên vẫn giữ được đủ 3
+        reserve_stock('DH000002', self.lines(3), replaces='DH000001')
+        self.assertEqual(
+            list(StockReservation.objects.values_list('reservation_key', 'quantity')), [('DH000002', 3)]
+        )
+
+    def test_key_in_use_by_another_hold(self):
+        reserve_stock('DH000001', self.lines(1))
+        with self.assertRaises(ReservationKeyInUseError):
+            reserve_stock('DH000001', self.lines(1))
+
+    def test_expired_holds_are_ignored_and_reaped(self):
+        reserve_stock('DH000001', self.lines(3))
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(held_quantities([self.product.pk]), {})
+        reserve_stock('DH000002', self.lines(3)) # Phần hàng của giữ chỗ hết hạn bán được lại
+
+        self.assertEqual(release_expired_reservations(batch_size=1), 1)
+        self.assertEqual(list(StockReservation.objects.values_list('reservation_key', flat=True)), ['DH000002'])
+
+
+calls = []
+
+
+@job('test_record')
+def record_call(value):
+    calls.append(value)
+
+
+@job('test_always_fails')
+def always_fails():
+    raise RuntimeError('Máy chủ email không phản hồi')
+
+
+class JobQueueTests(TestCase):
+    """Hàng đợi job nền: xếp hàng không trùng, thử lại có backoff, dừng sau max_attempts."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_is_idempotent(self):
+        enqueue('test_record', {'value': 1}, idempotency_key='record:1')
+        enqueue('test_record', {'value': 1}, idempotency_key='record:1')
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual(run_pending_jobs(), (1, 0))
+        # Đã chạy xong: xếp hàng lại cùng khóa cũng không chạy lần nữa
+        enqueue('test_record', {'value': 1}, idempotency_key='record:1')
+        self.assertEqual(run_pending_jobs(), (0, 0))
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.objects.get().status, 'done')
+
+    def test_unknown_job_is_rejected(self):
+        with self.assertRaises(UnknownJobError):
+            enqueue('khong_ton_tai')
+
+    def test_retry_with_backoff_then_fail(self):
+        enqueue('test_always_fails', max_attempts=2)
+
+        before = timezone.now()
+        with self.assertLogs('store.jobs', 'WARNING'):
+            self.assertEqual(run_pending_jobs(), (0, 1))
+        job_row = Job.objects.get()
+        self.assertEqual((job_row.status, job_row.attempts), ('queued', 1))
+        self.assertIn('Máy chủ email không phản hồi', job_row.last_error)
+        self.assertGreaterEqual(job_row.run_at, before + JOB_BACKOFF_BASE)
+        # Chưa tới giờ thử lại
+        self.assertEqual(run_pending_jobs(), (0, 0))
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('store.jobs', 'ERROR'):
+            self.assertEqual(run_pending_jobs(), (0, 1))
+        job_row.refresh_from_db()
+        self.assertEqual((job_row.status, job_row.attempts), ('failed', 2))
+        self.assertIsNotNone(job_row.finished_at)
+        self.assertEqual(run_pending_jobs(), (0, 0))
+
+    def test_reclaimed_notification_job_does_not_duplicate(self):
+        user = User.objects.create_user('khachhang', 'khach@example.com', 'Matkhau-an-toan-123')
+        order = Order.objects.create(user=user, total_price=500000, **ORDER_DATA)
+        order.status = 'Đang giao'
+        order.save()
+        self.assertEqual(run_pending_jobs(), (2, 0))
+
+        # Worker bị coi là đã chết: cả 2 job được nhận lại và chạy lần nữa
+        Job.objects.update(status='running', locked_at=timezone.now() - JOB_LOCK_TIMEOUT * 2)
+        self.assertEqual(run_pending_jobs(), (2, 0))
+        self.assertEqual(
+            sorted(Notification.objects.filter(user=user).values_list('idempotency_key', flat=True)),
+            [f'order-created:{order.pk}', f'order-status:{order.pk}:Đang giao'],
+        )
+
+
+class OrderPageCacheTests(TestCase):
+    """Đặt hàng chỉ xóa trang của sản phẩm đã mua; hết hàng mới đổi catalog version."""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Giày')
+        self.product = Product.objects.create(name='Giày chạy bộ', price=500000, stock=3, category=category)
+        self.url = reverse('product_detail', args=[self.product.pk])
+
+    def buy(self, quantity):
+        place_order({**ORDER_DATA, 'total_price': 500000 * quantity}, [{'product': self.product, 'quantity': quantity}])
+
+    def test_order_refreshes_only_product_page(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'HIT')
+        version = get_catalog_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buy(1)
+        self.assertEqual(get_catalog_version(), version)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Số lượng còn lại: 2')
+
+    def test_sold_out_bumps_catalog_version(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buy(3)
+        self.assertNotEqual(get_catalog_version(), version)
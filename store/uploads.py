@@ -0,0 +1,106 @@
+# store/uploads.py
+# Lưu ảnh người dùng tải lên (ảnh minh chứng chuyển khoản, avatar) theo đường dẫn băm nội dung.
+#
+# Trong request chỉ làm các việc không phụ thuộc kích thước ảnh:
+# - Django đã nhận file theo từng chunk (file lớn nằm trong file tạm, không đọc hết vào RAM),
+# - đọc header ảnh để từ chối file không phải ảnh,
+# - băm SHA-256 theo chunk -> tên file "<thư mục>/<2 ký tự đầu>/<hash>.jpg": cùng một ảnh
+#   tải lên nhiều lần chỉ được lưu (và xử lý) 1 lần,
+# - chuyển file tạm vào storage (FileSystemStorage đổi tên file, không chép lại).
+# Việc nặng (giải mã, thu nhỏ, nén lại JPEG) là job nền 'process_image' (store/jobs.py),
+# ghi đè đúng tên đó.
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .jobs import enqueue, job
+
+# Cạnh dài tối đa (px) sau khi thu nhỏ, theo thư mục lưu
+MAX_DIMENSIONS = {
+    'payment_proofs': 2000, # Vẫn đọc rõ chữ trong ảnh chụp màn hình ngân hàng
+    'avatars': 512,
+}
+JPEG_QUALITY = 85
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class InvalidUploadError(Exception):
+    """File tải lên không phải ảnh hợp lệ hoặc quá lớn."""
+
+
+def content_hash(uploaded_file):
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hashed_name(folder, digest):
+    return f'{folder}/{digest[:2]}/{digest}.jpg'
+
+
+def store_image_upload(uploaded_file, folder):
+    """
+    Lưu ảnh tải lên vào thư mục folder ('payment_proofs', 'avatars') và trả về tên file
+    trong storage, dùng để gán thẳng cho ImageField (không ghi file lần nữa khi save model).
+    Ném InvalidUploadError nếu file không phải ảnh.
+    """
+    if uploaded_file.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+        raise InvalidUploadError("Ảnh quá lớn, vui lòng chọn ảnh khác.")
+    try:
+        # Chỉ đọc header (kích thước, định dạng); cũng chặn ảnh "bom giải nén"
+        with Image.open(uploaded_file):
+            pass
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise InvalidUploadError("Tệp tải lên không phải là ảnh hợp lệ.")
+
+    name = hashed_name(folder, content_hash(uploaded_file))
+    if default_storage.exists(name):
+        return name # Ảnh đã có (đã hoặc đang được xử lý)
+
+    name = default_storage.save(name, uploaded_file)
+    enqueue(
+        'process_image',
+        {'name': name, 'max_dimension': MAX_DIMENSIONS.get(folder, max(MAX_DIMENSIONS.values()))},
+        idempotency_key=f'process_image:{name}',
+    )
+    return name
+
+
+@job('process_image')
+def process_image(name, max_dimension):
+    """Xoay theo EXIF, thu nhỏ về max_dimension, nén lại JPEG và ghi đè file name."""
+    with default_storage.open(name) as source, Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode != 'RGB':
+            # Ảnh PNG trong suốt: đặt lên nền trắng thay vì nền đen
+            background = Image.new('RGB', image.size, 'white')
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        output = BytesIO()
+        image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    _replace(name, output.getvalue())
+
+
+def _replace(name, data):
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        # Storage không có đường dẫn cục bộ (S3...): xóa rồi ghi lại
+        default_storage.delete(name)
+        default_storage.save(name, ContentFile(data))
+        return
+    # Ghi file tạm cùng thư mục rồi đổi tên: người đang xem ảnh không bao giờ thấy file dở dang
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(data)
+    os.chmod(tmp_path, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+    os.replace(tmp_path, path)
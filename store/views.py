@@ -3,15 +3,28 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Avg # Import Avg để tính trung bình
+from django.db.models import F, QuerySet, ExpressionWrapper, FloatField
+from django.db.models.functions import NullIf
 from django.core.paginator import Paginator
-from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.urls import reverse
+from django.conf import settings
 import random
 import string
 
 # Import từ project của bạn
-from .models import Product, Category, Order, OrderItem, Voucher, Review, Cart, CartItem, UserProfile
+from .models import Product, Review, Cart, CartItem
+from .cart import refresh_cart_summary, clear_cart_summary, load_cart_lines
+from .orders import place_order, reserve_stock, OutOfStockError, ReservationKeyInUseError
+from .vouchers import get_voucher, VoucherUnavailableError
+from .search import search_product_ids, search_filter, RankedProductList
+from .pagination import keyset_paginate, KEYSET_ORDERINGS
+from .featured import get_featured_products
+from .eligibility import get_review_eligibility
+from .instrumentation import query_budget
+from .page_cache import cache_anonymous_page, get_catalog_version, grid_cache_key
+from .catalog_cache import get_categories
+from .uploads import store_image_upload, InvalidUploadError
 
 # Hàm hỗ trợ sinh mã đơn hàng ngẫu nhiên (VD: 839201)
 def generate_order_code():
@@ -21,41 +34,67 @@ def generate_order_code():
 # -----------------------------------------------------------------------------
 # GĐ 19: Home (Tìm kiếm, Lọc, Sắp xếp, Phân trang)
 # -----------------------------------------------------------------------------
+@query_budget(13)
+@cache_anonymous_page
 def home(request):
-    all_categories = Category.objects.all()
+    all_categories = get_categories()
     search_query = request.GET.get('q')
     category_id = request.GET.get('category')
-    sort_by = request.GET.get('sort', '-id') # Mặc định mới nhất
+    # Khi tìm kiếm, mặc định sắp xếp theo mức độ liên quan
+    sort_by = request.GET.get('sort', 'relevance' if search_query else '-id')
 
     products = Product.objects.all().order_by('-id') # Bắt đầu với tất cả, sắp xếp mặc định
 
-    # Lọc theo tìm kiếm
-    if search_query:
-        # Chỉ tìm kiếm trong tên sản phẩm
-        products = products.filter(name__icontains=search_query)
-
     # Lọc theo danh mục
     if category_id:
         products = products.filter(category__id=category_id)
 
-    # Sắp xếp (Chỉ sắp xếp nếu products là QuerySet, nếu là list thì sort bằng python)
-    if not isinstance(products, list):
-        if sort_by in ['price_asc', 'price_desc', '-id']:
+    # Lọc theo tìm kiếm (index toàn văn: tên, mô tả, danh mục; không phân biệt dấu)
+    if search_query:
+        if sort_by in ['price_asc', 'price_desc', '-id', 'rating']:
+            # Lọc bằng subquery trên index: sắp xếp trên toàn bộ kết quả khớp
+            products = products.filter(search_filter(search_query, category_id=category_id))
+        else:
+            # Giữ nguyên thứ tự xếp hạng, chỉ nạp sản phẩm của trang hiện tại
+            products = RankedProductList(search_product_ids(search_query, category_id=category_id))
+
+    # Sắp xếp (Chỉ sắp xếp nếu products là QuerySet, nếu là danh sách xếp hạng thì giữ nguyên)
+    if isinstance(products, QuerySet):
+        if sort_by in ['price_asc', 'price_desc', '-id', 'rating']:
             if sort_by == 'price_asc':
                 products = products.order_by('price')
             elif sort_by == 'price_desc':
                 products = products.order_by('-price')
+            elif sort_by == 'rating':
+                # Điểm trung bình tính từ cột phi chuẩn hóa, không cần aggregate Review
+                products = products.annotate(
+                    avg_rating=ExpressionWrapper(
+                        F('rating_sum') * 1.0 / NullIf(F('review_count'), 0),
+                        output_field=FloatField(),
+                    )
+                ).order_by(F('avg_rating').desc(nulls_last=True), '-review_count', '-id')
             # else: đã order_by('-id') ở trên rồi
 
 
     # Phân trang
     query_params = request.GET.copy()
     if 'page' in query_params: del query_params['page']
+    if 'cursor' in query_params: del query_params['cursor']
     query_string = query_params.urlencode()
 
-    paginator = Paginator(products, 12) # 12 sản phẩm/trang
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Chế độ con trỏ (keyset): bật qua ?pagination=cursor hoặc settings.CATALOG_PAGINATION
+    pagination_mode = request.GET.get('pagination', settings.CATALOG_PAGINATION)
+    is_cursor_page = (
+        pagination_mode == 'cursor'
+        and isinstance(products, QuerySet)
+        and sort_by in KEYSET_ORDERINGS
+    )
+    if is_cursor_page:
+        page_obj = keyset_paginate(products, sort_by, request.GET.get('cursor'), per_page=12)
+    else:
+        paginator = Paginator(products, 12) # 12 sản phẩm/trang
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
 
     context = {
         'page_obj': page_obj,
@@ -63,17 +102,24 @@ def home(request):
         'search_query': search_query,
         'current_category_id': int(category_id) if category_id else None,
         'query_string': query_string,
-        'current_sort': sort_by
+        'current_sort': sort_by,
+        'is_cursor_page': is_cursor_page,
+        # Khóa cache fragment lưới sản phẩm (hết hạn khi catalog đổi version)
+        'catalog_version': get_catalog_version(),
+        'grid_cache_key': grid_cache_key(request),
     }
     return render(request, 'store/home.html', context)
 
 # -----------------------------------------------------------------------------
 # GĐ 21 (Sửa đổi logic GET và POST): Trang Chi tiết Sản phẩm
 # -----------------------------------------------------------------------------
+@query_budget(13)
+@cache_anonymous_page
 def product_detail(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    reviews = product.reviews.all()
-    average_rating = reviews.aggregate(Avg('rating'))['rating__avg']
+    reviews = product.reviews.select_related('user')
+    # Điểm trung bình lấy từ thống kê lưu sẵn trên Product (không aggregate)
+    average_rating = product.average_rating
 
     # ----- LOGIC KIỂM TRA ĐIỀU KIỆN REVIEW -----
     can_review = False 
@@ -81,17 +127,15 @@ def product_detail(request, product_id):
     review_message = "" 
 
     if request.user.is_authenticated:
+        # Tập sản phẩm đã mua / đã đánh giá của user (đã cache)
+        eligibility = get_review_eligibility(request.user.id)
         # 1. Kiểm tra xem đã review chưa
-        has_reviewed = Review.objects.filter(product=product, user=request.user).exists()
+        has_reviewed = product.id in eligibility['reviewed']
         if has_reviewed:
             review_message = "Bạn đã đánh giá sản phẩm này rồi."
         else:
             # 2. Nếu chưa review, kiểm tra xem đã mua và hoàn thành chưa
-            has_completed_order = Order.objects.filter(
-                user=request.user,
-                status='Hoàn thành',
-                items__product=product
-            ).exists()
+            has_completed_order = product.id in eligibility['purchased']
             if has_completed_order:
                 can_review = True 
             else:
@@ -107,11 +151,8 @@ def product_detail(request, product_id):
              messages.error(request, "Bạn đã đánh giá sản phẩm này rồi.")
              return redirect('product_detail', product_id=product_id)
 
-        # Kiểm tra lại lần cuối (an toàn)
-        can_actually_review = Order.objects.filter(
-            user=request.user, status='Hoàn thành', items__product=product
-        ).exists()
-        if not can_actually_review:
+        # Kiểm tra lại lần cuối (cache được làm mới khi trạng thái đơn thay đổi)
+        if not can_review:
             messages.error(request, "Bạn cần mua và nhận hàng thành công trước khi đánh giá.")
             return redirect('product_detail', product_id=product_id)
 
@@ -144,7 +185,8 @@ def product_detail(request, product_id):
 def add_to_cart(request, product_id):
     if request.method == 'POST' and request.POST.get('action') == 'add_to_cart':
         quantity = int(request.POST.get('quantity', 1))
-        product = get_object_or_404(Product, id=product_id)
+        # Tồn kho dùng để quyết định ghi -> luôn đọc từ DB (chỉ các cột cần thiết)
+        product = get_object_or_404(Product.objects.only('id', 'name', 'stock'), id=product_id)
 
         cart, _ = Cart.objects.get_or_create(user=request.user)
         cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
@@ -173,14 +215,15 @@ def add_to_cart(request, product_id):
                 message_text = f"Sản phẩm '{product.name}' đã đạt giới hạn tồn kho trong giỏ."
                 status = "error"
         
+        # Cập nhật cache tóm tắt giỏ hàng (1 query) để badge header luôn đúng
+        cart_summary = refresh_cart_summary(request.user.id)
+
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            # Tính tổng số lượng item trong giỏ để update badge trên header (nếu cần)
-            total_items = sum(item.quantity for item in cart.cart_items.all())
-            
             return JsonResponse({
                 'status': status,
                 'message': message_text,
-                'cart_count': total_items # Trả về số lượng mới để JS cập nhật header
+                'cart_count': cart_summary['item_count'], # Cùng con số với badge trên header
+                'cart_quantity': cart_summary['total_quantity'],
             })
 
         # --- NẾU KHÔNG PHẢI AJAX (Fallback) ---
@@ -197,55 +240,12 @@ def add_to_cart(request, product_id):
 # -----------------------------------------------------------------------------
 # GĐ 26: Xem Giỏ hàng (Hỗ trợ DB Cart)
 # -----------------------------------------------------------------------------
+@query_budget(11)
 def cart_view(request):
-    detailed_cart_items = []
-    total_price = 0
-
-    if request.user.is_authenticated:
-        # --- Dùng Database ---
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        db_items = cart.cart_items.all()
-        for item in db_items:
-            # Kiểm tra tồn kho thực tế
-            if item.quantity > item.product.stock:
-                item.quantity = item.product.stock
-                item.save()
-                messages.warning(request, f"Số lượng '{item.product.name}' đã được cập nhật do thay đổi tồn kho.")
-            
-            if item.quantity > 0:
-                detailed_cart_items.append({
-                    'product': item.product,
-                    'quantity': item.quantity,
-                    'subtotal': item.subtotal
-                })
-                total_price += item.subtotal
-            else:
-                item.delete()
-    else:
-        # --- Dùng Session ---
-        cart = request.session.get('cart', {})
-        for product_id, quantity in list(cart.items()):
-            try:
-                product = Product.objects.get(id=int(product_id))
-                if quantity > product.stock:
-                    cart[product_id] = product.stock
-                    quantity = product.stock
-                    messages.warning(request, f"Số lượng '{product.name}' đã được cập nhật do thay đổi tồn kho.")
-
-                if quantity > 0:
-                    subtotal = product.price * quantity
-                    detailed_cart_items.append({
-                        'product': product,
-                        'quantity': quantity,
-                        'subtotal': subtotal,
-                    })
-                    total_price += subtotal
-                else:
-                    del cart[product_id]
-            except Product.DoesNotExist:
-                del cart[product_id]
-        
-        request.session['cart'] = cart # Lưu lại session cart nếu có thay đổi
+    # Nạp toàn bộ giỏ (DB hoặc Session) bằng 1 query, tự giảm số lượng vượt tồn kho
+    detailed_cart_items, total_price, adjusted_names = load_cart_lines(request)
+    for product_name in adjusted_names:
+        messages.warning(request, f"Số lượng '{product_name}' đã được cập nhật do thay đổi tồn kho.")
 
     context = {
         'cart_items': detailed_cart_items,
@@ -264,7 +264,8 @@ def update_cart(request, product_id):
         except (ValueError, TypeError):
             quantity = 1
 
-        product = get_object_or_404(Product, id=product_id)
+        # Tồn kho dùng để quyết định ghi -> luôn đọc từ DB (chỉ các cột cần thiết)
+        product = get_object_or_404(Product.objects.only('id', 'name', 'stock'), id=product_id)
         msg = ""
         status = "success"
 
@@ -284,6 +285,7 @@ def update_cart(request, product_id):
                 # Xóa
                 CartItem.objects.filter(cart=cart, product=product).delete()
                 msg = "Đã xóa sản phẩm khỏi giỏ hàng."
+            refresh_cart_summary(request.user.id)
         else:
             # --- Dùng Session ---
             cart = request.session.get('cart', {})
@@ -308,40 +310,12 @@ def update_cart(request, product_id):
 # -----------------------------------------------------------------------------
 # GĐ 26: Checkout (Hỗ trợ DB Cart)
 # -----------------------------------------------------------------------------
+@query_budget(22)
 def checkout(request):
-    detailed_cart_items = []
-    total_price = 0
-    
     # --- Lấy giỏ hàng (DB hoặc Session) ---
-    if request.user.is_authenticated:
-        cart_db, _ = Cart.objects.get_or_create(user=request.user)
-        db_items = cart_db.cart_items.all()
-        if not db_items:
-             return redirect('home')
-        for item in db_items:
-             # Kiểm tra tồn kho
-             if item.quantity > item.product.stock:
-                 item.quantity = item.product.stock
-                 item.save()
-             detailed_cart_items.append({'product': item.product, 'quantity': item.quantity, 'subtotal': item.subtotal})
-             total_price += item.subtotal
-    else:
-        cart_session = request.session.get('cart', {})
-        if not cart_session:
-            return redirect('home')
-        
-        for product_id, quantity in list(cart_session.items()):
-            try:
-                product = Product.objects.get(id=int(product_id))
-                if quantity > product.stock:
-                    cart_session[product_id] = product.stock
-                    quantity = product.stock
-                subtotal = product.price * quantity
-                detailed_cart_items.append({'product': product, 'quantity': quantity, 'subtotal': subtotal})
-                total_price += subtotal
-            except Product.DoesNotExist:
-                del cart_session[product_id]
-        request.session['cart'] = cart_session
+    detailed_cart_items, total_price, _ = load_cart_lines(request)
+    if not detailed_cart_items:
+        return redirect('home')
 
     # 1. Chuẩn bị dữ liệu mặc định (Pre-fill)
     initial_data = {
@@ -365,17 +339,18 @@ def checkout(request):
     voucher = None
     discount_amount = 0
     if voucher_code:
-        try:
-            voucher = Voucher.objects.get(code__iexact=voucher_code)
-            is_valid, message = voucher.is_valid(total_price)
+        # Tra trong chỉ mục voucher trong bộ nhớ (không query)
+        voucher = get_voucher(voucher_code)
+        if voucher is None:
+            del request.session['voucher_code']
+        else:
+            is_valid, message = voucher.is_valid(total_price, request.user)
             if is_valid:
                 discount_amount = voucher.discount_amount
             else:
                 messages.error(request, message)
                 del request.session['voucher_code']
                 voucher = None
-        except Voucher.DoesNotExist:
-            del request.session['voucher_code']
 
     final_price = total_price - discount_amount
 
@@ -398,9 +373,9 @@ def checkout(request):
                 msg = "Vui lòng nhập mã giảm giá."
                 if is_ajax: return JsonResponse({'status': 'error', 'message': msg})
                 messages.error(request, msg); return redirect('checkout')
-            try:
-                voucher_to_apply = Voucher.objects.get(code__iexact=code_from_form)
-                is_valid, message = voucher_to_apply.is_valid(total_price)
+            voucher_to_apply = get_voucher(code_from_form)
+            if voucher_to_apply is not None:
+                is_valid, message = voucher_to_apply.is_valid(total_price, request.user)
                 if is_valid:
                     request.session['voucher_code'] = voucher_to_apply.code
                     msg = f"Đã áp dụng mã '{voucher_to_apply.code}'."
@@ -410,7 +385,7 @@ def checkout(request):
                 else:
                     if is_ajax: return JsonResponse({'status': 'error', 'message': message})
                     messages.error(request, message)
-            except Voucher.DoesNotExist: 
+            else: 
                 msg = "Mã giảm giá không tồn tại."
                 if is_ajax: return JsonResponse({'status': 'error', 'message': msg})
                 messages.error(request, msg)
@@ -441,14 +416,20 @@ def checkout(request):
 
             # --- LOGIC MỚI: TÁCH LUỒNG COD VÀ QR ---
             if payment_method == 'qr':
-                # 1. Kiểm tra tồn kho trước (nhưng chưa trừ)
-                for item_data in detailed_cart_items:
-                    if item_data['product'].stock < item_data['quantity']:
-                        msg = f"Sản phẩm '{item_data['product'].name}' không đủ số lượng."
-                        if is_ajax: return JsonResponse({'status': 'error', 'message': msg})
-                        messages.error(request, msg); return redirect('cart_view')
-                
-                
+                # 1. Giữ hàng trong lúc khách chuyển khoản (chưa trừ kho). Hết hàng thì báo ngay tại đây.
+                previous_order = request.session.get('pending_order') or {}
+                try:
+                    while True:
+                        try:
+                            reserved_until = reserve_stock(new_order_code, detailed_cart_items, replaces=previous_order.get('order_code'))
+                            break
+                        except ReservationKeyInUseError:
+                            new_order_code = generate_order_code() # Mã trùng với đơn chờ khác: sinh mã mới
+                except OutOfStockError as e:
+                    msg = str(e)
+                    if is_ajax: return JsonResponse({'status': 'error', 'message': msg})
+                    messages.error(request, msg); return redirect('cart_view')
+
                 # Lưu ý: Decimal không lưu được vào session JSON, cần chuyển sang float/str
                 request.session['pending_order'] = {
                     'full_name': full_name,
@@ -459,7 +440,8 @@ def checkout(request):
                     'discount_amount': float(discount_amount),
                     'voucher_code': voucher.code if voucher else None,
                     'payment_method': 'qr',
-                    'order_code': new_order_code  # Lưu mã đơn hàng vào session
+                    'order_code': new_order_code,  # Lưu mã đơn hàng vào session (cũng là mã giữ hàng)
+                    'reserved_until': reserved_until.isoformat(),
                 }
                 
                 msg = "Vui lòng thực hiện thanh toán."
@@ -480,33 +462,24 @@ def checkout(request):
                 }
                 if request.user.is_authenticated: order_data['user'] = request.user
 
+                # Khách đã bắt đầu checkout QR rồi đổi sang COD: hàng đang giữ cho đơn chờ đó là
+                # của chính khách, được dùng cho đơn này và bỏ giữ chỗ sau khi trừ kho
+                pending_order_code = (request.session.get('pending_order') or {}).get('order_code')
+
                 try:
-                    new_order = Order.objects.create(**order_data)
-
-                    for item_data in detailed_cart_items:
-                        product = item_data['product']
-                        quantity = item_data['quantity']
-                        product.refresh_from_db() # Lấy tồn kho mới nhất
-                        if product.stock < quantity:
-                            new_order.delete() # Rollback
-                            msg = f"Sản phẩm '{product.name}' vừa hết hàng."
-                            if is_ajax: return JsonResponse({'status': 'error', 'message': msg})
-                            messages.error(request, msg); return redirect('cart_view')
-                        
-                        OrderItem.objects.create(
-                            order=new_order, product=product, quantity=quantity, price_at_purchase=product.price
-                        )
-                        product.stock -= quantity
-                        product.save()
+                    # Tạo đơn + trừ kho trong 1 transaction (tự rollback nếu hết hàng)
+                    place_order(order_data, detailed_cart_items, reservation_key=pending_order_code)
 
                     # Xóa giỏ hàng và session
                     if request.user.is_authenticated:
                         Cart.objects.filter(user=request.user).delete()
+                        clear_cart_summary(request.user.id)
                     else:
                         del request.session['cart']
                     
                     if 'voucher_code' in request.session: del request.session['voucher_code']
                     if 'checkout_form_data' in request.session: del request.session['checkout_form_data']
+                    if 'pending_order' in request.session: del request.session['pending_order']
 
                     msg = "Đặt hàng thành công!"
                     success_url = reverse('order_success')
@@ -515,8 +488,19 @@ def checkout(request):
                         return JsonResponse({'status': 'success', 'message': msg, 'redirect_url': success_url})
                     return redirect(success_url)
 
+                except OutOfStockError as e:
+                    msg = str(e)
+                    if is_ajax: return JsonResponse({'status': 'error', 'message': msg})
+                    messages.error(request, msg); return redirect('cart_view')
+
+                except VoucherUnavailableError as e:
+                    # Mã vừa hết lượt: bỏ mã khỏi session để khách đặt lại không dùng mã
+                    if 'voucher_code' in request.session: del request.session['voucher_code']
+                    msg = str(e)
+                    if is_ajax: return JsonResponse({'status': 'error', 'message': msg, 'redirect_url': ''})
+                    messages.error(request, msg); return redirect('checkout')
+
                 except Exception as e:
-                    if 'new_order' in locals(): new_order.delete()
                     msg = f"Đã xảy ra lỗi: {str(e)}"
                     if is_ajax: return JsonResponse({'status': 'error', 'message': msg})
                     messages.error(request, msg)
@@ -535,6 +519,7 @@ def checkout(request):
 # -----------------------------------------------------------------------------
 # GĐ 27: Thông tin Chuyển khoản
 # -----------------------------------------------------------------------------
+@query_budget(22)
 def payment_info(request, order_code):
     # 1. Lấy thông tin từ Session
     pending_order = request.session.get('pending_order')
@@ -556,94 +541,68 @@ def payment_info(request, order_code):
             self.final_price = self.total_price - self.discount_amount
             self.full_name = data['full_name']
             self.order_code = data.get('order_code') # Lấy mã từ session để hiển thị
+            self.reserved_until = parse_datetime(data['reserved_until']) if data.get('reserved_until') else None
             self.items = [] # Khởi tạo danh sách items
     
     display_order = TempOrder(pending_order)
     
     # Lấy danh sách sản phẩm để hiển thị (vì chưa tạo OrderItem trong DB)
-    if request.user.is_authenticated:
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        display_order.items = cart.cart_items.all()
-    else:
-        cart_session = request.session.get('cart', {})
-        items_list = []
-        for p_id, qty in cart_session.items():
-            try:
-                product = Product.objects.get(id=int(p_id))
-                items_list.append({'product': product, 'quantity': qty})
-            except Product.DoesNotExist:
-                pass
-        display_order.items = items_list
+    # Không giảm số lượng theo tồn kho ở đây: tổng tiền đã chốt trong pending_order
+    cart_lines, _, _ = load_cart_lines(request, clamp_to_stock=False)
+    display_order.items = cart_lines
 
     if request.method == 'POST':
         if 'payment_proof' in request.FILES:
-            proof_image = request.FILES['payment_proof']
-            
+            # Lưu ảnh trước, ngoài transaction đặt hàng (thu nhỏ/nén ảnh chạy nền)
+            try:
+                proof_image = store_image_upload(request.FILES['payment_proof'], 'payment_proofs')
+            except InvalidUploadError as e:
+                messages.error(request, str(e))
+                return redirect('payment_info', order_code=order_code)
+
             # --- BẮT ĐẦU TẠO ĐƠN HÀNG THỰC TẾ ---
             try:
-                # 1. Lấy lại Voucher nếu có
-                voucher = None
-                if pending_order['voucher_code']:
-                    try:
-                        voucher = Voucher.objects.get(code=pending_order['voucher_code'])
-                    except Voucher.DoesNotExist:
-                        pass
-
-                # 2. Tạo Order
-                order = Order.objects.create(
-                    user=request.user if request.user.is_authenticated else None,
-                    full_name=pending_order['full_name'],
-                    email=pending_order['email'],
-                    phone=pending_order['phone'],
-                    address=pending_order['address'],
-                    total_price=pending_order['total_price'],
-                    discount_amount=pending_order['discount_amount'],
-                    voucher=voucher,
-                    payment_method='qr',
-                    order_code=pending_order['order_code'], # Lưu mã từ session vào DB
-                    status='Mới', # Hoặc 'Đang xử lý' tùy bạn
-                    payment_proof=proof_image,
-                    note=f"Mã thanh toán: {pending_order.get('order_code')}" 
-                )
-
-                # 3. Tạo OrderItem và Trừ tồn kho (Lấy lại từ Cart hiện tại)
-                # Lưu ý: Cần lấy lại Cart vì Cart chưa bị xóa ở bước Checkout
+                try:
+                    # 1. Lấy lại Voucher nếu có. Mã đã bị xóa từ lúc checkout thì không được giữ
+                    # giảm giá đã tính trong pending_order
+                    voucher = None
+                    if pending_order['voucher_code']:
+                        voucher = get_voucher(pending_order['voucher_code'])
+                        if voucher is None:
+                            raise VoucherUnavailableError("Mã giảm giá không còn hiệu lực.")
+
+                    # 2. Tạo Order, OrderItem và trừ tồn kho trong 1 transaction
+                    # Lưu ý: Lấy các dòng từ Cart hiện tại vì Cart chưa bị xóa ở bước Checkout
+                    place_order({
+                        'user': request.user if request.user.is_authenticated else None,
+                        'full_name': pending_order['full_name'],
+                        'email': pending_order['email'],
+                        'phone': pending_order['phone'],
+                        'address': pending_order['address'],
+                        'total_price': pending_order['total_price'],
+                        'discount_amount': pending_order['discount_amount'],
+                        'voucher': voucher,
+                        'payment_method': 'qr',
+                        'order_code': pending_order['order_code'], # Lưu mã từ session vào DB
+                        'status': 'Mới', # Hoặc 'Đang xử lý' tùy bạn
+                        'payment_proof': proof_image,
+                        'note': f"Mã thanh toán: {pending_order.get('order_code')}",
+                    }, cart_lines, reservation_key=pending_order['order_code'])
+                except OutOfStockError as e:
+                    messages.error(request, str(e))
+                    return redirect('cart_view')
+                except VoucherUnavailableError as e:
+                    # Tổng tiền trong pending_order đã trừ voucher -> quay lại checkout để tính lại
+                    if 'voucher_code' in request.session: del request.session['voucher_code']
+                    messages.error(request, str(e))
+                    return redirect('checkout')
+
+                # 3. Xóa giỏ hàng
                 if request.user.is_authenticated:
-                    cart = Cart.objects.get(user=request.user)
-                    cart_items = cart.cart_items.all()
-                    
-                    for item in cart_items:
-                        # Kiểm tra tồn kho lần cuối
-                        if item.product.stock < item.quantity:
-                            order.delete() # Rollback
-                            messages.error(request, f"Sản phẩm {item.product.name} vừa hết hàng.")
-                            return redirect('cart_view')
-
-                        OrderItem.objects.create(
-                            order=order, product=item.product, quantity=item.quantity, price_at_purchase=item.product.price
-                        )
-                        item.product.stock -= item.quantity
-                        item.product.save()
-                    
                     # Xóa Cart DB
-                    cart.cart_items.all().delete()
-                
+                    CartItem.objects.filter(cart__user=request.user).delete()
+                    clear_cart_summary(request.user.id)
                 else:
-                    # Xử lý cho Session Cart (Guest)
-                    cart_session = request.session.get('cart', {})
-                    for p_id, qty in cart_session.items():
-                        product = Product.objects.get(id=int(p_id))
-                        if product.stock < qty:
-                            order.delete()
-                            messages.error(request, f"Sản phẩm {product.name} vừa hết hàng.")
-                            return redirect('cart_view')
-                            
-                        OrderItem.objects.create(
-                            order=order, product=product, quantity=qty, price_at_purchase=product.price
-                        )
-                        product.stock -= qty
-                        product.save()
-                    
                     del request.session['cart']
 
                 # 4. Dọn dẹp session
@@ -671,8 +630,11 @@ def order_success(request):
 # -----------------------------------------------------------------------------
 # GĐ 0: Trang Giới thiệu
 # -----------------------------------------------------------------------------
+@query_budget(11)
+@cache_anonymous_page
 def landing_page(request):
-    featured_products = Product.objects.all().order_by('?')[:5]
+    # Lấy mẫu từ kho sản phẩm nổi bật đã cache (không query catalog)
+    featured_products = get_featured_products()
     context = {
         'featured_products': featured_products
     }
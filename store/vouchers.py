@@ -0,0 +1,101 @@
+# store/vouchers.py
+# Tra cứu voucher từ chỉ mục trong bộ nhớ tiến trình (không query khi kiểm tra mã ở checkout)
+# và trừ lượt sử dụng nguyên tử khi đặt hàng.
+#
+# - Chỉ mục {CODE viết hoa: Voucher} được nạp 1 lần cho mỗi tiến trình và nạp lại khi
+#   "phiên bản" trong cache thay đổi (signal của Voucher, sau mỗi lượt dùng của mã có giới hạn).
+# - Cache mặc định (LocMemCache) là riêng của từng tiến trình: thay đổi ở tiến trình khác
+#   (admin, worker khác) không đổi phiên bản ở đây, nên chỉ mục còn được nạp lại sau
+#   VOUCHER_INDEX_TTL giây.
+# - used_count trong chỉ mục chỉ dùng để báo sớm "hết lượt"; giới hạn thật sự được kiểm tra
+#   bằng UPDATE có điều kiện trong redeem_voucher(), nên không thể dùng quá giới hạn kể cả
+#   khi nhiều đơn cùng đặt một lúc.
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Voucher, VoucherUsage
+
+VOUCHER_INDEX_VERSION_KEY = 'vouchers:version'
+# Tuổi tối đa (giây) của chỉ mục trong 1 tiến trình, kể cả khi phiên bản không đổi
+VOUCHER_INDEX_TTL = 30
+
+_index = {}
+_index_version = None
+_index_loaded_at = 0.0
+_index_lock = threading.Lock()
+
+
+class VoucherUnavailableError(Exception):
+    """Voucher hết hạn, bị tắt hoặc không còn lượt dùng (tổng hoặc theo user) tại thời điểm đặt hàng."""
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+def bump_voucher_index():
+    cache.set(VOUCHER_INDEX_VERSION_KEY, time.time_ns(), None)
+
+
+def _current_version():
+    return cache.get_or_set(VOUCHER_INDEX_VERSION_KEY, time.time_ns, None)
+
+
+def get_voucher(code):
+    """Voucher theo mã (không phân biệt hoa thường), hoặc None. Không query khi chỉ mục còn mới."""
+    global _index, _index_version, _index_loaded_at
+    version = _current_version()
+    if version != _index_version or time.monotonic() - _index_loaded_at > VOUCHER_INDEX_TTL:
+        with _index_lock:
+            if version != _index_version or time.monotonic() - _index_loaded_at > VOUCHER_INDEX_TTL:
+                _index = {normalize_code(voucher.code): voucher for voucher in Voucher.objects.all()}
+                _index_version = version
+                _index_loaded_at = time.monotonic()
+    return _index.get(normalize_code(code))
+
+
+def redeem_voucher(voucher, user_id=None):
+    """
+    Trừ 1 lượt dùng của voucher (và của user nếu có). Gọi bên trong transaction đặt hàng:
+    nếu voucher đã hết hạn / bị tắt / hết lượt thì ném VoucherUnavailableError để cả đơn hàng
+    được rollback. Các điều kiện được kiểm tra lại trên dòng mới nhất trong DB, không tin chỉ mục.
+    """
+    if voucher.usage_limit_per_user is not None and not user_id:
+        # Khách vãng lai không có tài khoản để đếm lượt: không cho dùng mã giới hạn theo user
+        raise VoucherUnavailableError("Vui lòng đăng nhập để dùng mã giảm giá này.")
+
+    now = timezone.now()
+    updated = Voucher.objects.filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit')),
+        pk=voucher.pk, is_active=True, valid_from__lte=now, valid_to__gte=now,
+    ).update(used_count=F('used_count') + 1)
+    if not updated:
+        bump_voucher_index() # Chỉ mục đang giữ dữ liệu cũ -> nạp lại để báo sớm ở checkout
+        raise VoucherUnavailableError("Mã giảm giá này đã hết hạn hoặc hết lượt sử dụng.")
+    if voucher.usage_limit is not None:
+        # used_count trong chỉ mục đã cũ: nạp lại để lượt cuối cùng được báo "hết lượt" ngay
+        transaction.on_commit(bump_voucher_index)
+
+    if user_id:
+        VoucherUsage.objects.bulk_create(
+            [VoucherUsage(voucher_id=voucher.pk, user_id=user_id)], ignore_conflicts=True
+        )
+        usage = VoucherUsage.objects.filter(voucher_id=voucher.pk, user_id=user_id)
+        if voucher.usage_limit_per_user is not None:
+            usage = usage.filter(used_count__lt=voucher.usage_limit_per_user)
+        if not usage.update(used_count=F('used_count') + 1):
+            raise VoucherUnavailableError("Bạn đã dùng hết số lượt của mã giảm giá này.")
+
+
+@receiver(post_save, sender=Voucher)
+@receiver(post_delete, sender=Voucher)
+def invalidate_voucher_index(sender, raw=False, **kwargs):
+    if not raw:
+        bump_voucher_index()
@@ -0,0 +1,32 @@
+# users/adapter.py
+# Adapter cho allauth: email (xác nhận địa chỉ email, đặt lại mật khẩu...) được render trong
+# request nhưng gửi qua job nền 'send_email', nên request không phải chờ SMTP.
+from allauth.account.adapter import DefaultAccountAdapter
+from django.contrib.sites.shortcuts import get_current_site
+from django.utils.html import strip_tags
+
+from store.jobs import enqueue
+
+
+class AccountAdapter(DefaultAccountAdapter):
+    def send_mail(self, template_prefix, email, context):
+        # Giống DefaultAccountAdapter.send_mail, chỉ khác ở bước gửi
+        ctx = {
+            'request': self.request,
+            'email': email,
+            'current_site': get_current_site(self.request),
+        }
+        ctx.update(context)
+        msg = self.render_mail(template_prefix, email, ctx)
+
+        html = None
+        body = msg.body
+        if msg.content_subtype == 'html':
+            html, body = msg.body, strip_tags(msg.body)
+        for content, mimetype in getattr(msg, 'alternatives', []):
+            if mimetype == 'text/html':
+                html = content
+        enqueue('send_email', {
+            'subject': msg.subject, 'body': body, 'html': html,
+            'from_email': msg.from_email, 'to': msg.to,
+        })
@@ -1,3 +1,47 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from store.models import UserProfile
+
+
+class ProfileLifecycleTests(TestCase):
+    """Profile được tạo đúng 1 lần; đăng nhập / đăng ký không ghi UserProfile thừa."""
+
+    password = 'Matkhau-an-toan-123'
+
+    def setUp(self):
+        self.user = User.objects.create_user('khachhang', 'khach@example.com', self.password)
+
+    def test_profile_created_once(self):
+        self.assertEqual(UserProfile.objects.filter(user=self.user).count(), 1)
+        self.user.first_name = 'Khach'
+        self.user.save()
+        self.assertEqual(UserProfile.objects.filter(user=self.user).count(), 1)
+
+    def test_user_save_does_not_touch_profile(self):
+        # Chỉ 1 UPDATE auth_user, không SELECT/UPDATE store_userprofile
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=['last_login'])
+
+    def test_login_query_count(self):
+        # Tìm user, tạo session mới, cập nhật last_login, ghi session (kèm SAVEPOINT của TestCase).
+        # Không có query nào tới store_userprofile.
+        with self.assertNumQueries(9):
+            response = self.client.post(reverse('login'), {
+                'username': 'khachhang',
+                'password': self.password,
+            })
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_register_query_count(self):
+        # Kiểm tra trùng username/email, tạo User + UserProfile (1 INSERT), đăng nhập như trên
+        with self.assertNumQueries(13):
+            response = self.client.post(reverse('register'), {
+                'username': 'khachmoi',
+                'email': 'moi@example.com',
+                'password1': self.password,
+                'password2': self.password,
+            })
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(UserProfile.objects.filter(user__username='khachmoi').count(), 1)
@@ -3,48 +3,38 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.decorators.cache import never_cache 
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db.models import Count, F
+from django.utils import timezone
 
 from django.contrib import messages
 from django.shortcuts import redirect
 from allauth.account.models import EmailAddress
-# Import thêm Cart, CartItem, Product để xử lý gộp giỏ hàng
-from store.models import Order, OrderItem, Review, Cart, CartItem, Product, UserProfile, Notification
+from store.models import Order, UserProfile, Notification
+from store.cart import merge_session_cart
+from store.notifications import invalidate_notification_cache, get_unread_count
+from store.realtime import event_stream, user_channel
+from store.eligibility import get_review_eligibility
+from store.instrumentation import query_budget
+from store.jobs import enqueue
+from store.uploads import store_image_upload, InvalidUploadError
 from users.templates.users.forms import VietnameseAuthenticationForm, VietnameseUserCreationForm
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 
 # --- HÀM PHỤ TRỢ: Gộp giỏ hàng Session vào Database ---
 def merge_cart_from_session(request, user):
     session_cart = request.session.get('cart', {})
     
     if session_cart:
-        # Lấy hoặc tạo giỏ hàng DB cho user
-        user_cart, created = Cart.objects.get_or_create(user=user)
-        
-        for product_id_str, quantity in session_cart.items():
-            try:
-                product = Product.objects.get(id=int(product_id_str))
-                
-                # Kiểm tra xem sản phẩm đã có trong giỏ DB chưa
-                cart_item, created = CartItem.objects.get_or_create(cart=user_cart, product=product)
-                
-                if created:
-                    cart_item.quantity = quantity
-                else:
-                    cart_item.quantity += quantity # Nếu có rồi thì cộng dồn
-                
-                # Kiểm tra không vượt quá tồn kho
-                if cart_item.quantity > product.stock:
-                    cart_item.quantity = product.stock
-                
-                cart_item.save()
-            except Product.DoesNotExist:
-                continue
+        # Gộp toàn bộ giỏ bằng số query cố định (xem store.cart.merge_session_cart)
+        merge_session_cart(user, session_cart)
             
         # Xóa giỏ hàng session sau khi đã chuyển xong
         request.session['cart'] = {}
@@ -66,6 +56,7 @@ def register_view(request):
     return render(request, 'users/register.html', {'form': form})
 
 # --- Views Đăng nhập (Đã nâng cấp gộp giỏ hàng) ---
+@query_budget(24)
 def login_view(request):
     if request.method == 'POST':
         form = VietnameseAuthenticationForm(request, data=request.POST)
@@ -102,26 +93,40 @@ def logout_view(request):
     return redirect('landing_page')
 
 # --- View Lịch sử Đơn hàng ---
+ORDER_HISTORY_PAGE_SIZE = 20
+
 @login_required
+@query_budget(11)
 def order_history_view(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    context = {'orders': orders}
+    # Chỉ nạp 1 trang; số sản phẩm và số tiền phải trả tính sẵn bằng SQL
+    orders = (
+        Order.objects.filter(user=request.user)
+        .only('id', 'order_code', 'created_at', 'status', 'total_price', 'discount_amount')
+        .annotate(
+            item_count=Count('items'),
+            payable_price=F('total_price') - F('discount_amount'),
+        )
+        .order_by('-created_at', '-id')
+    )
+    paginator = Paginator(orders, ORDER_HISTORY_PAGE_SIZE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {'orders': page_obj, 'page_obj': page_obj}
     return render(request, 'users/order_history.html', context)
 
 # --- View Chi tiết Đơn hàng ---
 @login_required
+@query_budget(11)
 def order_detail_view(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
-    order_items = order.items.all()
+    # Nạp sản phẩm cùng lúc với các dòng (không query item.product từng dòng trong template)
+    order_items = list(order.items.select_related('product').order_by('id'))
 
     item_review_status = {}
     if order.status == 'Hoàn thành':
+        # Tra cứu trong tập sản phẩm đã đánh giá (đã cache) thay vì 1 query mỗi dòng
+        reviewed_ids = get_review_eligibility(request.user.id)['reviewed']
         for item in order_items:
-            has_reviewed = Review.objects.filter(
-                product=item.product,
-                user=request.user
-            ).exists()
-            item_review_status[item.id] = has_reviewed
+            item_review_status[item.id] = item.product_id in reviewed_ids
 
     context = {
         'order': order,
@@ -135,7 +140,7 @@ def profile_view(request):
     user = request.user
     # Đảm bảo profile tồn tại
     if not hasattr(user, 'userprofile'):
-        UserProfile.objects.create(user=user)
+        user.userprofile = UserProfile.objects.create(user=user)
 
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -144,20 +149,35 @@ def profile_view(request):
             full_name = request.POST.get('full_name')
             phone = request.POST.get('phone')
             avatar = request.FILES.get('avatar')
+            avatar_name = None
+            if avatar:
+                # Kiểm tra + lưu ảnh trước khi ghi gì vào DB (thu nhỏ/nén ảnh chạy nền)
+                try:
+                    avatar_name = store_image_upload(avatar, 'avatars')
+                except InvalidUploadError as e:
+                    messages.error(request, str(e))
+                    return redirect('profile')
 
+            # Chỉ ghi các cột thực sự thay đổi (update_fields), không lưu gì nếu không đổi
             if full_name:
                 names = full_name.strip().split(' ', 1)
-                user.first_name = names[0]
-                user.last_name = names[1] if len(names) > 1 else ''
-                user.save()
+                first_name, last_name = names[0], names[1] if len(names) > 1 else ''
+                if (user.first_name, user.last_name) != (first_name, last_name):
+                    user.first_name, user.last_name = first_name, last_name
+                    user.save(update_fields=['first_name', 'last_name'])
 
-            if phone:
-                user.userprofile.phone_number = phone
+            profile = user.userprofile
+            changed_fields = []
+            if phone and phone != profile.phone_number:
+                profile.phone_number = phone
+                changed_fields.append('phone_number')
             
-            if avatar:
-                user.userprofile.avatar = avatar
+            if avatar_name and avatar_name != profile.avatar.name:
+                profile.avatar = avatar_name
+                changed_fields.append('avatar')
             
-            user.userprofile.save()
+            if changed_fields:
+                profile.save(update_fields=changed_fields)
             messages.success(request, 'Cập nhật hồ sơ thành công!')
             
         elif action == 'verify_email':
@@ -169,11 +189,12 @@ def profile_view(request):
             message = f'Chào {user.username},\n\nVui lòng nhấp vào link sau để xác minh email của bạn:\n{verify_link}'
             from_email = settings.EMAIL_HOST_USER
             
-            try:
-                send_mail(subject, message, from_email, [user.email])
-                messages.info(request, f'Đã gửi email xác minh tới {user.email}. Vui lòng kiểm tra hộp thư.')
-            except Exception as e:
-                messages.error(request, 'Lỗi gửi mail. Vui lòng thử lại sau.')
+            # Gửi qua job nền (không chờ SMTP trong request). Bấm gửi nhiều lần trong
+            # cùng 1 phút chỉ tạo 1 email nhờ idempotency_key.
+            enqueue('send_email', {
+                'subject': subject, 'body': message, 'from_email': from_email, 'to': [user.email],
+            }, idempotency_key=f'verify-email:{user.pk}:{timezone.now():%Y%m%d%H%M}')
+            messages.info(request, f'Đã gửi email xác minh tới {user.email}. Vui lòng kiểm tra hộp thư.')
 
         return redirect('profile')
 
@@ -188,8 +209,10 @@ def verify_email_confirm(request, uidb64, token):
         user = None
 
     if user is not None and default_token_generator.check_token(user, token):
-        user.userprofile.is_email_verified = True
-        user.userprofile.save()
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+        if not profile.is_email_verified:
+            profile.is_email_verified = True
+            profile.save(update_fields=['is_email_verified'])
         
         # Tạo thông báo xác minh thành công
         Notification.objects.create(
@@ -209,10 +232,10 @@ def verify_email_confirm(request, uidb64, token):
 def get_notification_detail(request, notification_id):
     notification = get_object_or_404(Notification, id=notification_id, user=request.user)
     
-    # Đánh dấu là đã đọc
+    # Đánh dấu là đã đọc (update trực tiếp, rồi làm mới cache header của user)
     if not notification.is_read:
-        notification.is_read = True
-        notification.save()
+        Notification.objects.filter(pk=notification.pk).update(is_read=True)
+        invalidate_notification_cache(request.user.id)
     
     return JsonResponse({
         'title': notification.title,
@@ -220,6 +243,24 @@ def get_notification_detail(request, notification_id):
         'created_at': notification.created_at.strftime('%H:%M %d/%m/%Y')
     })
 
+# --- SSE: Đẩy thông báo mới + số chưa đọc tới header (chỉ khi chạy qua ASGI) ---
+async def notification_stream(request):
+    # Dưới WSGI mỗi kết nối giữ 1 thread: trả 204 để EventSource dừng, không kết nối lại
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=204)
+
+    unread_count = await sync_to_async(get_unread_count)(user.id)
+    response = StreamingHttpResponse(
+        event_stream(user_channel(user.id), [('unread', {'count': unread_count})]),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # Nginx: không gom buffer, gửi ngay từng sự kiện
+    return response
+
 def send_verification_email(request):
     if request.user.is_authenticated:
         # Lấy bản ghi EmailAddress của user hiện tại